@@ -0,0 +1,235 @@
+"""
+Batch webhook processing
+Runs many Dialogflow webhook payloads in one request: independent sessions
+run concurrently, turns of the same session run in submission order
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from fast_json import dumps, loads, turn_from_payload
+from tracing import tracer
+from schemas import DialogflowTurn
+from tenants import Tenant, TenantRegistry, use_tenant
+
+
+# handler(turn, db, menu_cache) -> response body
+TurnHandler = Callable[[DialogflowTurn, Session, Dict[str, Any]], Dict[str, Any]]
+# rate_check(turn) -> None if the turn is within budget, else seconds to wait
+RateCheck = Callable[[DialogflowTurn], Optional[float]]
+
+_END = object()
+
+
+def session_key(turn: DialogflowTurn) -> str:
+    """Session ID used to order turns (same rule as the webhook handler)"""
+    session_path = turn.session or 'default-session'
+    return session_path.split('/')[-1]
+
+
+async def iter_batch_payloads(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    Yield decoded payloads from a JSON array or an NDJSON stream
+    NDJSON lines are yielded as soon as they arrive, so only the line being
+    read is buffered; a JSON array is decoded once complete. A line that is
+    not valid JSON is yielded as the ValueError raised while decoding it
+    """
+    buffer = b""
+    is_array = None
+
+    async for chunk in chunks:
+        buffer += chunk
+        if is_array is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            is_array = stripped.startswith(b"[")
+        if is_array:
+            continue
+
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _decode_line(line)
+
+    if is_array:
+        try:
+            items = loads(buffer)
+        except ValueError as e:
+            yield e
+            return
+        for item in items:
+            yield item
+    elif buffer.strip():
+        yield _decode_line(buffer)
+
+
+def _decode_line(line: bytes) -> Any:
+    try:
+        return loads(line)
+    except ValueError as e:
+        return e
+
+
+class WebhookBatch:
+    """
+    Schedules the turns of one batch
+    At most max_concurrency turns run at once. DB sessions are pooled per
+    tenant across the batch (at most max_concurrency open in total) and
+    menu lookups are memoized per tenant for the whole batch. Every payload
+    is charged to the rate limit like a single webhook turn; a throttled
+    one gets throttled_text as its fulfillment
+    """
+
+    def __init__(self, handler: TurnHandler, tenants: TenantRegistry,
+                 max_concurrency: int = 8, max_items: int = 1000,
+                 rate_check: Optional[RateCheck] = None, throttled_text: str = ""):
+        self._handler = handler
+        self._tenants = tenants
+        self._rate_check = rate_check
+        self._throttled_text = throttled_text
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_items = max_items
+        self._slots = asyncio.Semaphore(self._max_concurrency)
+        self._idle_sessions: Dict[str, List[Session]] = {}
+        self._all_sessions: List[Session] = []
+        self._last_turn: Dict[str, asyncio.Task] = {}
+        self._submitted = 0
+        self.menu_caches: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, item: Any) -> asyncio.Task:
+        """Schedule one payload and return the task producing its result line"""
+        index = self._submitted
+        self._submitted += 1
+
+        if self._submitted > self._max_items:
+            return self._done({"index": index, "error": f"Batch limit of {self._max_items} payloads exceeded"})
+        if isinstance(item, Exception):
+            return self._done({"index": index, "error": f"Invalid JSON: {item}"})
+        try:
+            turn = turn_from_payload(item)
+        except ValidationError as e:
+            return self._done({"index": index, "error": f"Invalid webhook request: {e.errors(include_url=False)}"})
+        if self._rate_check is not None and self._rate_check(turn) is not None:
+            return self._done({"index": index, "fulfillmentText": self._throttled_text})
+
+        tenant = self._tenants.resolve(turn.session)
+        key = f"{tenant.name}/{session_key(turn)}"
+        previous = self._last_turn.get(key)
+        task = asyncio.ensure_future(self._run_turn(index, turn, tenant, previous))
+        self._last_turn[key] = task
+        return task
+
+    async def _run_turn(self, index: int, turn: DialogflowTurn, tenant: Tenant,
+                        previous: Optional[asyncio.Task]) -> Dict[str, Any]:
+        if previous is not None:
+            # Keep turns of the same session in order; failures were already reported
+            await asyncio.wait([previous])
+
+        async with self._slots:
+            db = self._checkout_session(tenant)
+            try:
+                with tracer.trace("POST /webhook/batch turn", index=index, intent=turn.intent, tenant=tenant.name), \
+                        use_tenant(tenant):
+                    menu_cache = self.menu_caches.setdefault(tenant.name, {})
+                    result = await run_in_threadpool(self._handler, turn, db, menu_cache)
+                return {"index": index, **result}
+            except Exception as e:
+                print(f"Error processing batch item {index}: {str(e)}")
+                db.rollback()
+                return {"index": index, "fulfillmentText": "Sorry, something went wrong. Please try again."}
+            finally:
+                self._idle_sessions.setdefault(tenant.name, []).append(db)
+
+    def _checkout_session(self, tenant: Tenant) -> Session:
+        """An idle session of the tenant, or a new one (called holding a slot)"""
+        idle = self._idle_sessions.get(tenant.name)
+        if idle:
+            return idle.pop()
+        if len(self._all_sessions) >= self._max_concurrency:
+            # The other slots hold sessions of other tenants, so one of them is idle
+            for sessions in self._idle_sessions.values():
+                if sessions:
+                    recycled = sessions.pop()
+                    recycled.close()
+                    self._all_sessions.remove(recycled)
+                    break
+        db = tenant.session()
+        self._all_sessions.append(db)
+        return db
+
+    @staticmethod
+    def _done(result: Dict[str, Any]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        return future
+
+    def close(self):
+        """Close every DB session opened for the batch"""
+        for db in self._all_sessions:
+            db.close()
+        self._all_sessions.clear()
+
+
+class BatchStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose results are produced while the request body is
+    still being read
+    Starlette's disconnect listener would take body messages off the same
+    receive channel, so it is not started; a client that goes away shows up
+    as ClientDisconnect from request.stream() instead
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+async def stream_batch_results(payloads: AsyncIterator[Any], batch: WebhookBatch) -> AsyncIterator[bytes]:
+    """
+    Feed payloads into the batch and yield NDJSON result lines in input order
+    Results are emitted while later payloads are still being read
+    """
+    pending: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for item in payloads:
+                pending.put_nowait(batch.submit(item))
+        finally:
+            pending.put_nowait(_END)
+
+    producer = asyncio.ensure_future(produce())
+    remaining = []
+    try:
+        while True:
+            task = await pending.get()
+            if task is _END:
+                break
+            remaining = [task]
+            # Shielded so a disconnect does not cancel a turn mid-transaction
+            result = await asyncio.shield(task)
+            remaining = []
+            yield dumps(result) + b"\n"
+        await producer
+    finally:
+        # Client went away or input failed: stop reading, but let turns that
+        # were already scheduled settle before their DB sessions are closed
+        producer.cancel()
+        while not pending.empty():
+            task = pending.get_nowait()
+            if task is not _END:
+                remaining.append(task)
+        if remaining:
+            await asyncio.gather(*remaining, return_exceptions=True)
+        batch.close()
@@ -0,0 +1,129 @@
+"""
+Microbenchmark: read-only menu and order lookups
+Runs against a throwaway SQLite database seeded with the sample menu and
+compares the precompiled Core selects in order_service with the previous
+ORM queries (entity loading, identity map, two round trips for tracking)
+
+Usage:
+  python benchmarks/bench_menu_lookups.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_db_dir, "bench.db")
+
+from database import SessionLocal, init_db  # noqa: E402
+from init_db import build_sample_menu  # noqa: E402
+from models import MenuItem, Order, OrderItem, OrderStatus  # noqa: E402
+import order_service  # noqa: E402
+
+
+LOOKUPS = ["Cheese Burger", "cheese burger", "chicken pizza", "Pizza", "Mango Lassi"]
+
+
+def old_find_menu_item_name(db, item_name):
+    """Previous ORM version of order_service.find_menu_item_name"""
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
+    if menu_item and menu_item.is_available:
+        return menu_item.item_name
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name.ilike(item_name)).first()
+    if menu_item and menu_item.is_available:
+        return menu_item.item_name
+    words = item_name.lower().split()
+    if len(words) > 1:
+        for item in db.query(MenuItem).filter(MenuItem.is_available == 1).all():
+            if all(word in item.item_name.lower() for word in words):
+                return item.item_name
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name.ilike(f"%{item_name}%")).first()
+    if menu_item and menu_item.is_available:
+        return menu_item.item_name
+    return None
+
+
+def old_get_menu_item_price(db, item_name):
+    """Previous ORM version of order_service.get_menu_item_price"""
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
+    if menu_item and menu_item.is_available:
+        return menu_item.price
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name.ilike(item_name)).first()
+    if menu_item and menu_item.is_available:
+        return menu_item.price
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name.ilike(f"%{item_name}%")).first()
+    if menu_item and menu_item.is_available:
+        return menu_item.price
+    return None
+
+
+def old_track_order(db, order_id):
+    """Previous ORM lookup in order_service.track_order"""
+    order = db.query(Order).filter(Order.order_id == order_id).first()
+    if not order:
+        return None
+    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+    item_details = ", ".join([f"{item.item_name} (x{item.quantity})" for item in items])
+    return order.order_status.value, item_details
+
+
+def seed() -> int:
+    init_db()
+    db = SessionLocal()
+    try:
+        db.add_all(build_sample_menu())
+        order = Order(order_status=OrderStatus.PLACED, total_amount=27.97,
+                      items=[OrderItem(item_name="Cheese Burger", quantity=2, price=8.99),
+                             OrderItem(item_name="Cola", quantity=1, price=1.99)])
+        db.add(order)
+        db.commit()
+        return order.order_id
+    finally:
+        db.close()
+
+
+def cpu_per_call(func, iterations: int) -> float:
+    """Process CPU time per call in microseconds, one session per call as in a request"""
+    start = time.process_time()
+    for _ in range(iterations):
+        db = SessionLocal()
+        try:
+            func(db)
+        finally:
+            db.close()
+    return (time.process_time() - start) / iterations * 1_000_000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    order_id = seed()
+
+    db = SessionLocal()
+    try:
+        for name in LOOKUPS:
+            assert order_service.find_menu_item_name(db, name) == old_find_menu_item_name(db, name), name
+            assert order_service.get_menu_item_price(db, name) == old_get_menu_item_price(db, name), name
+        assert "Cheese Burger (x2), Cola (x1)" in order_service.track_order(order_id, db)
+    finally:
+        db.close()
+
+    cases = [
+        ("find_menu_item_name", lambda db: [old_find_menu_item_name(db, n) for n in LOOKUPS],
+         lambda db: [order_service.find_menu_item_name(db, n) for n in LOOKUPS]),
+        ("get_menu_item_price", lambda db: [old_get_menu_item_price(db, n) for n in LOOKUPS],
+         lambda db: [order_service.get_menu_item_price(db, n) for n in LOOKUPS]),
+        ("track_order", lambda db: old_track_order(db, order_id),
+         lambda db: order_service.track_order(order_id, db)),
+    ]
+
+    print(f"{'lookup':<22} {'ORM':>10} {'Core':>10} {'saved':>8}")
+    for name, old, new in cases:
+        old_us = cpu_per_call(old, iterations)
+        new_us = cpu_per_call(new, iterations)
+        print(f"{name:<22} {old_us:>8.1f}us {new_us:>8.1f}us {1 - new_us / old_us:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Microbenchmark: quantity extraction for order utterances
+Checks quantity_parser against the utterance corpus, then times it against
+the previous per-request loop that compiled a regex per number word and
+stopped at the first match
+
+Usage:
+  python benchmarks/bench_quantity_parser.py [iterations]
+"""
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quantity_parser import align_quantities, extract_quantities  # noqa: E402
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quantity_corpus.json")
+
+
+def old_extract(query_text: str):
+    """Previous order.remove logic from main.handle_request"""
+    query_lower = query_text.lower()
+    number_words = {
+        'one': 1, 'a': 1, 'an': 1,
+        'two': 2, 'three': 3, 'four': 4, 'five': 5,
+        'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
+    }
+    actual_quantities = []
+    for word, value in number_words.items():
+        if re.search(r'\b' + word + r'\b', query_lower):
+            actual_quantities.append(value)
+            break
+    digit_matches = re.findall(r'\b\d+\b', query_text)
+    if digit_matches and not actual_quantities:
+        actual_quantities = [int(d) for d in digit_matches]
+    return actual_quantities
+
+
+def check_corpus(corpus) -> int:
+    failures = 0
+    for case in corpus:
+        got = align_quantities(case["text"], case["items"])
+        if got != case["expected"]:
+            failures += 1
+            print(f"✗ {case['text']!r} {case['items']}: expected {case['expected']}, got {got}")
+    print(f"Corpus: {len(corpus) - failures}/{len(corpus)} utterances aligned correctly")
+    return failures
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    failures = check_corpus(corpus)
+
+    old_wrong = sum(1 for case in corpus
+                    if sum(q is not None for q in case["expected"]) > 1
+                    and old_extract(case["text"]) != [q for q in case["expected"] if q is not None])
+    print(f"Old extractor mis-parses {old_wrong} multi-quantity utterances")
+
+    def run_old():
+        for case in corpus:
+            old_extract(case["text"])
+
+    def run_extract():
+        for case in corpus:
+            extract_quantities(case["text"])
+
+    def run_align():
+        for case in corpus:
+            align_quantities(case["text"], case["items"])
+
+    print(f"\n{'path':<34} {'per utterance':>14}")
+    for name, func in [("old per-word re.search loop", run_old),
+                       ("extract_quantities (compiled)", run_extract),
+                       ("align_quantities (extract+align)", run_align)]:
+        seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+        print(f"{name:<34} {seconds / iterations / len(corpus) * 1_000_000:>11.2f} us")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark: webhook payload parsing and response encoding
+Compares the previous paths (stdlib json.loads / full DialogflowRequest
+validation / JSONResponse) with the fast_json path on realistic Dialogflow
+ES WebhookRequest bodies of increasing size. Fails if, with orjson
+installed, pydantic's slim-model parser beats the orjson path at any size
+(parse_webhook_turn uses orjson for every body)
+
+Usage:
+  python benchmarks/bench_webhook_json.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import fast_json  # noqa: E402
+from schemas import DialogflowRequest  # noqa: E402
+
+
+PROJECT = "projects/food-ordering-bot-abcd/agent"
+SESSION = f"{PROJECT}/sessions/3a9c1f52-8e11-4c62-9a6f-0d1e2b3c4d5e"
+
+
+def build_payload(contexts: int, history: int) -> dict:
+    """
+    Dialogflow ES webhook body: the handler fields plus the outputContexts,
+    diagnosticInfo and originalDetectIntentRequest blobs real agents send
+    contexts: number of output contexts, history: integration payload turns
+    """
+    food_items = ["Chicken Biriyani", "Coca Cola"]
+    context_parameters = {
+        "food-item": food_items,
+        "food-item.original": ["chicken biriyani", "coke"],
+        "number": [2.0, 1.0],
+        "number.original": ["two", "one"],
+    }
+    return {
+        "responseId": "7d9f8a6e-1b2c-4d3e-8f9a-0b1c2d3e4f5a-0f2e4a6c",
+        "queryResult": {
+            "queryText": "add two chicken biriyani and one coke",
+            "parameters": {"food-item": food_items, "number": [2.0, 1.0]},
+            "allRequiredParamsPresent": True,
+            "fulfillmentText": "",
+            "fulfillmentMessages": [{"text": {"text": [""]}}],
+            "outputContexts": [
+                {
+                    "name": f"{SESSION}/contexts/ongoing-order-{i}",
+                    "lifespanCount": 5,
+                    "parameters": context_parameters,
+                }
+                for i in range(contexts)
+            ],
+            "intent": {
+                "name": f"{PROJECT}/intents/5f1c2d3e-4a5b-6c7d-8e9f-0a1b2c3d4e5f",
+                "displayName": "order.add - context: ongoing-order",
+            },
+            "intentDetectionConfidence": 0.92,
+            "diagnosticInfo": {
+                "webhook_latency_ms": 212,
+                "alternative_matched_intents": [
+                    {"Id": f"intent-{i}", "Score": 0.1 * (i % 10), "DisplayName": "new.order"}
+                    for i in range(contexts)
+                ],
+                "end_conversation": False,
+            },
+            "languageCode": "en",
+        },
+        "originalDetectIntentRequest": {
+            "source": "DIALOGFLOW_CONSOLE",
+            "version": "2",
+            "payload": {
+                "conversation": {
+                    "conversationId": "3a9c1f52",
+                    "history": [
+                        {
+                            "utteranceId": f"utt-{i}",
+                            "text": "I would like to order something tasty for dinner tonight",
+                            "timestamp": "2024-05-01T18:30:00.000Z",
+                            "annotations": {"tokens": ["I", "would", "like", "to", "order"], "sentiment": 0.3},
+                        }
+                        for i in range(history)
+                    ],
+                },
+                "user": {"locale": "en-US", "userVerificationStatus": "VERIFIED"},
+            },
+        },
+        "session": SESSION,
+    }
+
+
+SIZES = {
+    "minimal": (0, 0),
+    "typical": (4, 5),
+    "large": (20, 60),
+    "huge": (80, 400),
+}
+
+
+def old_root_path(body: bytes) -> bytes:
+    payload = json.loads(body)
+    _ = (payload["queryResult"]["intent"]["displayName"], payload["queryResult"]["parameters"],
+         payload["queryResult"].get("queryText", ""), payload.get("session", ""))
+    return JSONResponse(content={"fulfillmentText": RESPONSE_TEXT}).body
+
+
+def old_webhook_path(body: bytes) -> bytes:
+    request = DialogflowRequest.model_validate(json.loads(body))
+    _ = (request.queryResult.intent.displayName, request.queryResult.parameters, request.session)
+    return JSONResponse(content={"fulfillmentText": RESPONSE_TEXT}).body
+
+
+def fast_path(body: bytes) -> bytes:
+    turn = fast_json.parse_webhook_turn(body)
+    _ = (turn.intent, turn.parameters, turn.queryText, turn.session)
+    return fast_json.fulfillment(RESPONSE_TEXT).body
+
+
+def fast_path_without_orjson(body: bytes) -> bytes:
+    turn = fast_json._SlimWebhookRequest.model_validate_json(body).to_turn()
+    _ = (turn.intent, turn.parameters, turn.queryText, turn.session)
+    return fast_json.FastJSONResponse(
+        json.dumps({"fulfillmentText": RESPONSE_TEXT}, separators=(",", ":")).encode("utf-8")
+    ).body
+
+
+RESPONSE_TEXT = ("Added to your order: Chicken Biriyani: 2, Coca Cola: 1. "
+                 "Would you like to add more items or complete your order?")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    paths = [
+        ("old / (json.loads)", old_root_path),
+        ("old /webhook (pydantic)", old_webhook_path),
+        ("slim model (no orjson)", fast_path_without_orjson),
+        ("fast", fast_path),
+    ]
+    print(f"orjson available: {fast_json.orjson is not None}")
+    slower = []
+    print(f"{'payload':<10} {'bytes':>8}  " + "  ".join(f"{name:>24}" for name, _ in paths))
+    for size_name, (contexts, history) in SIZES.items():
+        body = json.dumps(build_payload(contexts, history)).encode("utf-8")
+        results = []
+        for _, func in paths:
+            func(body)  # Warm up
+            seconds = min(timeit.repeat(lambda: func(body), number=iterations, repeat=3))
+            results.append(seconds / iterations * 1_000_000)
+        print(f"{size_name:<10} {len(body):>8}  " + "  ".join(f"{us:>21.1f} us" for us in results))
+        if fast_json.orjson is not None and results[3] > results[2]:
+            slower.append(size_name)
+
+    if slower:
+        print(f"✗ orjson path slower than the slim pydantic model for: {', '.join(slower)}")
+    sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
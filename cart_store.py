@@ -0,0 +1,206 @@
+"""
+Bounded in-process storage for in-progress carts
+Dict-like map of session ID -> cart with an idle TTL and a maximum number of
+entries (least recently used carts are evicted first). Entries are kept in
+last-access order, so expired carts are always at the front and a sweep
+only touches what it evicts.
+Turns that read-modify-write a cart hold that session's lock
+(session_lock), so two turns of one session never interleave while
+different sessions never wait on each other.
+"""
+import asyncio
+import contextlib
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional
+
+# Why a session's cart was evicted, as reported by consume_expired
+EVICTED_IDLE = "idle"
+EVICTED_CAPACITY = "capacity"
+
+
+class _SessionLock:
+    """Lock of one session; weakly referenced so it lives only while in use"""
+    __slots__ = ("lock", "__weakref__")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+
+class CartStore:
+    """Session carts with idle expiry, an LRU cap and eviction counters"""
+
+    def __init__(self, idle_ttl: float = 1800.0, max_entries: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.RLock()
+        # session_id -> (last_access, cart), least recently used first
+        self._carts: "OrderedDict[str, list]" = OrderedDict()
+        # session_id -> (evicted_at, reason) for evicted carts, so the next turn can say so
+        self._expired: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions_ttl = 0
+        self.evictions_lru = 0
+        # session_id -> lock, for sessions with a turn holding or waiting for it
+        self._session_locks: "weakref.WeakValueDictionary[str, _SessionLock]" = weakref.WeakValueDictionary()
+        self._session_locks_mutex = threading.Lock()
+
+    # ---- dict interface used by order_service ----------------------------
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._carts.get(session_id)
+            if entry is None:
+                return False
+            if self._is_expired(entry, self._clock()):
+                self._evict(session_id, ttl=True)
+                return False
+            return True
+
+    def __getitem__(self, session_id: str) -> Dict:
+        with self._lock:
+            if session_id not in self:
+                raise KeyError(session_id)
+            entry = self._carts[session_id]
+            entry[0] = self._clock()
+            self._carts.move_to_end(session_id)
+            return entry[1]
+
+    def __setitem__(self, session_id: str, cart: Dict):
+        with self._lock:
+            self._carts[session_id] = [self._clock(), cart]
+            self._carts.move_to_end(session_id)
+            self._expired.pop(session_id, None)
+            while self.max_entries > 0 and len(self._carts) > self.max_entries:
+                oldest = next(iter(self._carts))
+                self._evict(oldest, ttl=False)
+
+    def __delitem__(self, session_id: str):
+        with self._lock:
+            del self._carts[session_id]
+
+    def __len__(self) -> int:
+        return len(self._carts)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._carts))
+
+    def get(self, session_id: str, default=None):
+        try:
+            return self[session_id]
+        except KeyError:
+            return default
+
+    def pop(self, session_id: str, default=None):
+        with self._lock:
+            entry = self._carts.pop(session_id, None)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._carts.clear()
+            self._expired.clear()
+
+    # ---- per-session serialization ---------------------------------------
+
+    @contextlib.contextmanager
+    def session_lock(self, session_id: str) -> Iterator[None]:
+        """
+        Hold the session's lock for a whole cart operation
+        Locks are created on demand and dropped once no turn references them,
+        so idle sessions cost nothing and sessions never share a lock
+        """
+        with self._session_locks_mutex:
+            session_lock = self._session_locks.get(session_id)
+            if session_lock is None:
+                session_lock = _SessionLock()
+                self._session_locks[session_id] = session_lock
+        with session_lock.lock:
+            yield
+
+    # ---- expiry ----------------------------------------------------------
+
+    def consume_expired(self, session_id: str) -> Optional[str]:
+        """
+        Why this session's cart was evicted since its last turn (once):
+        EVICTED_IDLE or EVICTED_CAPACITY, or None if it was not
+        """
+        if session_id in self:
+            return None
+        with self._lock:
+            notice = self._expired.pop(session_id, None)
+            return None if notice is None else notice[1]
+
+    def sweep(self, max_items: int = 500) -> int:
+        """
+        Evict up to max_items expired carts from the front of the LRU order
+        Returns how many were evicted; callers loop while it equals max_items
+        """
+        evicted = 0
+        now = self._clock()
+        with self._lock:
+            while evicted < max_items and self._carts:
+                session_id, entry = next(iter(self._carts.items()))
+                if not self._is_expired(entry, now):
+                    break
+                self._evict(session_id, ttl=True)
+                evicted += 1
+
+            # Forget expiry notices nobody came back for
+            while self._expired:
+                session_id, (expired_at, _) = next(iter(self._expired.items()))
+                if now - expired_at <= self.idle_ttl:
+                    break
+                del self._expired[session_id]
+        return evicted
+
+    def _is_expired(self, entry: list, now: float) -> bool:
+        return self.idle_ttl > 0 and now - entry[0] > self.idle_ttl
+
+    def _evict(self, session_id: str, ttl: bool):
+        del self._carts[session_id]
+        self._expired[session_id] = (self._clock(), EVICTED_IDLE if ttl else EVICTED_CAPACITY)
+        self._expired.move_to_end(session_id)
+        if self.max_entries > 0 and len(self._expired) > self.max_entries:
+            self._expired.popitem(last=False)
+        if ttl:
+            self.evictions_ttl += 1
+        else:
+            self.evictions_lru += 1
+
+    # ---- gauges ----------------------------------------------------------
+
+    def approximate_bytes(self) -> int:
+        """Rough deep size of all carts (keys, cart dicts and line dicts)"""
+        with self._lock:
+            carts = list(self._carts.items())
+        total = sys.getsizeof(self._carts)
+        for session_id, (_, cart) in carts:
+            total += sys.getsizeof(session_id) + sys.getsizeof(cart)
+            for item_name, details in cart.items():
+                total += sys.getsizeof(item_name) + sys.getsizeof(details)
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open_carts": len(self._carts),
+            "evictions_ttl": self.evictions_ttl,
+            "evictions_lru": self.evictions_lru,
+            "expired_notices_pending": len(self._expired),
+            "approximate_bytes": self.approximate_bytes(),
+        }
+
+
+async def sweep_forever(store: CartStore, interval: float, batch_size: int = 500):
+    """Background task: evict expired carts in small batches, yielding between them"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            while store.sweep(batch_size) == batch_size:
+                await asyncio.sleep(0)
+        except Exception as e:
+            print(f"Error sweeping carts: {str(e)}")
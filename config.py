@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -11,19 +11,127 @@ class Settings(BaseSettings):
     DB_USER: str = "root"
     DB_PASSWORD: str = ""
     DB_NAME: str = "food_ordering_db"
+    DATABASE_URL: Optional[str] = None   # Full primary URL, overrides the DB_* settings (e.g. sqlite:///primary.db)
+    
+    # Read replicas: comma-separated URLs; read-only queries are spread across them
+    DB_REPLICA_URLS: str = ""
+    REPLICA_RETRY_INTERVAL: float = 30.0   # Seconds an unreachable replica is skipped
+    READ_YOUR_WRITES_SECONDS: float = 5.0  # Reads for a just-written session/order go to the primary
+    
+    # Tenants (restaurant branches) served by this deployment, as
+    # comma-separated name=value pairs. Each tenant has its own database
+    # (a full URL, or a database/schema name on the primary server) with its
+    # own connection pool, menu, carts, kitchen board and ETA statistics.
+    # Requests are mapped to a tenant by the Dialogflow project ID in the
+    # session path; anything unmapped goes to the default database.
+    TENANT_DATABASE_URLS: str = ""   # e.g. downtown=mysql+pymysql://user:pw@db2:3306/downtown
+    TENANT_SCHEMAS: str = ""         # e.g. airport=food_ordering_airport
+    TENANT_AGENTS: str = ""          # Dialogflow project ID -> tenant, e.g. downtown-agent-x1=downtown
     
     # Application settings
     APP_HOST: str = "0.0.0.0"
     APP_PORT: int = 8000
     
+    # Batch webhook settings
+    BATCH_MAX_CONCURRENCY: int = 8   # Sessions processed in parallel (and DB sessions opened)
+    BATCH_MAX_ITEMS: int = 1000      # Payloads accepted per batch request
+    
+    # Request profiling (off by default; the middleware is not installed at all)
+    PROFILING_ENABLED: bool = False
+    PROFILE_SAMPLE_EVERY: int = 0        # Profile one request in N (0 = only on header)
+    PROFILE_HEADER: str = "X-Profile"    # Any non-zero value forces a profile
+    PROFILE_THRESHOLD_MS: float = 500.0  # Sampled requests slower than this are dumped
+    PROFILE_DIR: str = "profiles"
+    PROFILE_MAX_FILES: int = 50
+    
+    # Order placement: "sync" writes in the webhook request, "write_behind"
+    # logs the order locally and inserts it from a background writer; each
+    # worker process logs to ORDER_LOG_PATH with its PID added
+    ORDER_PLACEMENT_MODE: str = "sync"
+    ORDER_LOG_PATH: str = "data/order_log.jsonl"
+    ORDER_ID_BLOCK_SIZE: int = 50        # Order IDs reserved per database round trip
+    ORDER_FLUSH_BATCH_SIZE: int = 100
+    ORDER_FLUSH_INTERVAL: float = 0.5    # Seconds between background flushes
+    
+    # Kitchen dashboard: reload from the database at most this often (seconds)
+    # to pick up status changes made outside the server
+    KITCHEN_RELOAD_INTERVAL: float = 30.0
+    
+    # Staff API: bearer token for PUT /orders/{order_id}/status,
+    # GET /debug/traces (spans carry customer keys and sessions) and the
+    # /debug/memory endpoints (tracemalloc slows every allocation); those
+    # endpoints are disabled while this is empty
+    STAFF_API_TOKEN: str = ""
+    
+    # Order ETAs: smoothing of the per-stage rolling averages, hours of
+    # order history replayed into them on startup, and how often (seconds)
+    # active orders are reconciled with the database to pick up status
+    # changes made outside the server
+    ETA_SMOOTHING: float = 0.1
+    ETA_REPLAY_HOURS: float = 168.0
+    ETA_RECONCILE_INTERVAL: float = 30.0
+    
+    # Add-on suggestions: days of order history counted on startup, and how
+    # many orders must share two items before one is suggested with the other
+    RECOMMEND_HISTORY_DAYS: float = 90.0
+    RECOMMEND_MIN_COUNT: int = 3
+    
+    # Menu: seconds between checks for menu changes made outside the server
+    MENU_REFRESH_INTERVAL: float = 60.0
+    
+    # In-progress carts
+    CART_IDLE_TTL: float = 1800.0       # Seconds of inactivity before a cart expires (0 = never)
+    CART_MAX_ENTRIES: int = 10000       # Least recently used carts are evicted beyond this (0 = unbounded)
+    CART_SWEEP_INTERVAL: float = 30.0   # Seconds between background sweeps
+    CART_SWEEP_BATCH: int = 500         # Carts evicted per sweep step before yielding
+    CART_BYTES_BUDGET: int = 1024       # Expected memory per open cart; checked by tests/test_memory.py
+    
+    # Rate limiting: token buckets per Dialogflow session and per client IP,
+    # with separate budgets for reads and writes (rate 0 = unlimited).
+    # Off by default: Dialogflow calls from a few Google IPs, so per-client
+    # budgets would throttle every customer at once; tune them before enabling
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_SESSION_READ_RATE: float = 2.0     # Tokens per second
+    RATE_LIMIT_SESSION_READ_BURST: int = 20
+    RATE_LIMIT_SESSION_WRITE_RATE: float = 0.2    # e.g. order.complete
+    RATE_LIMIT_SESSION_WRITE_BURST: int = 5
+    RATE_LIMIT_CLIENT_READ_RATE: float = 50.0     # Dialogflow calls from few IPs, so keep these high
+    RATE_LIMIT_CLIENT_READ_BURST: int = 200
+    RATE_LIMIT_CLIENT_WRITE_RATE: float = 10.0
+    RATE_LIMIT_CLIENT_WRITE_BURST: int = 50
+    RATE_LIMIT_MAX_KEYS: int = 100000             # Buckets kept per budget (least recently used dropped)
+    RATE_LIMIT_CLEANUP_INTERVAL: float = 60.0     # Seconds between removals of idle buckets
+    
+    # Request tracing: recent traces are kept in memory for /debug/traces
+    TRACING_ENABLED: bool = True
+    TRACE_BUFFER_SIZE: int = 500     # Traces kept (oldest dropped first)
+    TRACE_EXPORT_PATH: str = ""      # Also append traces here as OTLP/JSON lines (e.g. data/traces.jsonl)
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
     
     @property
     def database_url(self) -> str:
-        """Construct MySQL database URL"""
+        """Construct MySQL database URL (or use DATABASE_URL if set)"""
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+    
+    @property
+    def replica_urls(self) -> List[str]:
+        """Read replica URLs from DB_REPLICA_URLS"""
+        return [url.strip() for url in self.DB_REPLICA_URLS.split(",") if url.strip()]
+
+
+def parse_pairs(value: str) -> Dict[str, str]:
+    """ "a=1,b=2" -> {"a": "1", "b": "2"} (values may contain "=") """
+    pairs = {}
+    for part in value.split(","):
+        name, sep, item = part.partition("=")
+        if sep and name.strip() and item.strip():
+            pairs[name.strip()] = item.strip()
+    return pairs
 
 
 # Global settings instance
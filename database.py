@@ -1,20 +1,143 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy.sql import Select
+from collections import OrderedDict
+from typing import Dict, Generator, List, Optional
+import itertools
+import threading
+import time
 from config import settings
 from models import Base
+from migrations import run_migrations
 
 
-# Create database engine
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,  # Verify connections before using
-    pool_recycle=3600,   # Recycle connections after 1 hour
-    echo=False           # Set to True for SQL query logging
-)
+def make_engine(url: str) -> Engine:
+    """Create an engine with the application's pool settings"""
+    connect_args = {}
+    if url.startswith("sqlite"):
+        # Sessions are used from FastAPI's threadpool
+        connect_args["check_same_thread"] = False
+    return create_engine(
+        url,
+        pool_pre_ping=True,  # Verify connections before using
+        pool_recycle=3600,   # Recycle connections after 1 hour
+        echo=False,          # Set to True for SQL query logging
+        connect_args=connect_args
+    )
+
+
+# Create database engine (primary: all writes)
+engine = make_engine(settings.database_url)
+
+
+class ReplicaPool:
+    """
+    Read replica engines picked round-robin
+    A replica whose connection fails is skipped for REPLICA_RETRY_INTERVAL seconds
+    """
+
+    def __init__(self, engines: List[Engine], retry_interval: float = 30.0):
+        self.engines = engines
+        self.retry_interval = retry_interval
+        self._unhealthy_until = [0.0] * len(engines)
+        self._next = itertools.count()
+        for index, replica in enumerate(engines):
+            event.listen(replica, "handle_error", self._error_listener(index))
+
+    def _error_listener(self, index: int):
+        def on_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_unhealthy(index)
+        return on_error
+
+    def mark_unhealthy(self, index: int):
+        self._unhealthy_until[index] = time.monotonic() + self.retry_interval
+        print(f"Replica {index} unreachable, routing reads elsewhere for {self.retry_interval:.0f}s")
+
+    def pick(self) -> Optional[Engine]:
+        """Next healthy replica, or None if there are none"""
+        if not self.engines:
+            return None
+        now = time.monotonic()
+        start = next(self._next)
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self._unhealthy_until[index] <= now:
+                return self.engines[index]
+        return None
+
+
+replicas = ReplicaPool([make_engine(url) for url in settings.replica_urls],
+                       retry_interval=settings.REPLICA_RETRY_INTERVAL)
+
+
+class RecentWrites:
+    """Keys (customer sessions, order IDs) written in the last window seconds"""
+
+    def __init__(self, window: float = 5.0, max_entries: int = 100000):
+        self.window = window
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._written: "OrderedDict[str, float]" = OrderedDict()
+
+    def mark(self, *keys: str):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._written[key] = now
+                self._written.move_to_end(key)
+            # Oldest first: drop entries that left the window
+            while self._written:
+                key, written_at = next(iter(self._written.items()))
+                if now - written_at <= self.window and len(self._written) <= self.max_entries:
+                    break
+                del self._written[key]
+
+    def contains(self, key: str) -> bool:
+        written_at = self._written.get(key)
+        return written_at is not None and time.monotonic() - written_at <= self.window
+
+
+recent_writes = RecentWrites(settings.READ_YOUR_WRITES_SECONDS)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a read replica and everything else
+    (flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE) to the primary
+    Once a session has written, or was pinned with use_primary(), all its
+    statements go to the primary. A session sticks to one replica.
+    Without replicas configured every statement goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get("primary") or not replicas.engines:
+            return engine
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info["primary"] = True
+            return engine
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = replicas.pick() or engine
+            self.info["replica"] = replica
+        return replica
+
+    def close(self):
+        # Routing decisions last for one unit of work
+        super().close()
+        self.info.pop("primary", None)
+        self.info.pop("replica", None)
+
+
+def use_primary(db: Session) -> Session:
+    """Route every following statement of this session to the primary"""
+    db.info["primary"] = True
+    return db
+
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -29,17 +152,31 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def init_db():
+def pool_connections(bind: Optional[Engine] = None) -> Dict[str, int]:
+    """Connections of an engine's pool (the primary by default) by state (for /metrics)"""
+    pool = (bind or engine).pool
+    counts = {}
+    for state, method in (("size", "size"), ("checked_out", "checkedout"),
+                          ("checked_in", "checkedin"), ("overflow", "overflow")):
+        if hasattr(pool, method):
+            counts[state] = max(0, getattr(pool, method)())
+    return counts
+
+
+def init_db(bind: Optional[Engine] = None):
     """
-    Initialize database - create all tables
+    Initialize database - create all tables and apply pending migrations
+    bind defaults to the primary; tenants pass their own engine
     """
-    Base.metadata.create_all(bind=engine)
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    run_migrations(bind)
     print("Database tables created successfully!")
 
 
-def drop_db():
+def drop_db(bind: Optional[Engine] = None):
     """
     Drop all tables (use with caution!)
     """
-    Base.metadata.drop_all(bind=engine)
+    Base.metadata.drop_all(bind=bind or engine)
     print("All database tables dropped!")
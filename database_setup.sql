@@ -15,8 +15,10 @@ CREATE TABLE orders (
     order_status ENUM('Placed', 'Preparing', 'Out for Delivery', 'Delivered', 'Cancelled') NOT NULL DEFAULT 'Placed',
     order_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     total_amount FLOAT NOT NULL DEFAULT 0.0,
-    INDEX idx_order_status (order_status),
-    INDEX idx_order_date (order_date)
+    customer_key VARCHAR(255) NULL,
+    INDEX idx_order_status_date (order_status, order_date),
+    INDEX idx_order_date (order_date),
+    INDEX idx_order_customer_date (customer_key, order_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ============================================================================
@@ -42,9 +44,46 @@ CREATE TABLE menu_items (
     category VARCHAR(50),
     is_available TINYINT(1) NOT NULL DEFAULT 1,
     INDEX idx_item_name (item_name),
-    INDEX idx_category (category)
+    INDEX idx_category (category),
+    INDEX idx_menu_available_name (is_available, item_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- ============================================================================
+-- Table 4: id_blocks (hi/lo order ID reservations for write-behind placement)
+-- ============================================================================
+CREATE TABLE id_blocks (
+    name VARCHAR(50) PRIMARY KEY,
+    next_value INT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================================
+-- Table 5: order_events (append-only status timeline; orders.order_status is current)
+-- ============================================================================
+CREATE TABLE order_events (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    order_id INT NOT NULL,
+    order_status ENUM('Placed', 'Preparing', 'Out for Delivery', 'Delivered', 'Cancelled') NOT NULL,
+    ts DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (order_id) REFERENCES orders(order_id) ON DELETE CASCADE,
+    INDEX idx_event_order_ts (order_id, ts)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================================
+-- Table 6: schema_migrations (versions applied by migrations.py)
+-- ============================================================================
+-- This script creates the current schema, so every migration is recorded
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO schema_migrations (version, name) VALUES
+(1, 'add_order_customer_key'),
+(2, 'add_hot_path_indexes'),
+(3, 'store_status_values'),
+(4, 'add_order_events');
+
 -- ============================================================================
 -- Insert Sample Menu Items
 -- ============================================================================
@@ -1,34 +1,143 @@
 """
 Database management utilities
 Provides helper functions for database operations
+
+Each command is also available in batch mode: a script file (or stdin)
+with one command per line is run over one engine and session, with one
+JSON line of output per command, optionally all in one transaction.
+`repl` reads commands interactively the same way.
 """
+import json
+import shlex
+import sys
 from sqlalchemy.orm import Session
 from models import Order, OrderItem, MenuItem, OrderStatus
-from database import SessionLocal
-from typing import List, Optional
+from database import SessionLocal, use_primary
+from order_events import append_event, timeline
+from typing import Any, Callable, Dict, IO, Iterable, List, NamedTuple, Optional
 from datetime import datetime
 
 
+class CommandError(Exception):
+    """A command that could not be applied (unknown item or order, invalid input)"""
+
+
+# ---- Commands on a session ----------------------------------------------
+# They flush but don't commit, raise CommandError on bad input and return
+# JSON-friendly results; the functions further down wrap them for the CLI.
+
+def _menu_item(db: Session, item_name: str) -> MenuItem:
+    menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
+    if not menu_item:
+        raise CommandError(f"Menu item '{item_name}' not found")
+    return menu_item
+
+
+def _order(db: Session, order_id: int) -> Order:
+    order = db.query(Order).filter(Order.order_id == order_id).first()
+    if not order:
+        raise CommandError(f"Order {order_id} not found")
+    return order
+
+
+def _parse_status(new_status: str) -> OrderStatus:
+    try:
+        return OrderStatus[new_status.upper().replace(" ", "_")]
+    except KeyError:
+        raise CommandError(f"Invalid status: {new_status}. Valid statuses: {[s.name for s in OrderStatus]}")
+
+
+def menu_item_dict(item: MenuItem) -> Dict[str, Any]:
+    return {"item_id": item.item_id, "item_name": item.item_name, "price": item.price,
+            "category": item.category, "is_available": bool(item.is_available)}
+
+
+def add_menu_item_in(db: Session, item_name: str, price: float, category: str = None) -> Dict[str, Any]:
+    if db.query(MenuItem).filter(MenuItem.item_name == item_name).first():
+        raise CommandError(f"Menu item '{item_name}' already exists")
+    menu_item = MenuItem(item_name=item_name, price=price, category=category, is_available=1)
+    db.add(menu_item)
+    db.flush()
+    return menu_item_dict(menu_item)
+
+
+def update_menu_item_price_in(db: Session, item_name: str, new_price: float) -> Dict[str, Any]:
+    menu_item = _menu_item(db, item_name)
+    old_price = menu_item.price
+    menu_item.price = new_price
+    db.flush()
+    return {"item_name": item_name, "old_price": old_price, "price": new_price}
+
+
+def toggle_menu_item_in(db: Session, item_name: str) -> Dict[str, Any]:
+    menu_item = _menu_item(db, item_name)
+    menu_item.is_available = 1 if menu_item.is_available == 0 else 0
+    db.flush()
+    return {"item_name": item_name, "is_available": bool(menu_item.is_available)}
+
+
+def menu_items_in(db: Session, category: str = None) -> List[Dict[str, Any]]:
+    query = db.query(MenuItem)
+    if category:
+        query = query.filter(MenuItem.category == category)
+    return [menu_item_dict(item) for item in query.all()]
+
+
+def order_details_in(db: Session, order_id: int) -> Dict[str, Any]:
+    order = _order(db, order_id)
+    return {
+        "order_id": order.order_id,
+        "order_status": order.order_status.value,
+        "order_date": order.order_date.isoformat(),
+        "total_amount": order.total_amount,
+        "items": [{"item_name": item.item_name, "quantity": item.quantity, "price": item.price}
+                  for item in order.items],
+        "timeline": [{"order_status": status.value, "ts": ts.isoformat()} for status, ts in timeline(db, order_id)],
+    }
+
+
+def update_order_status_in(db: Session, order_id: int, new_status: str) -> Dict[str, Any]:
+    status_enum = _parse_status(new_status)
+    order = _order(db, order_id)
+    old_status = order.order_status.value
+    order.order_status = status_enum
+    append_event(db, order_id, status_enum)
+    db.flush()
+    return {"order_id": order_id, "old_status": old_status, "order_status": status_enum.value}
+
+
+def recent_orders_in(db: Session, limit: int = 10) -> List[Dict[str, Any]]:
+    orders = db.query(Order).order_by(Order.order_date.desc()).limit(limit).all()
+    return [{"order_id": order.order_id, "order_status": order.order_status.value,
+             "total_amount": order.total_amount, "order_date": order.order_date.isoformat()}
+            for order in orders]
+
+
+def sales_summary_in(db: Session) -> Dict[str, Any]:
+    total_orders = db.query(Order).count()
+    total_revenue = sum(row[0] for row in db.query(Order).with_entities(Order.total_amount).all())
+    return {
+        "total_orders": total_orders,
+        "total_revenue": total_revenue,
+        "average_order": total_revenue / total_orders if total_orders > 0 else 0,
+        "orders_by_status": {status.value: db.query(Order).filter(Order.order_status == status).count()
+                             for status in OrderStatus},
+    }
+
+
+# ---- CLI functions (one session each, human-readable output) -------------
+
 def add_menu_item(item_name: str, price: float, category: str = None) -> bool:
     """Add a new menu item"""
     db = SessionLocal()
     try:
-        # Check if item already exists
-        existing = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
-        if existing:
-            print(f"Menu item '{item_name}' already exists")
-            return False
-        
-        menu_item = MenuItem(
-            item_name=item_name,
-            price=price,
-            category=category,
-            is_available=1
-        )
-        db.add(menu_item)
+        add_menu_item_in(db, item_name, price, category)
         db.commit()
         print(f"✓ Added menu item: {item_name} - ${price}")
         return True
+    except CommandError as e:
+        print(str(e))
+        return False
     except Exception as e:
         print(f"Error adding menu item: {str(e)}")
         db.rollback()
@@ -41,16 +150,13 @@ def update_menu_item_price(item_name: str, new_price: float) -> bool:
     """Update price of a menu item"""
     db = SessionLocal()
     try:
-        menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
-        if not menu_item:
-            print(f"Menu item '{item_name}' not found")
-            return False
-        
-        old_price = menu_item.price
-        menu_item.price = new_price
+        result = update_menu_item_price_in(db, item_name, new_price)
         db.commit()
-        print(f"✓ Updated {item_name}: ${old_price} → ${new_price}")
+        print(f"✓ Updated {item_name}: ${result['old_price']} → ${new_price}")
         return True
+    except CommandError as e:
+        print(str(e))
+        return False
     except Exception as e:
         print(f"Error updating menu item: {str(e)}")
         db.rollback()
@@ -63,16 +169,14 @@ def toggle_menu_item_availability(item_name: str) -> bool:
     """Toggle availability of a menu item"""
     db = SessionLocal()
     try:
-        menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
-        if not menu_item:
-            print(f"Menu item '{item_name}' not found")
-            return False
-        
-        menu_item.is_available = 1 if menu_item.is_available == 0 else 0
-        status = "available" if menu_item.is_available == 1 else "unavailable"
+        result = toggle_menu_item_in(db, item_name)
         db.commit()
+        status = "available" if result["is_available"] else "unavailable"
         print(f"✓ {item_name} is now {status}")
         return True
+    except CommandError as e:
+        print(str(e))
+        return False
     except Exception as e:
         print(f"Error toggling availability: {str(e)}")
         db.rollback()
@@ -128,6 +232,10 @@ def get_order_details(order_id: int) -> Optional[Order]:
         for item in order.items:
             print(f"  - {item.item_name:<30} x{item.quantity}  ${item.price * item.quantity:.2f}")
         
+        print("\nTimeline:")
+        for status, ts in timeline(db, order_id):
+            print(f"  {ts}  {status.value}")
+        
         print(f"{'='*60}\n")
         
         return order
@@ -139,25 +247,13 @@ def update_order_status(order_id: int, new_status: str) -> bool:
     """Update the status of an order"""
     db = SessionLocal()
     try:
-        order = db.query(Order).filter(Order.order_id == order_id).first()
-        
-        if not order:
-            print(f"Order {order_id} not found")
-            return False
-        
-        # Convert string to OrderStatus enum
-        try:
-            status_enum = OrderStatus[new_status.upper().replace(" ", "_")]
-        except KeyError:
-            print(f"Invalid status: {new_status}")
-            print(f"Valid statuses: {[s.name for s in OrderStatus]}")
-            return False
-        
-        old_status = order.order_status.value
-        order.order_status = status_enum
+        result = update_order_status_in(db, order_id, new_status)
         db.commit()
-        print(f"✓ Order {order_id} status: {old_status} → {status_enum.value}")
+        print(f"✓ Order {order_id} status: {result['old_status']} → {result['order_status']}")
         return True
+    except CommandError as e:
+        print(str(e))
+        return False
     except Exception as e:
         print(f"Error updating order status: {str(e)}")
         db.rollback()
@@ -192,32 +288,195 @@ def get_sales_summary():
     """Get sales summary statistics"""
     db = SessionLocal()
     try:
-        total_orders = db.query(Order).count()
-        total_revenue = db.query(Order).with_entities(Order.total_amount).all()
-        total_revenue = sum(order[0] for order in total_revenue)
+        summary = sales_summary_in(db)
+        total_revenue = summary["total_revenue"]
         
         print(f"\n{'='*60}")
         print(f"Sales Summary")
         print(f"{'='*60}")
-        print(f"Total Orders:    {total_orders}")
+        print(f"Total Orders:    {summary['total_orders']}")
         print(f"Total Revenue:   ${total_revenue:.2f}")
-        print(f"Average Order:   ${total_revenue/total_orders if total_orders > 0 else 0:.2f}")
+        print(f"Average Order:   ${summary['average_order']:.2f}")
         print(f"{'='*60}\n")
         
         # Orders by status
         print("Orders by Status:")
-        for status in OrderStatus:
-            count = db.query(Order).filter(Order.order_status == status).count()
-            print(f"  {status.value:<20} {count}")
+        for status, count in summary["orders_by_status"].items():
+            print(f"  {status:<20} {count}")
         
         print(f"{'='*60}\n")
     finally:
         db.close()
 
 
+# ---- Batch and REPL mode --------------------------------------------------
+
+class Command(NamedTuple):
+    run: Callable[..., Any]
+    usage: str
+    min_args: int
+    max_args: int
+
+
+def _int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError(f"Not a whole number: {value}")
+
+
+def _float(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        raise CommandError(f"Not a number: {value}")
+
+
+COMMANDS: Dict[str, Command] = {
+    "list_menu": Command(lambda db, category=None: menu_items_in(db, category), "[category]", 0, 1),
+    "add_item": Command(lambda db, name, price, category=None: add_menu_item_in(db, name, _float(price), category),
+                        "<name> <price> [category]", 2, 3),
+    "update_price": Command(lambda db, name, price: update_menu_item_price_in(db, name, _float(price)),
+                            "<name> <new_price>", 2, 2),
+    "toggle_item": Command(toggle_menu_item_in, "<name>", 1, 1),
+    "get_order": Command(lambda db, order_id: order_details_in(db, _int(order_id)), "<order_id>", 1, 1),
+    "update_status": Command(lambda db, order_id, status: update_order_status_in(db, _int(order_id), status),
+                             "<order_id> <status>", 2, 2),
+    "recent_orders": Command(lambda db, limit="10": recent_orders_in(db, _int(limit)), "[limit]", 0, 1),
+    "sales_summary": Command(sales_summary_in, "", 0, 0),
+}
+
+
+class BatchRunner:
+    """
+    Runs command lines over one session, writing one JSON line per command
+    Each command is committed on its own, or with transaction=True all of
+    them are committed together at the end, and the first failure rolls
+    back everything before it and stops the batch
+    """
+
+    def __init__(self, db: Session, out: IO[str], transaction: bool = False):
+        # Reads must see the writes made earlier in the batch
+        use_primary(db)
+        self.db = db
+        self.out = out
+        self.transaction = transaction
+        self.executed = 0
+        self.failed = 0
+
+    def execute(self, line: str, line_number: int = 0) -> Optional[Dict[str, Any]]:
+        """Run one command line; returns its output record (None for blanks and comments)"""
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as e:
+            return self._emit({"line": line_number, "ok": False, "error": f"Cannot parse line: {e}"}, failed=True)
+        if not args:
+            return None
+        name, args = args[0], args[1:]
+        record: Dict[str, Any] = {"line": line_number, "command": name}
+
+        if name == "commit":
+            self.db.commit()
+            return self._emit({**record, "ok": True})
+        if name == "rollback":
+            self.db.rollback()
+            return self._emit({**record, "ok": True})
+        command = COMMANDS.get(name)
+        if command is None:
+            return self._emit({**record, "ok": False, "error": f"Unknown command: {name}"}, failed=True)
+        if not command.min_args <= len(args) <= command.max_args:
+            return self._emit({**record, "ok": False, "error": f"Usage: {name} {command.usage}".rstrip()}, failed=True)
+
+        try:
+            result = command.run(self.db, *args)
+            if not self.transaction:
+                self.db.commit()
+        except Exception as e:
+            if not self.transaction:
+                self.db.rollback()
+            error = str(e) if isinstance(e, CommandError) else f"{type(e).__name__}: {e}"
+            return self._emit({**record, "ok": False, "error": error}, failed=True)
+        return self._emit({**record, "ok": True, "result": result})
+
+    def run(self, lines: Iterable[str]) -> Dict[str, Any]:
+        """
+        Run a stream of command lines as they arrive (output is flushed per
+        command); returns and writes a summary record
+        """
+        committed = True
+        for line_number, line in enumerate(lines, 1):
+            self.execute(line, line_number)
+            if self.transaction and self.failed:
+                committed = False
+                break
+        if self.transaction and committed:
+            self.db.commit()
+        elif self.transaction:
+            self.db.rollback()
+        summary = {"summary": True, "executed": self.executed, "failed": self.failed,
+                   "transaction": self.transaction, "committed": committed}
+        self._write(summary)
+        return summary
+
+    def _emit(self, record: Dict[str, Any], failed: bool = False) -> Dict[str, Any]:
+        self.executed += 1
+        self.failed += failed
+        self._write(record)
+        return record
+
+    def _write(self, record: Dict[str, Any]):
+        self.out.write(json.dumps(record, default=str) + "\n")
+        self.out.flush()
+
+
+def run_batch(lines: Iterable[str], out: IO[str] = sys.stdout, transaction: bool = False) -> Dict[str, Any]:
+    """Run command lines over one session (batch mode)"""
+    db = SessionLocal()
+    try:
+        return BatchRunner(db, out, transaction).run(lines)
+    finally:
+        db.close()
+
+
+def repl(transaction: bool = False):
+    """Read commands interactively; `commit`, `rollback` and `help` work too"""
+    print("db_utils REPL: one command per line, e.g. update_price \"Cheese Burger\" 9.49; Ctrl-D to quit",
+          file=sys.stderr)
+    if transaction:
+        print("Changes are committed at the end or with `commit`; a failed command rolls back", file=sys.stderr)
+
+    def prompts():
+        while True:
+            try:
+                line = input("db> " if sys.stdin.isatty() else "")
+            except EOFError:
+                return
+            if line.strip() in ("exit", "quit"):
+                return
+            if line.strip() == "help":
+                for name, command in COMMANDS.items():
+                    print(f"  {name} {command.usage}".rstrip(), file=sys.stderr)
+                continue
+            yield line
+
+    db = SessionLocal()
+    try:
+        runner = BatchRunner(db, sys.stdout, transaction)
+        if not transaction:
+            runner.run(prompts())
+            return
+        # A failure discards the open transaction; keep reading
+        for line in prompts():
+            record = runner.execute(line)
+            if record is not None and not record["ok"]:
+                db.rollback()
+                print("Transaction rolled back", file=sys.stderr)
+        db.commit()
+    finally:
+        db.close()
+
+
 if __name__ == "__main__":
-    import sys
-    
     if len(sys.argv) < 2:
         print("Database Management Utilities")
         print("=" * 60)
@@ -230,11 +489,15 @@ if __name__ == "__main__":
         print("  python db_utils.py update_status <order_id> <status>")
         print("  python db_utils.py recent_orders [limit]")
         print("  python db_utils.py sales_summary")
+        print("  python db_utils.py batch [script|-] [--transaction]   (JSON lines output)")
+        print("  python db_utils.py repl [--transaction]")
         print("\nExamples:")
         print('  python db_utils.py add_item "Hawaiian Pizza" 12.99 Pizza')
         print('  python db_utils.py update_price "Hawaiian Pizza" 13.99')
         print('  python db_utils.py toggle_item "Hawaiian Pizza"')
         print('  python db_utils.py update_status 1 PREPARING')
+        print('  python db_utils.py batch price_changes.txt --transaction')
+        print('  printf "update_status 7 PREPARING\\nget_order 7\\n" | python db_utils.py batch')
         sys.exit(0)
     
     command = sys.argv[1]
@@ -289,5 +552,19 @@ if __name__ == "__main__":
     elif command == "sales_summary":
         get_sales_summary()
     
+    elif command == "batch":
+        options = [arg for arg in sys.argv[2:] if arg.startswith("--")]
+        paths = [arg for arg in sys.argv[2:] if not arg.startswith("--")]
+        transaction = "--transaction" in options
+        if not paths or paths[0] == "-":
+            summary = run_batch(sys.stdin, transaction=transaction)
+        else:
+            with open(paths[0], encoding="utf-8") as script:
+                summary = run_batch(script, transaction=transaction)
+        sys.exit(1 if summary["failed"] else 0)
+    
+    elif command == "repl":
+        repl(transaction="--transaction" in sys.argv[2:])
+    
     else:
         print(f"Unknown command: {command}")
@@ -0,0 +1,342 @@
+"""
+Order ETA estimates from live kitchen throughput
+Keeps rolling statistics per stage (Placed -> Preparing -> Out for Delivery
+-> Delivered): an EWMA and a streaming 90th percentile of how long orders
+spend in the stage, an EWMA of the gap between orders leaving it, and how
+many orders are in it now. Status changes update them in O(1) and an
+estimate is a handful of arithmetic operations; the p90 gives the upper
+bound promised alongside it. On startup the statistics
+are rebuilt from order_events, vectorized with NumPy when it is installed.
+Status changes made outside this process (db_utils, other workers) are
+picked up by a background task reconciling the active orders with the
+database, off the request path.
+"""
+import asyncio
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models import Order, OrderEvent, OrderStatus
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional speedup
+    np = None
+
+
+# Each stage is named by the status an order holds during it
+NEXT_STATUS = {
+    OrderStatus.PLACED: OrderStatus.PREPARING,
+    OrderStatus.PREPARING: OrderStatus.OUT_FOR_DELIVERY,
+    OrderStatus.OUT_FOR_DELIVERY: OrderStatus.DELIVERED,
+}
+
+# Used until a stage has seen its first order (seconds)
+DEFAULT_DURATIONS = {
+    OrderStatus.PLACED: 5 * 60,
+    OrderStatus.PREPARING: 20 * 60,
+    OrderStatus.OUT_FOR_DELIVERY: 25 * 60,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+# p90 step as a fraction of the mean duration: smaller is steadier, larger adapts faster
+_QUANTILE_STEP = 0.02
+
+# Events of orders placed since a cutoff: idx_order_date, then idx_event_order_ts
+_EVENTS_SINCE = (
+    select(OrderEvent.order_id, OrderEvent.order_status, OrderEvent.ts)
+    .join(Order, Order.order_id == OrderEvent.order_id)
+    .where(Order.order_date >= bindparam("since"))
+    .order_by(OrderEvent.order_id, OrderEvent.ts, OrderEvent.event_id)
+)
+
+# Active orders and when they entered their current status (their latest
+# event of that status; order_date for orders older than order_events):
+# idx_order_status_date, then idx_event_order_ts
+_ACTIVE_ENTERED = (
+    select(Order.order_id, Order.order_status,
+           func.coalesce(func.max(OrderEvent.ts), Order.order_date).label("entered_at"))
+    .outerjoin(OrderEvent, and_(OrderEvent.order_id == Order.order_id,
+                                OrderEvent.order_status == Order.order_status))
+    .where(Order.order_status.in_(list(NEXT_STATUS)))
+    .group_by(Order.order_id, Order.order_status, Order.order_date)
+)
+
+
+def _seconds(ts: datetime) -> float:
+    """Naive UTC datetime as seconds since the epoch"""
+    return (ts - _EPOCH).total_seconds()
+
+
+class StageStats:
+    """Rolling statistics of one stage"""
+    __slots__ = ("alpha", "count", "mean", "p90", "exit_gap", "last_exit")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0                     # EWMA of seconds spent in the stage
+        self.p90 = 0.0                      # Streaming 90th percentile of the same
+        self.exit_gap: Optional[float] = None  # EWMA of seconds between orders leaving
+        self.last_exit: Optional[float] = None
+
+    def observe(self, duration: float, exit_at: float):
+        duration = max(0.0, duration)
+        if self.count == 0:
+            self.mean = self.p90 = duration
+        else:
+            self.mean += self.alpha * (duration - self.mean)
+            # Stochastic approximation: steps up 9x as far as down, so it settles
+            # where 10% of durations lie above it; step size follows the mean
+            step = _QUANTILE_STEP * max(self.mean, 1.0)
+            self.p90 += step * 0.9 if duration > self.p90 else -step * 0.1
+        if self.last_exit is not None and exit_at >= self.last_exit:
+            gap = exit_at - self.last_exit
+            self.exit_gap = gap if self.exit_gap is None else self.exit_gap + self.alpha * (gap - self.exit_gap)
+        self.last_exit = exit_at if self.last_exit is None else max(self.last_exit, exit_at)
+        self.count += 1
+
+
+class EtaEstimator:
+    """In-memory stage statistics and the stage each active order entered when"""
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._stages: Dict[OrderStatus, StageStats] = {status: StageStats(alpha) for status in NEXT_STATUS}
+        # order_id -> (status, entered at); terminal orders are dropped
+        self._entered: Dict[int, Tuple[OrderStatus, float]] = {}
+        self._depth: Dict[OrderStatus, int] = {status: 0 for status in NEXT_STATUS}
+
+    # ---- live updates ----------------------------------------------------
+
+    def order_placed(self, order_id: int, ts: datetime):
+        self.status_changed(order_id, OrderStatus.PLACED, ts)
+
+    def status_changed(self, order_id: int, new_status: OrderStatus, ts: Optional[datetime] = None):
+        at = _seconds(ts or datetime.utcnow())
+        with self._lock:
+            previous = self._entered.pop(order_id, None)
+            if previous is not None:
+                status, entered_at = previous
+                self._depth[status] -= 1
+                if NEXT_STATUS.get(status) is new_status:
+                    self._stages[status].observe(at - entered_at, at)
+            if new_status in self._depth:
+                self._entered[order_id] = (new_status, at)
+                self._depth[new_status] += 1
+
+    # ---- reconcile -------------------------------------------------------
+
+    def reconcile(self, db: Session) -> int:
+        """
+        Replace the active orders and stage depths with the database's, so
+        status changes made elsewhere are counted; a move to the next stage
+        seen this way is also observed as a stage duration
+        Returns the number of active orders
+        """
+        started = _seconds(datetime.utcnow())
+        rows = db.execute(_ACTIVE_ENTERED).all()
+        with self._lock:
+            entered: Dict[int, Tuple[OrderStatus, float]] = {}
+            for row in rows:
+                at = _seconds(row.entered_at)
+                previous = self._entered.get(row.order_id)
+                if previous is not None and NEXT_STATUS.get(previous[0]) is row.order_status:
+                    self._stages[previous[0]].observe(at - previous[1], at)
+                entered[row.order_id] = (row.order_status, at)
+            # Changes made in this process while the query ran are newer
+            for order_id, (status, at) in self._entered.items():
+                if at >= started and (order_id not in entered or entered[order_id][1] < at):
+                    entered[order_id] = (status, at)
+            depth = {status: 0 for status in NEXT_STATUS}
+            for status, _ in entered.values():
+                depth[status] += 1
+            self._entered, self._depth = entered, depth
+        return len(entered)
+
+    # ---- estimates -------------------------------------------------------
+
+    def _expected(self, status: OrderStatus, upper: bool = False) -> float:
+        """Expected (or with upper, 90th percentile) seconds in a stage for an order entering it now"""
+        stats = self._stages[status]
+        if not stats.count:
+            expected = DEFAULT_DURATIONS[status]
+        else:
+            expected = max(stats.p90, stats.mean) if upper else stats.mean
+        # Little's law: a backlog drains at the rate orders have been leaving
+        if stats.exit_gap is not None:
+            expected = max(expected, self._depth[status] * stats.exit_gap)
+        return expected
+
+    def seconds_until(self, status: OrderStatus, entered_at: datetime, target: OrderStatus,
+                      now: Optional[datetime] = None, upper: bool = False) -> Optional[float]:
+        """
+        Expected seconds until an order that entered status at entered_at
+        reaches target (with upper, from the stages' p90s); None once it is
+        there or the order is finished
+        """
+        if status not in NEXT_STATUS:
+            return None
+        elapsed = _seconds(now or datetime.utcnow()) - _seconds(entered_at)
+        remaining = max(self._expected(status, upper) - elapsed, 60.0)
+        stage = NEXT_STATUS[status]
+        while stage is not target:
+            if stage not in NEXT_STATUS:
+                return None
+            remaining += self._expected(stage, upper)
+            stage = NEXT_STATUS[stage]
+        return remaining
+
+    def describe(self, status: OrderStatus, entered_at: datetime, now: Optional[datetime] = None) -> Optional[str]:
+        """
+        Customer-facing estimate, e.g. "Estimated ready in ~12 min (up to 18 min)";
+        the bound is left out while it adds nothing to the estimate
+        """
+        if status is OrderStatus.OUT_FOR_DELIVERY:
+            label, target = "delivery", OrderStatus.DELIVERED
+        else:
+            label, target = "ready", OrderStatus.OUT_FOR_DELIVERY
+        seconds = self.seconds_until(status, entered_at, target, now)
+        upper = self.seconds_until(status, entered_at, target, now, upper=True)
+        if seconds is None:
+            return None
+        estimate = max(1, math.ceil(seconds / 60))
+        bound = round(upper / 60)     # The streaming p90 jitters by a step around its target
+        if bound > estimate:
+            return f"Estimated {label} in ~{estimate} min (up to {bound} min)"
+        return f"Estimated {label} in ~{estimate} min"
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Per-stage statistics for /debug/eta"""
+        with self._lock:
+            return {
+                status.value: {
+                    "orders_in_stage": self._depth[status],
+                    "samples": stats.count,
+                    "mean_seconds": round(stats.mean, 1) if stats.count else None,
+                    "p90_seconds": round(stats.p90, 1) if stats.count else None,
+                    "exit_gap_seconds": round(stats.exit_gap, 1) if stats.exit_gap is not None else None,
+                    "expected_seconds": round(self._expected(status), 1),
+                    "upper_seconds": round(self._expected(status, upper=True), 1),
+                }
+                for status, stats in self._stages.items()
+            }
+
+    # ---- replay ----------------------------------------------------------
+
+    def replay(self, db: Session, since: datetime) -> int:
+        """
+        Rebuild the statistics from events of orders placed since a cutoff
+        Returns the number of events read
+        """
+        rows = db.execute(_EVENTS_SINCE, {"since": since}).all()
+        order_ids = [row.order_id for row in rows]
+        statuses = [row.order_status for row in rows]
+        times = [_seconds(row.ts) for row in rows]
+
+        stages = {status: StageStats(self.alpha) for status in NEXT_STATUS}
+        for status, (durations, exits) in _stage_samples(order_ids, statuses, times).items():
+            _fold(stages[status], durations, exits)
+
+        entered: Dict[int, Tuple[OrderStatus, float]] = {}
+        for index, order_id in enumerate(order_ids):
+            last_of_order = index + 1 == len(order_ids) or order_ids[index + 1] != order_id
+            if last_of_order and statuses[index] in NEXT_STATUS:
+                entered[order_id] = (statuses[index], times[index])
+        depth = {status: 0 for status in NEXT_STATUS}
+        for status, _ in entered.values():
+            depth[status] += 1
+
+        with self._lock:
+            self._stages, self._entered, self._depth = stages, entered, depth
+        return len(rows)
+
+
+def _stage_samples(order_ids: Sequence[int], statuses: Sequence[OrderStatus],
+                   times: Sequence[float]) -> Dict[OrderStatus, Tuple[List[float], List[float]]]:
+    """
+    (durations, exit times) per stage from events sorted by order and time,
+    ordered by exit time
+    """
+    samples = {}
+    if np is not None and len(order_ids) > 1:
+        codes = {status: code for code, status in enumerate(OrderStatus)}
+        ids = np.asarray(order_ids)
+        status_codes = np.fromiter((codes[status] for status in statuses), dtype=np.int8, count=len(statuses))
+        ts = np.asarray(times, dtype=np.float64)
+        same_order = ids[1:] == ids[:-1]
+        for status, next_status in NEXT_STATUS.items():
+            mask = same_order & (status_codes[:-1] == codes[status]) & (status_codes[1:] == codes[next_status])
+            exits = ts[1:][mask]
+            order = np.argsort(exits, kind="stable")
+            samples[status] = ((ts[1:][mask] - ts[:-1][mask])[order].tolist(), exits[order].tolist())
+        return samples
+
+    pairs: Dict[OrderStatus, List[Tuple[float, float]]] = {status: [] for status in NEXT_STATUS}
+    for index in range(1, len(order_ids)):
+        status = statuses[index - 1]
+        if order_ids[index] == order_ids[index - 1] and NEXT_STATUS.get(status) is statuses[index]:
+            pairs[status].append((times[index], times[index] - times[index - 1]))
+    for status, exits_and_durations in pairs.items():
+        exits_and_durations.sort(key=lambda pair: pair[0])
+        samples[status] = ([duration for _, duration in exits_and_durations],
+                           [exit_at for exit_at, _ in exits_and_durations])
+    return samples
+
+
+def _fold(stats: StageStats, durations: List[float], exits: List[float]):
+    """Feed samples into fresh stats; the EWMAs in closed form with NumPy"""
+    if np is None or len(durations) < 2:
+        for duration, exit_at in zip(durations, exits):
+            stats.observe(duration, exit_at)
+        return
+    values = np.maximum(np.asarray(durations, dtype=np.float64), 0.0)
+    gaps = np.diff(np.asarray(exits, dtype=np.float64))
+    stats.count = len(values)
+    stats.mean = _ewma(values, stats.alpha)
+    stats.p90 = float(np.quantile(values, 0.9))
+    stats.exit_gap = _ewma(gaps, stats.alpha)
+    stats.last_exit = float(exits[-1])
+
+
+def _ewma(values, alpha: float) -> float:
+    """EWMA seeded with the first value, as StageStats.observe computes it"""
+    n = len(values)
+    weights = alpha * (1 - alpha) ** np.arange(n - 2, -1, -1, dtype=np.float64)
+    return float((1 - alpha) ** (n - 1) * values[0] + np.dot(weights, values[1:]))
+
+
+# The default tenant's estimator, fed by order_service and replayed on startup
+eta_estimator = EtaEstimator()
+
+
+def replay_recent(estimator: EtaEstimator, db: Session, hours: float) -> int:
+    """Rebuild an estimator from the last `hours` of orders"""
+    return estimator.replay(db, datetime.utcnow() - timedelta(hours=hours))
+
+
+async def reconcile_forever(estimator: EtaEstimator, session_factory: Callable[[], Session], interval: float):
+    """
+    Background task: pick up status changes made outside this process
+    (db_utils, other workers); the query runs in a worker thread
+    """
+    def reconcile() -> int:
+        db = session_factory()
+        try:
+            return estimator.reconcile(db)
+        finally:
+            db.close()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(reconcile)
+        except Exception as e:
+            print(f"Error reconciling ETA statistics: {str(e)}")
@@ -0,0 +1,200 @@
+"""
+Fast JSON path for Dialogflow webhook traffic
+Real webhook bodies carry large outputContexts, originalDetectIntentRequest
+and diagnostic blobs that the handlers never read. Bodies are decoded with
+orjson when it is installed and only the handful of fields the handlers use
+is validated; responses are encoded straight to bytes.
+"""
+import json
+from typing import Any, Dict, Optional
+
+from fastapi.responses import Response
+from pydantic import BaseModel, field_validator
+
+from schemas import DialogflowTurn
+
+try:
+    import orjson
+except ImportError:  # Optional dependency, fall back to the standard library
+    orjson = None
+
+
+def loads(data: bytes) -> Any:
+    """Decode JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to compact UTF-8 JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def turn_from_payload(payload: Any) -> DialogflowTurn:
+    """
+    Validate only the fields the handlers need from a decoded webhook body
+    Raises pydantic.ValidationError if they are missing or malformed
+    """
+    if not isinstance(payload, dict):
+        return DialogflowTurn.model_validate(payload)
+    query_result = payload.get("queryResult")
+    if not isinstance(query_result, dict):
+        query_result = {}
+    intent = query_result.get("intent")
+    turn = {
+        "intent": intent.get("displayName") if isinstance(intent, dict) else None,
+        "parameters": query_result.get("parameters") or {},
+        "queryText": query_result.get("queryText") or "",
+        "session": payload.get("session") or "",
+    }
+    if payload.get("responseId") is not None:
+        turn["responseId"] = payload["responseId"]
+    user_id = user_id_from_original(payload.get("originalDetectIntentRequest"))
+    if user_id is not None:
+        turn["userId"] = user_id
+    return DialogflowTurn.model_validate(turn)
+
+
+def user_id_from_original(original: Any) -> Optional[str]:
+    """
+    Platform user ID from originalDetectIntentRequest.payload, if any
+    ("userId", or "user": {"userId": ...} as sent by Actions on Google)
+    """
+    if not isinstance(original, dict):
+        return None
+    payload = original.get("payload")
+    if not isinstance(payload, dict):
+        return None
+    user_id = payload.get("userId")
+    if user_id is None and isinstance(payload.get("user"), dict):
+        user_id = payload["user"].get("userId")
+    return str(user_id) if user_id not in (None, "") else None
+
+
+def parse_webhook_turn(body: bytes) -> DialogflowTurn:
+    """
+    Decode a raw webhook body into a DialogflowTurn
+    With orjson the whole body is decoded and the slim fields picked out,
+    which beats pydantic's JSON parser at every body size (see
+    benchmarks/bench_webhook_json.py); without orjson pydantic parses the
+    body straight into the slim model
+    """
+    if orjson is not None:
+        return turn_from_payload(orjson.loads(body))
+    return _SlimWebhookRequest.model_validate_json(body).to_turn()
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with the fast encoder (or pre-encoded bytes)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def fulfillment(text: str) -> FastJSONResponse:
+    """Dialogflow fulfillment response"""
+    return FastJSONResponse(dumps({"fulfillmentText": text}))
+
+
+# Slim request models for pydantic's JSON parser, used when orjson is
+# missing. They accept exactly what turn_from_payload accepts: null or empty
+# parameters/queryText/session fall back to defaults, and an
+# originalDetectIntentRequest of an unexpected shape is ignored
+def _dict_or_none(value: Any) -> Any:
+    return value if isinstance(value, dict) else None
+
+
+def _text_or_none(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+class _SlimIntent(BaseModel):
+    displayName: str
+
+
+class _SlimQueryResult(BaseModel):
+    intent: _SlimIntent
+    parameters: Dict[str, Any] = {}
+    queryText: str = ""
+
+    @field_validator("parameters", mode="before")
+    @classmethod
+    def _parameters_default(cls, value: Any) -> Any:
+        return value or {}
+
+    @field_validator("queryText", mode="before")
+    @classmethod
+    def _query_text_default(cls, value: Any) -> Any:
+        return value or ""
+
+
+class _SlimUser(BaseModel):
+    userId: Optional[str] = None
+
+    @field_validator("userId", mode="before")
+    @classmethod
+    def _user_id_text(cls, value: Any) -> Optional[str]:
+        return _text_or_none(value)
+
+
+class _SlimPlatformPayload(BaseModel):
+    userId: Optional[str] = None
+    user: Optional[_SlimUser] = None
+
+    @field_validator("userId", mode="before")
+    @classmethod
+    def _user_id_text(cls, value: Any) -> Optional[str]:
+        return _text_or_none(value)
+
+    @field_validator("user", mode="before")
+    @classmethod
+    def _user_shape(cls, value: Any) -> Any:
+        return _dict_or_none(value)
+
+
+class _SlimOriginalRequest(BaseModel):
+    payload: Optional[_SlimPlatformPayload] = None
+
+    @field_validator("payload", mode="before")
+    @classmethod
+    def _payload_shape(cls, value: Any) -> Any:
+        return _dict_or_none(value)
+
+
+class _SlimWebhookRequest(BaseModel):
+    queryResult: _SlimQueryResult
+    session: str = ""
+    responseId: Optional[str] = None
+    originalDetectIntentRequest: Optional[_SlimOriginalRequest] = None
+
+    @field_validator("session", mode="before")
+    @classmethod
+    def _session_default(cls, value: Any) -> Any:
+        return value or ""
+
+    @field_validator("originalDetectIntentRequest", mode="before")
+    @classmethod
+    def _original_shape(cls, value: Any) -> Any:
+        return _dict_or_none(value)
+
+    def to_turn(self) -> DialogflowTurn:
+        user_id = None
+        original = self.originalDetectIntentRequest
+        if original is not None and original.payload is not None:
+            user_id = original.payload.userId
+            if user_id is None and original.payload.user is not None:
+                user_id = original.payload.user.userId
+        return DialogflowTurn(
+            intent=self.queryResult.intent.displayName,
+            parameters=self.queryResult.parameters,
+            queryText=self.queryResult.queryText,
+            session=self.session,
+            responseId=self.responseId,
+            userId=user_id or None
+        )
@@ -25,8 +25,24 @@ def populate_menu_items():
             print(f"Menu already has {existing_items} items. Skipping population.")
             return
         
-        # Sample menu items
-        menu_items = [
+        menu_items = build_sample_menu()
+        
+        # Add all items to database
+        db.add_all(menu_items)
+        db.commit()
+        
+        print(f"✓ Successfully added {len(menu_items)} menu items to the database")
+        
+    except Exception as e:
+        print(f"Error populating menu items: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def build_sample_menu():
+    """Sample menu items (also used by benchmarks and load tests)"""
+    return [
             # Pizzas
             MenuItem(item_name="Margherita Pizza", price=8.99, category="Pizza", is_available=1),
             MenuItem(item_name="Pepperoni Pizza", price=10.99, category="Pizza", is_available=1),
@@ -82,18 +98,6 @@ def populate_menu_items():
             MenuItem(item_name="Mint Ice Cream", price=2.99, category="Ice Cream", is_available=1),
            
         ]
-        
-        # Add all items to database
-        db.add_all(menu_items)
-        db.commit()
-        
-        print(f"✓ Successfully added {len(menu_items)} menu items to the database")
-        
-    except Exception as e:
-        print(f"Error populating menu items: {str(e)}")
-        db.rollback()
-    finally:
-        db.close()
 
 
 def reset_database():
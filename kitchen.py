@@ -0,0 +1,149 @@
+"""
+Kitchen dashboard state
+Keeps every non-terminal order in memory, grouped by status with per-item
+cook counts. Placement and status changes update it in place; a periodic
+reload from the (order_status, order_date) index picks up changes made
+outside the server, e.g. by db_utils.py, and a status change of an order
+the board has not seen makes the next dashboard request reload
+"""
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Order, OrderItem, OrderStatus
+
+
+ACTIVE_STATUSES = (OrderStatus.PLACED, OrderStatus.PREPARING, OrderStatus.OUT_FOR_DELIVERY)
+
+# Wording used in the per-item cook counts, e.g. "12× Chicken Biriyani pending"
+_STATUS_LABELS = {
+    OrderStatus.PLACED: "pending",
+    OrderStatus.PREPARING: "preparing",
+    OrderStatus.OUT_FOR_DELIVERY: "out for delivery",
+}
+
+
+class KitchenBoard:
+    """Incrementally maintained aggregate of active orders"""
+
+    def __init__(self, max_age: float = 30.0):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # order_id -> (status, order_date, ((item_name, quantity), ...))
+        self._orders: Dict[int, Tuple[OrderStatus, datetime, Tuple[Tuple[str, int], ...]]] = {}
+        self._item_counts: Dict[OrderStatus, Counter] = {status: Counter() for status in ACTIVE_STATUSES}
+        self._loaded_at: Optional[float] = None
+        self._encoded: Optional[bytes] = None
+
+    def load(self, db: Session):
+        """Rebuild from the database with one index range scan per table"""
+        rows = (db.query(Order.order_id, Order.order_status, Order.order_date)
+                .filter(Order.order_status.in_(ACTIVE_STATUSES))
+                .order_by(Order.order_status, Order.order_date)
+                .all())
+        items: Dict[int, List[Tuple[str, int]]] = {}
+        if rows:
+            # Joined rather than IN (...ids): no bind parameter per active order
+            item_rows = (db.query(OrderItem.order_id, OrderItem.item_name, OrderItem.quantity)
+                         .join(Order, Order.order_id == OrderItem.order_id)
+                         .filter(Order.order_status.in_(ACTIVE_STATUSES))
+                         .all())
+            for order_id, item_name, quantity in item_rows:
+                items.setdefault(order_id, []).append((item_name, quantity))
+
+        with self._lock:
+            self._orders.clear()
+            for counts in self._item_counts.values():
+                counts.clear()
+            for order_id, status, order_date in rows:
+                self._add(order_id, status, order_date, items.get(order_id, ()))
+            self._loaded_at = time.monotonic()
+            self._encoded = None
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+
+    def order_placed(self, order_id: int, order_date: datetime, items: Iterable[Tuple[str, int]]):
+        with self._lock:
+            self._add(order_id, OrderStatus.PLACED, order_date, items)
+            self._encoded = None
+
+    def status_changed(self, order_id: int, new_status: OrderStatus):
+        with self._lock:
+            entry = self._orders.pop(order_id, None)
+            if entry is None:
+                # Not known here (placed elsewhere since the last reload): reload
+                # on the next dashboard request rather than wait for max_age
+                if new_status in self._item_counts:
+                    self._loaded_at = None
+                return
+            _, order_date, items = entry
+            self._item_counts[entry[0]].subtract(dict(items))
+            self._item_counts[entry[0]] += Counter()  # Drop zero counts
+            if new_status in self._item_counts:
+                self._add(order_id, new_status, order_date, items)
+            self._encoded = None
+
+    def order_counts(self) -> Dict[str, int]:
+        """Number of active orders per status value"""
+        with self._lock:
+            statuses = [status for status, _, _ in self._orders.values()]
+        return {status.value: statuses.count(status) for status in ACTIVE_STATUSES}
+
+    def _add(self, order_id, status, order_date, items):
+        items = tuple(items)
+        self._orders[order_id] = (status, order_date, items)
+        for item_name, quantity in items:
+            self._item_counts[status][item_name] += quantity
+
+    def snapshot(self) -> bytes:
+        """JSON body for the dashboard, re-encoded only after a change"""
+        encoded = self._encoded
+        if encoded is not None:
+            return encoded
+
+        with self._lock:
+            by_status: Dict[OrderStatus, list] = {status: [] for status in ACTIVE_STATUSES}
+            for order_id, (status, order_date, items) in self._orders.items():
+                by_status[status].append((order_date, order_id, items))
+
+            statuses = {}
+            for status in ACTIVE_STATUSES:
+                orders = sorted(by_status[status])
+                counts = self._item_counts[status]
+                statuses[status.value] = {
+                    "order_count": len(orders),
+                    "items": [
+                        {
+                            "item_name": item_name,
+                            "quantity": quantity,
+                            "label": f"{quantity}× {item_name} {_STATUS_LABELS[status]}"
+                        }
+                        for item_name, quantity in counts.most_common()
+                    ],
+                    "orders": [
+                        {
+                            "order_id": order_id,
+                            "order_date": order_date.isoformat(),
+                            "items": [{"item_name": name, "quantity": qty} for name, qty in items]
+                        }
+                        for order_date, order_id, items in orders
+                    ],
+                }
+
+            encoded = json.dumps({
+                "generated_at": datetime.utcnow().isoformat(),
+                "total_active": len(self._orders),
+                "statuses": statuses,
+            }, ensure_ascii=False).encode("utf-8")
+            self._encoded = encoded
+            return encoded
+
+
+# Process-wide board used by order_service and the /kitchen endpoints
+kitchen_board = KitchenBoard()
@@ -0,0 +1,313 @@
+"""
+Load generator: concurrent customers walking full ordering conversations
+Each simulated session runs new.order -> order.add -> order.remove ->
+order.complete -> track.order (repeated) against the webhook, picking menu
+items with Zipf-like weights from the menu_items table (via GET /menu) and
+pausing a random think time between turns. Turns are written as free text
+and turned into webhook requests by the offline Dialogflow stand-in
+(offline_agent.py), so the server sees the payload shapes the real agent sends.
+
+Runs either in-process (the app is driven through httpx's ASGI transport
+against a throwaway SQLite database) or against a running server.
+In-process, handlers share one event loop with the generator, so the
+numbers show per-turn cost; run against uvicorn to measure concurrency.
+
+Usage:
+  python load_test.py --sessions 50 --conversations 500
+  python load_test.py --url http://localhost:8000 --sessions 200 --duration 60
+  python load_test.py --url http://localhost:8000 --database-url sqlite:///primary.db
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from offline_agent import OfflineAgent
+
+
+ORDER_ID_PATTERN = re.compile(r"Order ID: (\d+)")
+FAILURE_TEXTS = ("Sorry, something went wrong", "You're sending requests a little too quickly")
+
+
+class LoadStats:
+    """Per-intent latencies and errors, plus order counts"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.conversations = 0
+        self.orders_acknowledged = 0
+
+    def record(self, intent: str, seconds: float, ok: bool):
+        self.latencies[intent].append(seconds)
+        if not ok:
+            self.errors[intent] += 1
+
+    @property
+    def turns(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(fraction * len(sorted_values) + 0.999999))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class MenuSampler:
+    """Zipf-like weighted choice over available menu items"""
+
+    def __init__(self, names: List[str], rng: random.Random, exponent: float = 1.0):
+        if not names:
+            raise ValueError("The menu has no available items")
+        self.names = list(names)
+        rng.shuffle(self.names)
+        self.weights = [1.0 / (rank + 1) ** exponent for rank in range(len(self.names))]
+        self.rng = rng
+
+    def pick(self, count: int) -> List[str]:
+        """count distinct items (fewer if the menu is smaller)"""
+        chosen: List[str] = []
+        while len(chosen) < min(count, len(self.names)):
+            name = self.rng.choices(self.names, weights=self.weights)[0]
+            if name not in chosen:
+                chosen.append(name)
+        return chosen
+
+
+class ConversationRunner:
+    """Drives simulated sessions against one HTTP client"""
+
+    def __init__(self, client: httpx.AsyncClient, agent: OfflineAgent, sampler: MenuSampler, stats: LoadStats,
+                 rng: random.Random, think_time: float, tracks: int):
+        self.client = client
+        self.agent = agent
+        self.sampler = sampler
+        self.stats = stats
+        self.rng = rng
+        self.think_time = think_time
+        self.tracks = tracks
+
+    async def turn(self, session_id: str, text: str) -> Optional[str]:
+        """Send one utterance; returns the fulfillmentText, or None on failure"""
+        payload = self.agent.request(session_id, text)
+        intent = payload["queryResult"]["intent"]["displayName"]
+        start = time.perf_counter()
+        text = None
+        try:
+            response = await self.client.post("/", json=payload)
+            if response.status_code == 200:
+                text = response.json().get("fulfillmentText")
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Error sending {intent}: {type(e).__name__} {str(e)}")
+        elapsed = time.perf_counter() - start
+        ok = bool(text) and not text.startswith(FAILURE_TEXTS)
+        self.stats.record(intent, elapsed, ok)
+        return text if ok else None
+
+    async def think(self):
+        if self.think_time > 0:
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.think_time))
+
+    async def conversation(self):
+        session_id = f"load-{uuid.uuid4().hex[:12]}"
+
+        first = self.sampler.pick(self.rng.randint(1, 2))
+        quantities = [self.rng.randint(1, 3) for _ in first]
+        text = " and ".join(f"{quantity} {name}" for quantity, name in zip(quantities, first))
+        await self.turn(session_id, f"I want {text}")
+        await self.think()
+
+        # One item not already in the cart, so the removal leaves something to order
+        extra = [name for name in self.sampler.pick(len(first) + 1) if name not in first][:1]
+        await self.turn(session_id, f"add {extra[0]}")
+        await self.think()
+
+        removed = self.rng.choice(first + extra)
+        await self.turn(session_id, f"remove the {removed}")
+        await self.think()
+
+        confirmation = await self.turn(session_id, "that's all")
+        match = ORDER_ID_PATTERN.search(confirmation or "")
+        if match:
+            self.stats.orders_acknowledged += 1
+            order_id = int(match.group(1))
+            for _ in range(self.tracks):
+                await self.think()
+                await self.turn(session_id, f"where is order {order_id}")
+        self.agent.end_session(session_id)
+        self.stats.conversations += 1
+
+
+async def fetch_menu_names(client: httpx.AsyncClient) -> List[str]:
+    response = await client.get("/menu")
+    response.raise_for_status()
+    return [item["item_name"] for item in response.json()["items"] if item["is_available"]]
+
+
+async def run_load(client: httpx.AsyncClient, args, stats: LoadStats) -> float:
+    """Run the workers; returns the wall-clock duration"""
+    rng = random.Random(args.seed)
+    names = await fetch_menu_names(client)
+    agent = OfflineAgent(names, project_id="load-test", seed=args.seed)
+    sampler = MenuSampler(names, rng, args.zipf)
+    runner = ConversationRunner(client, agent, sampler, stats, rng, args.think_time, args.tracks)
+
+    deadline = time.monotonic() + args.duration if args.duration else None
+    remaining = [args.conversations]
+
+    async def worker():
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if deadline is None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await runner.conversation()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.sessions)))
+    return time.perf_counter() - start
+
+
+def count_orders(database_url: str) -> int:
+    from sqlalchemy import create_engine, func, select
+    from models import Order
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(Order)).scalar() or 0
+    finally:
+        engine.dispose()
+
+
+async def run_in_process(args, stats: LoadStats) -> float:
+    """Start the app in this process on a throwaway SQLite database and load it"""
+    from init_db import populate_menu_items
+    import main
+
+    await main.startup_event()
+    populate_menu_items()
+    main.tenant_registry.default.menu.invalidate()
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+            return await run_load(client, args, stats)
+    finally:
+        # Flushes write-behind orders so they are counted
+        await main.shutdown_event()
+
+
+async def run_remote(args, stats: LoadStats) -> float:
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        return await run_load(client, args, stats)
+
+
+def report(stats: LoadStats, duration: float, orders_written: Optional[int], as_json: bool):
+    intents = {}
+    for intent, values in stats.latencies.items():
+        values = sorted(values)
+        intents[intent] = {
+            "count": len(values),
+            "errors": stats.errors[intent],
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p90_ms": percentile(values, 0.90) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    summary = {
+        "duration_s": duration,
+        "conversations": stats.conversations,
+        "turns": stats.turns,
+        "turns_per_second": stats.turns / duration if duration else 0.0,
+        "conversations_per_second": stats.conversations / duration if duration else 0.0,
+        "error_rate": stats.error_count / stats.turns if stats.turns else 0.0,
+        "orders_acknowledged": stats.orders_acknowledged,
+        "orders_written": orders_written,
+        "intents": intents,
+    }
+    if as_json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"\nDuration:        {duration:.2f}s")
+    print(f"Conversations:   {stats.conversations} ({summary['conversations_per_second']:.1f}/s)")
+    print(f"Turns:           {stats.turns} ({summary['turns_per_second']:.1f}/s)")
+    print(f"Error rate:      {summary['error_rate']:.2%} ({stats.error_count} turns)")
+    written = "not checked" if orders_written is None else str(orders_written)
+    print(f"Orders:          {stats.orders_acknowledged} acknowledged, {written} written")
+    print(f"\n{'intent':<40} {'count':>7} {'errors':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for intent, row in intents.items():
+        print(f"{intent:<40} {row['count']:>7} {row['errors']:>7} "
+              f"{row['p50_ms']:>7.1f}ms {row['p90_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms {row['max_ms']:>7.1f}ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent ordering conversations against the webhook")
+    parser.add_argument("--url", help="Base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--database-url",
+                        help="In-process: database to use (default: a new SQLite file). "
+                             "With --url: database to count written orders in")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent sessions")
+    parser.add_argument("--conversations", type=int, default=200, help="Conversations to run in total")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead")
+    parser.add_argument("--tracks", type=int, default=3, help="track.order turns after each order")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between turns (exponential)")
+    parser.add_argument("--zipf", type=float, default=1.0, help="Skew of menu item popularity (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout with --url")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--app-output", action="store_true", help="In-process: show the app's per-turn logging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stats = LoadStats()
+
+    database_url = args.database_url
+    if not args.url:
+        database_url = database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load_test.db")
+        # Must be set before config.settings is first imported
+        os.environ["DATABASE_URL"] = database_url
+        # Every simulated customer shares one client address
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        from database import init_db
+        init_db()
+
+    orders_before = count_orders(database_url) if database_url else 0
+    if args.url:
+        duration = asyncio.run(run_remote(args, stats))
+    elif args.app_output:
+        duration = asyncio.run(run_in_process(args, stats))
+    else:
+        # The webhook logs every turn; keep the report readable
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            duration = asyncio.run(run_in_process(args, stats))
+
+    orders_written = count_orders(database_url) - orders_before if database_url else None
+    report(stats, duration, orders_written, args.json)
+    sys.exit(1 if stats.error_count else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,42 @@
-from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Depends, Header, HTTPException
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import asyncio
+import hmac
+import time
 import uvicorn
 
-from database import get_db, init_db
-from schemas import DialogflowRequest, DialogflowResponse
+from database import init_db, SessionLocal, recent_writes, use_primary, pool_connections
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from schemas import DialogflowResponse, DialogflowTurn, OrderStatusUpdate
 from order_service import (
     add_to_order, 
     remove_from_order, 
     complete_order, 
     track_order,
-    get_order_summary
+    reorder_last_order,
+    customer_key_for,
+    get_order_summary,
+    set_order_status
 )
+from quantity_parser import quantities_for_add, quantities_for_remove
+from fast_json import FastJSONResponse, fulfillment, parse_webhook_turn
+from batch_service import BatchStreamingResponse, WebhookBatch, iter_batch_payloads, stream_batch_results
+from profiling import ProfileStore, ProfilingMiddleware
+from memory_profile import memory_profiler, cache_sizes, process_memory
+from order_queue import start_write_behind, stop_write_behind
+from eta import reconcile_forever, replay_recent
+from recommender import rebuild_recent
+from tenants import Tenant, tenant_registry, use_tenant
+from cart_store import sweep_forever
+from menu_catalog import refresh_forever, accepts_gzip, etag_matches
+from rate_limit import RateLimiter, TokenBuckets, cleanup_forever
+import metrics
+from tracing import tracer, span
+from models import OrderStatus
 from config import settings
 
 
@@ -24,200 +47,302 @@ app = FastAPI(
     version="1.0.0"
 )
 
-<<<<<<< HEAD
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:4200", "http://127.0.0.1:4200"],  # Adjust this to your frontend's origin in production
-=======
 # Add CORS middleware to allow Angular app to communicate
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:4200", "http://127.0.0.1:4200"],
->>>>>>> 4ec8bb155dbdb3afe8e30ca56e092e4a256d1bfe
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-@app.post("/")
-async def handle_request(request: Request, db: Session = Depends(get_db)):
-   """Handle Dialogflow webhook requests"""
-   try:
-       # Retrieve the JSON data from the request
-       payload = await request.json()
-
-       # Extract the necessary information from payload
-       # based on the structure of the WebhookRequest from Dialogflow
-       intent = payload['queryResult']['intent']['displayName']
-       parameters = payload['queryResult']['parameters']
-       query_text = payload['queryResult'].get('queryText', '')
-       
-       # Extract session ID from the session path
-       session_path = payload.get('session', '')
-       if session_path:
-           # Extract session ID from path like "projects/.../sessions/SESSION_ID"
-           session_id = session_path.split('/')[-1] if '/' in session_path else session_path
-       else:
-           session_id = 'default-session'
-       
-       print(f"Intent: {intent}")
-       print(f"Query Text: {query_text}")
-       print(f"Session ID: {session_id}")
-       print(f"Parameters: {parameters}")
-       
-       # Use original values from parameters if available for better matching
-       food_items = parameters.get("food-item", [])
-       food_items_original = parameters.get("food-item.original", [])
-       
-       # Prefer original values for better menu item matching
-       if food_items_original:
-           # Capitalize each word for better matching (e.g., "chicken pizza" -> "Chicken Pizza")
-           food_items = [item.title() for item in food_items_original]
-       elif food_items:
-           # If no original, try to use the extracted values
-           food_items = [item if isinstance(item, str) else str(item) for item in food_items]
-
-       # Handle different intents
-       if intent == "track.order - context: ongoing-tracking" or intent == "track.order":
-           order_id = parameters.get("number")
-           if order_id:
-               if isinstance(order_id, list):
-                   order_id = order_id[0]
-               try:
-                   order_id = int(order_id)
-                   response_text = track_order(order_id, db)
-               except (ValueError, TypeError):
-                   response_text = "Please provide a valid order ID number."
-           else:
-               response_text = "Please provide your order ID to track your order."
-           
-           return JSONResponse(content={
-               "fulfillmentText": response_text
-           })
-       
-       elif intent == "new.order":
-           numbers = parameters.get("number", [])
-           
-           if not food_items:
-               response_text = "What would you like to order?"
-           else:
-               if not numbers:
-                   numbers = [1] * len(food_items)
-               if len(numbers) < len(food_items):
-                   numbers.extend([1] * (len(food_items) - len(numbers)))
-               
-               response_text = add_to_order(session_id, food_items, numbers, db)
-           
-           return JSONResponse(content={
-               "fulfillmentText": response_text
-           })
-       
-       elif intent == "order.add - context: ongoing-order":
-           numbers = parameters.get("number", [])
-           
-           if not food_items:
-               response_text = "What would you like to add to your order?"
-           else:
-               if not numbers:
-                   numbers = [1] * len(food_items)
-               if len(numbers) < len(food_items):
-                   numbers.extend([1] * (len(food_items) - len(numbers)))
-               
-               response_text = add_to_order(session_id, food_items, numbers, db)
-           
-           return JSONResponse(content={
-               "fulfillmentText": response_text
-           })
-       
-       elif intent == "order.remove - context: ongoing-order" or intent == "order.remove-context: ongoing-order":
-           if not food_items:
-               response_text = "What would you like to remove from your order?"
-           else:
-               # Extract numbers from parameters, but validate against query text
-               numbers = parameters.get("number", [])
-               
-               # Parse the query text to extract actual numbers mentioned
-               import re
-               query_lower = query_text.lower()
-               
-               # Number word mapping
-               number_words = {
-                   'one': 1, 'a': 1, 'an': 1,
-                   'two': 2, 'three': 3, 'four': 4, 'five': 5,
-                   'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
-               }
-               
-               # Extract numbers from query text
-               actual_quantities = []
-               
-               # Check for number words in query
-               for word, value in number_words.items():
-                   if re.search(r'\b' + word + r'\b', query_lower):
-                       actual_quantities.append(value)
-                       break
-               
-               # Check for digit numbers in query
-               digit_matches = re.findall(r'\b\d+\b', query_text)
-               if digit_matches and not actual_quantities:
-                   actual_quantities = [int(d) for d in digit_matches]
-               
-               # Use actual quantities from query text if found, otherwise use parameter numbers
-               # But default to None (remove all) if no explicit quantity found
-               if actual_quantities:
-                   quantities = actual_quantities
-               elif numbers and 'remove all' not in query_lower:
-                   # Only use parameter numbers if query suggests using them
-                   # and it's not a "remove all" command
-                   quantities = None  # Default to remove all to avoid confusion
-               else:
-                   quantities = None  # Remove all
-               
-               response_text = remove_from_order(session_id, food_items, quantities)
-           
-           return JSONResponse(content={
-               "fulfillmentText": response_text
-           })
-       
-       elif intent == "order.complete - context: ongoing-order" or intent == "order.complete-context: ongoing-order":
-           response_text = complete_order(session_id, db)
-           
-           return JSONResponse(content={
-               "fulfillmentText": response_text
-           })
-       
-       elif intent == "store.hours" or intent == "store hours":
-           # Fixed response for store hours
-           response_text = """Here are our store hours:
+# Opt-in request profiling (see PROFILING_* settings)
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_MAX_FILES)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        sample_every=settings.PROFILE_SAMPLE_EVERY,
+        header=settings.PROFILE_HEADER,
+        threshold_ms=settings.PROFILE_THRESHOLD_MS
+    )
+
+# In-process request tracing (see TRACE_* settings)
+tracer.configure(settings.TRACING_ENABLED, settings.TRACE_BUFFER_SIZE, settings.TRACE_EXPORT_PATH)
+
+# Per-session and per-client request budgets (see RATE_LIMIT_* settings)
+rate_limiter: Optional[RateLimiter] = None
+if settings.RATE_LIMIT_ENABLED:
+    rate_limiter = RateLimiter(
+        session_read=TokenBuckets(settings.RATE_LIMIT_SESSION_READ_RATE, settings.RATE_LIMIT_SESSION_READ_BURST, settings.RATE_LIMIT_MAX_KEYS),
+        session_write=TokenBuckets(settings.RATE_LIMIT_SESSION_WRITE_RATE, settings.RATE_LIMIT_SESSION_WRITE_BURST, settings.RATE_LIMIT_MAX_KEYS),
+        client_read=TokenBuckets(settings.RATE_LIMIT_CLIENT_READ_RATE, settings.RATE_LIMIT_CLIENT_READ_BURST, settings.RATE_LIMIT_MAX_KEYS),
+        client_write=TokenBuckets(settings.RATE_LIMIT_CLIENT_WRITE_RATE, settings.RATE_LIMIT_CLIENT_WRITE_BURST, settings.RATE_LIMIT_MAX_KEYS)
+    )
+
+# Gauges computed when /metrics is scraped, per tenant
+metrics.open_carts.set_function(lambda: {tenant.name: len(tenant.carts) for tenant in tenant_registry.all()})
+metrics.active_orders.set_function(lambda: {
+    (tenant.name, status): count
+    for tenant in tenant_registry.all() for status, count in tenant.kitchen.order_counts().items()
+})
+metrics.db_pool_connections.set_function(lambda: {
+    (tenant.name, state): count
+    for tenant in tenant_registry.all() for state, count in pool_connections(tenant.engine).items()
+})
+
+# Intents that write orders draw from the write budget, all others from the read budget
+WRITE_INTENTS = {"order.complete - context: ongoing-order", "order.complete-context: ongoing-order"}
+# Intent names used as metric labels; anything else is counted as "other"
+KNOWN_INTENTS = WRITE_INTENTS | {
+    "track.order", "track.order - context: ongoing-tracking", "new.order",
+    "order.add - context: ongoing-order", "order.remove - context: ongoing-order",
+    "order.remove-context: ongoing-order", "store.hours", "store hours",
+    "reorder", "order.reorder",
+}
+THROTTLED_MESSAGE = "You're sending requests a little too quickly. Please wait a moment and try again."
+
+
+def session_id_from_path(session_path: Optional[str]) -> str:
+    """Session ID from a Dialogflow session path ("projects/.../sessions/SESSION_ID")"""
+    if session_path:
+        return session_path.split('/')[-1] if '/' in session_path else session_path
+    return 'default-session'
+
+
+def check_rate_limit(request: Request, session_id: Optional[str], write: bool = False) -> Optional[float]:
+    """None if the request is within budget, else seconds until it would be allowed"""
+    if rate_limiter is None:
+        return None
+    client_ip = request.client.host if request.client else None
+    retry_after = rate_limiter.check(session_id, client_ip, write)
+    if retry_after is not None:
+        metrics.rate_limited.labels("write" if write else "read").inc()
+    return retry_after
+
+
+def get_tenant(tenant: Optional[str] = None) -> Tenant:
+    """Tenant named by the ?tenant= query parameter (the default when absent)"""
+    found = tenant_registry.get(tenant)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant}")
+    return found
+
+
+def require_staff(authorization: Optional[str] = Header(None)):
+    """Staff-only endpoints: "Authorization: Bearer <STAFF_API_TOKEN>" """
+    if not settings.STAFF_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Staff API is disabled (STAFF_API_TOKEN is not set)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), settings.STAFF_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Staff token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail="Too many requests",
+                         headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+
+def process_webhook_turn(turn: DialogflowTurn, db: Session, menu_cache: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run a single Dialogflow webhook turn and return the response body
+    Shared by the root webhook and the batch endpoint
+    """
+    start = time.perf_counter()
+    failed = True
+    try:
+        with span("webhook.dispatch", intent=turn.intent):
+            response = _dispatch_turn(turn, db, menu_cache)
+        failed = False
+        return response
+    finally:
+        record_turn(turn.intent, start, failed)
+
+
+def record_turn(intent: str, start: float, failed: bool = False):
+    """Count a webhook turn and its latency (since perf_counter() value start)"""
+    intent_label = intent if intent in KNOWN_INTENTS else "other"
+    if failed:
+        metrics.webhook_errors.labels(intent_label).inc()
+    metrics.webhook_requests.labels(intent_label).inc()
+    metrics.webhook_latency.labels(intent_label).observe(time.perf_counter() - start)
+
+
+def _dispatch_turn(turn: DialogflowTurn, db: Session, menu_cache: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Route a webhook turn to its intent handler"""
+    # Fields extracted from the WebhookRequest by fast_json
+    intent = turn.intent
+    parameters = turn.parameters
+    query_text = turn.queryText
+    
+    # Extract session ID from the session path
+    session_id = session_id_from_path(turn.session)
+    
+    # A customer who just placed an order reads from the primary for a while
+    if recent_writes.contains(f"session:{session_id}"):
+        use_primary(db)
+    
+    print(f"Intent: {intent}")
+    print(f"Query Text: {query_text}")
+    print(f"Session ID: {session_id}")
+    print(f"Parameters: {parameters}")
+    
+    # Use original values from parameters if available for better matching
+    food_items = parameters.get("food-item", [])
+    food_items_original = parameters.get("food-item.original", [])
+    
+    # Prefer original values for better menu item matching
+    if food_items_original:
+        # Capitalize each word for better matching (e.g., "chicken pizza" -> "Chicken Pizza")
+        food_items = [item.title() for item in food_items_original]
+    elif food_items:
+        # If no original, try to use the extracted values
+        food_items = [item if isinstance(item, str) else str(item) for item in food_items]
+
+    # Handle different intents
+    if intent == "track.order - context: ongoing-tracking" or intent == "track.order":
+        order_id = parameters.get("number")
+        if order_id:
+            if isinstance(order_id, list):
+                order_id = order_id[0]
+            try:
+                order_id = int(order_id)
+                response_text = track_order(order_id, db)
+            except (ValueError, TypeError):
+                response_text = "Please provide a valid order ID number."
+        else:
+            response_text = "Please provide your order ID to track your order."
+    
+    elif intent == "new.order":
+        if not food_items:
+            response_text = "What would you like to order?"
+        else:
+            numbers = quantities_for_add(query_text, food_items, parameters.get("number", []))
+            response_text = add_to_order(session_id, food_items, numbers, db, menu_cache)
+    
+    elif intent == "order.add - context: ongoing-order":
+        if not food_items:
+            response_text = "What would you like to add to your order?"
+        else:
+            numbers = quantities_for_add(query_text, food_items, parameters.get("number", []))
+            response_text = add_to_order(session_id, food_items, numbers, db, menu_cache)
+    
+    elif intent == "order.remove - context: ongoing-order" or intent == "order.remove-context: ongoing-order":
+        if not food_items:
+            response_text = "What would you like to remove from your order?"
+        else:
+            # Align quantities in the query text with each item; items without
+            # one are removed completely
+            quantities = quantities_for_remove(query_text, food_items)
+            
+            response_text = remove_from_order(session_id, food_items, quantities)
+    
+    elif intent == "order.complete - context: ongoing-order" or intent == "order.complete-context: ongoing-order":
+        response_text = complete_order(session_id, db, customer_key_for(session_id, turn.userId))
+    
+    elif intent == "reorder" or intent == "order.reorder":
+        response_text = reorder_last_order(session_id, customer_key_for(session_id, turn.userId), db)
+    
+    elif intent == "store.hours" or intent == "store hours":
+        # Fixed response for store hours
+        response_text = """Here are our store hours:
 Monday - Friday: 10:00 AM to 10:00 PM
 Saturday - Sunday: 11:00 AM to 11:00 PM
 
 We're open every day! You can place orders anytime during these hours."""
-           
-           return JSONResponse(content={
-               "fulfillmentText": response_text
-           })
+    
+    else:
+        # Default response for unhandled intents
+        response_text = "I'm not sure how to help with that. You can:\n1. Place a new order\n2. Track an existing order\n3. Repeat your last order\n4. Ask about store hours"
+    
+    return {"fulfillmentText": response_text}
+
+
+@app.post("/")
+async def handle_request(request: Request):
+   """Handle Dialogflow webhook requests"""
+   with tracer.trace("POST /") as root:
+       try:
+           # Decode the body, keeping only the fields the handlers use
+           body = await request.body()
+           with span("webhook.parse", bytes=len(body)):
+               turn = parse_webhook_turn(body)
+           if root is not None:
+               root.set(intent=turn.intent, session=session_id_from_path(turn.session))
+
+           # Dialogflow expects a 200, so a throttled turn gets a polite reply
+           if check_rate_limit(request, session_id_from_path(turn.session), turn.intent in WRITE_INTENTS) is not None:
+               return fulfillment(THROTTLED_MESSAGE)
+
+           tenant = tenant_registry.resolve(turn.session)
+           if root is not None:
+               root.set(tenant=tenant.name)
+           with use_tenant(tenant), tenant.session() as db:
+               result = process_webhook_turn(turn, db)
+           with span("webhook.render"):
+               return FastJSONResponse(result)
        
-       else:
-           # Default response for unhandled intents
-           return JSONResponse(content={
-               "fulfillmentText": "I'm not sure how to help with that. You can:\n1. Place a new order\n2. Track an existing order\n3. Ask about store hours"
-           })
-   
-   except Exception as e:
-       print(f"Error processing request: {str(e)}")
-       return JSONResponse(content={
-           "fulfillmentText": "Sorry, something went wrong. Please try again."
-       })
+       except Exception as e:
+           print(f"Error processing request: {str(e)}")
+           if root is not None:
+               root.error = f"{type(e).__name__}: {e}"
+           return fulfillment("Sorry, something went wrong. Please try again.")
 
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     init_db()
+    if settings.ORDER_PLACEMENT_MODE == "write_behind":
+        start_write_behind(
+            SessionLocal,
+            settings.ORDER_LOG_PATH,
+            block_size=settings.ORDER_ID_BLOCK_SIZE,
+            batch_size=settings.ORDER_FLUSH_BATCH_SIZE,
+            flush_interval=settings.ORDER_FLUSH_INTERVAL
+        )
+    tenant_registry.default.kitchen.max_age = settings.KITCHEN_RELOAD_INTERVAL
+    tenant_registry.default.eta.alpha = settings.ETA_SMOOTHING
+    tenant_registry.default.recommender.min_count = settings.RECOMMEND_MIN_COUNT
+    app.state.tenant_tasks = []
+    for tenant in tenant_registry.all():
+        if not tenant.is_default:
+            init_db(tenant.engine)
+        with tenant.session() as db:
+            tenant.kitchen.load(db)
+            tenant.menu.refresh(db)
+            events = replay_recent(tenant.eta, db, settings.ETA_REPLAY_HOURS)
+            orders = rebuild_recent(tenant.recommender, db, settings.RECOMMEND_HISTORY_DAYS)
+        print(f"✓ Tenant {tenant.name}: ETA statistics rebuilt from {events} order events, "
+              f"add-on suggestions from {orders} orders")
+        # Each tenant's caches are refreshed and swept on their own schedule
+        app.state.tenant_tasks += [
+            asyncio.create_task(refresh_forever(tenant.menu, tenant.session_factory, settings.MENU_REFRESH_INTERVAL,
+                                                on_change=tenant.recommender.menu_changed)),
+            asyncio.create_task(sweep_forever(tenant.carts, settings.CART_SWEEP_INTERVAL, settings.CART_SWEEP_BATCH)),
+            asyncio.create_task(reconcile_forever(tenant.eta, tenant.session_factory, settings.ETA_RECONCILE_INTERVAL)),
+        ]
+    if rate_limiter is not None:
+        app.state.rate_limit_cleaner = asyncio.create_task(
+            cleanup_forever(rate_limiter, settings.RATE_LIMIT_CLEANUP_INTERVAL)
+        )
     print("✓ Application started successfully")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and flush orders still waiting in the write-behind log"""
+    for task in getattr(app.state, "tenant_tasks", []):
+        task.cancel()
+    task = getattr(app.state, "rate_limit_cleaner", None)
+    if task is not None:
+        task.cancel()
+    stop_write_behind()
+    if tracer.exporter is not None:
+        tracer.exporter.close()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -228,122 +353,163 @@ async def root():
         "features": [
             "1. Place new food orders",
             "2. Track existing orders",
-            "3. Check store hours"
+            "3. Repeat your last order",
+            "4. Check store hours"
         ]
     }
 
 
 @app.post("/webhook", response_model=DialogflowResponse)
-async def dialogflow_webhook(request: DialogflowRequest, db: Session = Depends(get_db)):
+async def dialogflow_webhook(request: Request):
     """
     Main webhook endpoint for Dialogflow
     Handles all intents from Dialogflow and returns appropriate responses
+    Accepts a DialogflowRequest body; only the fields the handlers use are validated
     """
     try:
-        # Extract intent and parameters
-        intent_name = request.queryResult.intent.displayName
-        parameters = request.queryResult.parameters
-        session_id = request.session
+        turn = parse_webhook_turn(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    except ValueError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": str(e), "input": None}])
+    
+    if check_rate_limit(request, session_id_from_path(turn.session), turn.intent in WRITE_INTENTS) is not None:
+        return fulfillment(THROTTLED_MESSAGE)
+    
+    tenant = tenant_registry.resolve(turn.session)
+    with tracer.trace("POST /webhook", intent=turn.intent, tenant=tenant.name), \
+            use_tenant(tenant), tenant.session() as db:
+        start = time.perf_counter()
+        try:
+            # Extract intent and parameters
+            intent_name = turn.intent
+            parameters = turn.parameters
+            session_id = turn.session
         
-        print(f"Intent: {intent_name}")
-        print(f"Parameters: {parameters}")
-        print(f"Session: {session_id}")
+            print(f"Intent: {intent_name}")
+            print(f"Parameters: {parameters}")
+            print(f"Session: {session_id}")
         
-        # Route to appropriate handler based on intent
-        if intent_name == "order.add - context: ongoing-order":
-            return handle_add_to_order(parameters, session_id, db)
+            # Route to appropriate handler based on intent
+            if intent_name == "order.add - context: ongoing-order":
+                response = handle_add_to_order(parameters, turn.queryText, session_id, db)
         
-        elif intent_name == "order.remove - context: ongoing-order":
-            return handle_remove_from_order(parameters, session_id, db)
+            elif intent_name == "order.remove - context: ongoing-order":
+                response = handle_remove_from_order(parameters, turn.queryText, session_id, db)
         
-        elif intent_name == "order.complete - context: ongoing-order":
-            return handle_complete_order(session_id, db)
+            elif intent_name == "order.complete - context: ongoing-order":
+                response = handle_complete_order(session_id, db, customer_key_for(session_id_from_path(session_id), turn.userId))
         
-        elif intent_name == "track.order":
-            return handle_track_order(parameters, db)
+            elif intent_name == "track.order":
+                response = handle_track_order(parameters, db)
         
-        elif intent_name == "new.order":
-            return handle_new_order(parameters, session_id, db)
+            elif intent_name == "reorder" or intent_name == "order.reorder":
+                response = handle_reorder(session_id, db, customer_key_for(session_id_from_path(session_id), turn.userId))
         
-        else:
-            return DialogflowResponse(
-                fulfillmentText="I'm not sure how to help with that. You can place a new order or track an existing one."
-            )
+            elif intent_name == "new.order":
+                response = handle_new_order(parameters, turn.queryText, session_id, db)
+        
+            else:
+                response = DialogflowResponse(
+                    fulfillmentText="I'm not sure how to help with that. You can place a new order or track an existing one."
+                )
+        
+            record_turn(intent_name, start)
+            return fulfillment(response.fulfillmentText)
     
-    except Exception as e:
-        print(f"Error processing webhook: {str(e)}")
-        return DialogflowResponse(
-            fulfillmentText="Sorry, something went wrong. Please try again."
-        )
+        except Exception as e:
+            print(f"Error processing webhook: {str(e)}")
+            record_turn(turn.intent, start, failed=True)
+            return fulfillment("Sorry, something went wrong. Please try again.")
+
+
+@app.post("/webhook/batch")
+async def dialogflow_webhook_batch(request: Request):
+    """
+    Batch webhook endpoint for replayed or integration traffic
+    Accepts a JSON array or NDJSON stream of Dialogflow requests and streams
+    one NDJSON result per payload back in input order
+    """
+    batch = WebhookBatch(
+        process_webhook_turn,
+        tenant_registry,
+        max_concurrency=settings.BATCH_MAX_CONCURRENCY,
+        max_items=settings.BATCH_MAX_ITEMS,
+        # Each payload draws from its session's and this client's budgets, as on POST /
+        rate_check=lambda turn: check_rate_limit(request, session_id_from_path(turn.session),
+                                                 turn.intent in WRITE_INTENTS),
+        throttled_text=THROTTLED_MESSAGE
+    )
+    # Lines are decoded and scheduled as the body arrives, so memory is bounded
+    # by the turns in flight rather than the size of the upload
+    return BatchStreamingResponse(
+        stream_batch_results(iter_batch_payloads(request.stream()), batch),
+        media_type="application/x-ndjson"
+    )
 
 
-def handle_new_order(parameters: Dict[str, Any], session_id: str, db: Session) -> DialogflowResponse:
+def handle_new_order(parameters: Dict[str, Any], query_text: str, session_id: str, db: Session) -> DialogflowResponse:
     """Handle new order intent"""
     food_items = parameters.get("food-item", [])
-    numbers = parameters.get("number", [])
     
     if not food_items:
         return DialogflowResponse(
             fulfillmentText="What would you like to order?"
         )
     
-    # If no quantities specified, assume 1 for each item
-    if not numbers:
-        numbers = [1] * len(food_items)
-    
-    # If quantities don't match items, pad with 1s
-    if len(numbers) < len(food_items):
-        numbers.extend([1] * (len(food_items) - len(numbers)))
+    # Quantities aligned with each item in the utterance, else the number parameter (1 where missing)
+    numbers = quantities_for_add(query_text, food_items, parameters.get("number", []))
     
     response_text = add_to_order(session_id, food_items, numbers, db)
     
     return DialogflowResponse(fulfillmentText=response_text)
 
 
-def handle_add_to_order(parameters: Dict[str, Any], session_id: str, db: Session) -> DialogflowResponse:
+def handle_add_to_order(parameters: Dict[str, Any], query_text: str, session_id: str, db: Session) -> DialogflowResponse:
     """Handle adding items to ongoing order"""
     food_items = parameters.get("food-item", [])
-    numbers = parameters.get("number", [])
     
     if not food_items:
         return DialogflowResponse(
             fulfillmentText="What would you like to add to your order?"
         )
     
-    # If no quantities specified, assume 1 for each item
-    if not numbers:
-        numbers = [1] * len(food_items)
-    
-    # If quantities don't match items, pad with 1s
-    if len(numbers) < len(food_items):
-        numbers.extend([1] * (len(food_items) - len(numbers)))
+    # Quantities aligned with each item in the utterance, else the number parameter (1 where missing)
+    numbers = quantities_for_add(query_text, food_items, parameters.get("number", []))
     
     response_text = add_to_order(session_id, food_items, numbers, db)
     
     return DialogflowResponse(fulfillmentText=response_text)
 
 
-def handle_remove_from_order(parameters: Dict[str, Any], session_id: str, db: Session) -> DialogflowResponse:
+def handle_remove_from_order(parameters: Dict[str, Any], query_text: str, session_id: str, db: Session) -> DialogflowResponse:
     """Handle removing items from ongoing order"""
     food_items = parameters.get("food-item", [])
-    numbers = parameters.get("number", [])
     
     if not food_items:
         return DialogflowResponse(
             fulfillmentText="What would you like to remove from your order?"
         )
     
-    # Extract quantities if provided (e.g., "remove 2 pizzas")
-    quantities = numbers if numbers else None
+    # Align quantities in the query text with each item (e.g., "remove 2 pizzas");
+    # items without one are removed completely
+    quantities = quantities_for_remove(query_text, food_items)
     
     response_text = remove_from_order(session_id, food_items, quantities)
     
     return DialogflowResponse(fulfillmentText=response_text)
 
 
-def handle_complete_order(session_id: str, db: Session) -> DialogflowResponse:
+def handle_complete_order(session_id: str, db: Session, customer_key: Optional[str] = None) -> DialogflowResponse:
     """Handle order completion"""
-    response_text = complete_order(session_id, db)
+    response_text = complete_order(session_id, db, customer_key)
+    
+    return DialogflowResponse(fulfillmentText=response_text)
+
+
+def handle_reorder(session_id: str, db: Session, customer_key: str) -> DialogflowResponse:
+    """Handle repeating the customer's last order"""
+    response_text = reorder_last_order(session_id, customer_key, db)
     
     return DialogflowResponse(fulfillmentText=response_text)
 
@@ -375,16 +541,206 @@ def handle_track_order(parameters: Dict[str, Any], db: Session) -> DialogflowRes
     return DialogflowResponse(fulfillmentText=response_text)
 
 
+@app.get("/menu")
+async def get_menu(request: Request, category: Optional[str] = None, tenant: Tenant = Depends(get_tenant)):
+    """
+    Menu items, optionally for one category
+    Served from pre-encoded bodies with strong ETags and gzip variants
+    """
+    if not tenant.menu.loaded:
+        with tenant.session() as db:
+            tenant.menu.refresh(db)
+    
+    encoded = tenant.menu.get(category)
+    if encoded is None:
+        raise HTTPException(status_code=404, detail=f"Unknown menu category: {category}")
+    
+    use_gzip = accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = encoded.gzip_etag if use_gzip else encoded.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=encoded.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=encoded.body, media_type="application/json", headers=headers)
+
+
 @app.get("/orders/{order_id}")
-async def get_order(order_id: int, db: Session = Depends(get_db)):
+async def get_order(order_id: int, request: Request, tenant: Tenant = Depends(get_tenant)):
     """
     REST API endpoint to get order details
     Can be used for testing or external integrations
     """
-    response_text = track_order(order_id, db)
+    retry_after = check_rate_limit(request, None)
+    if retry_after is not None:
+        raise too_many_requests(retry_after)
+    with tracer.trace("GET /orders/{order_id}", order_id=order_id, tenant=tenant.name), \
+            use_tenant(tenant), tenant.session() as db:
+        response_text = track_order(order_id, db)
     return {"order_id": order_id, "details": response_text}
 
 
+@app.put("/orders/{order_id}/status", dependencies=[Depends(require_staff)])
+async def update_order_status(order_id: int, update: OrderStatusUpdate, request: Request,
+                              tenant: Tenant = Depends(get_tenant)):
+    """Move an order to a new status (e.g. from the kitchen dashboard); staff token required"""
+    retry_after = check_rate_limit(request, None, write=True)
+    if retry_after is not None:
+        raise too_many_requests(retry_after)
+    new_status = OrderStatus(update.order_status.value)
+    with use_tenant(tenant), tenant.session() as db:
+        order = set_order_status(order_id, new_status, db)
+    if order is None:
+        raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    return {"order_id": order_id, "order_status": new_status.value}
+
+
+@app.get("/kitchen/active")
+async def kitchen_active_orders(tenant: Tenant = Depends(get_tenant)):
+    """
+    Active orders (Placed, Preparing, Out for Delivery) grouped by status
+    with per-item cook counts, served from the in-memory kitchen board
+    """
+    if tenant.kitchen.is_stale():
+        with tenant.session() as db:
+            tenant.kitchen.load(db)
+    return Response(content=tenant.kitchen.snapshot(), media_type="application/json")
+
+
+@app.get("/debug/carts")
+async def cart_stats(tenant: Tenant = Depends(get_tenant)):
+    """Gauges for in-progress carts: open carts, evictions and approximate memory"""
+    return tenant.carts.stats()
+
+
+@app.get("/debug/eta")
+async def eta_stats(tenant: Tenant = Depends(get_tenant)):
+    """Per-stage duration statistics behind the ETAs in tracking replies"""
+    return tenant.eta.snapshot()
+
+
+@app.get("/debug/recommendations")
+async def recommendation_stats(item: str, limit: int = 5, tenant: Tenant = Depends(get_tenant)):
+    """Items most often ordered together with a menu item"""
+    related = tenant.recommender.related(item, limit)
+    if related is None:
+        raise HTTPException(status_code=404, detail=f"Unknown menu item: {item}")
+    return {"item_name": item, "orders_counted": tenant.recommender.orders, "related": related}
+
+
+@app.get("/debug/tenants")
+async def tenant_stats():
+    """Configured tenants with their open carts and connection pool usage"""
+    return {
+        tenant.name: {
+            "database": tenant.engine.url.render_as_string(hide_password=True),
+            "open_carts": len(tenant.carts),
+            "pool": pool_connections(tenant.engine),
+        }
+        for tenant in tenant_registry.all()
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Application metrics in Prometheus text format"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/debug/traces", dependencies=[Depends(require_staff)])
+async def slowest_traces(limit: int = 20, min_ms: float = 0.0, name: Optional[str] = None):
+    """Slowest recent traced requests with their span breakdown"""
+    return {
+        "enabled": tracer.enabled,
+        "buffered": len(tracer),
+        "traces": tracer.slowest(limit, min_ms, name)
+    }
+
+
+@app.get("/debug/rate-limits")
+async def rate_limit_stats():
+    """Allowed and throttled request counts and tracked rate limit buckets"""
+    if rate_limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **rate_limiter.stats()}
+
+
+@app.get("/debug/memory", dependencies=[Depends(require_staff)])
+async def memory_stats(limit: int = 10, key_type: str = "lineno"):
+    """Process memory, approximate cache sizes and, while tracing, the top allocation sites"""
+    report = {
+        **memory_profiler.status(),
+        "process": process_memory(),
+        "caches": cache_sizes(tenant_registry.all(), rate_limiter),
+        "cart_bytes_budget": settings.CART_BYTES_BUDGET,
+    }
+    if memory_profiler.tracing:
+        try:
+            report["top"] = memory_profiler.top(limit, key_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return report
+
+
+@app.post("/debug/memory/start", dependencies=[Depends(require_staff)])
+async def start_memory_tracing(frames: int = 1):
+    """Start tracemalloc, recording `frames` (at most MAX_FRAMES) frames per allocation"""
+    memory_profiler.start(frames)
+    return memory_profiler.status()
+
+
+@app.post("/debug/memory/stop", dependencies=[Depends(require_staff)])
+async def stop_memory_tracing():
+    """Stop tracemalloc and drop its snapshots"""
+    memory_profiler.stop()
+    return memory_profiler.status()
+
+
+@app.post("/debug/memory/snapshots/{label}", dependencies=[Depends(require_staff)])
+async def take_memory_snapshot(label: str):
+    """Keep a tracemalloc snapshot to diff against later"""
+    try:
+        return memory_profiler.take(label)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/debug/memory/diff", dependencies=[Depends(require_staff)])
+async def memory_diff(base: str, label: Optional[str] = None, limit: int = 10, key_type: str = "lineno"):
+    """Allocation sites that grew most between snapshot `base` and `label` (or now)"""
+    try:
+        return {"base": base, "label": label, "top": memory_profiler.diff(base, label, limit, key_type)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Snapshot not found: {e.args[0]}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/debug/profiles")
+async def list_profiles():
+    """List dumped request profiles, newest first"""
+    return {
+        "enabled": settings.PROFILING_ENABLED,
+        "directory": profile_store.directory,
+        "profiles": profile_store.list_profiles()
+    }
+
+
+@app.get("/debug/profiles/{filename}")
+async def download_profile(filename: str):
+    """Download a .pstats or .folded profile file"""
+    file_path = profile_store.file_path(filename)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(file_path, filename=filename)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app", 
@@ -0,0 +1,231 @@
+"""
+Memory diagnostics behind /debug/memory
+tracemalloc can be started and stopped at runtime; named snapshots are kept
+so two points in time can be diffed by allocation site. Alongside that, the
+in-process caches (carts, menu bodies, kitchen board, ETA state, add-on
+co-occurrence counts, trace buffer, rate limit buckets, recent writes) and
+SQLAlchemy identity maps are sized, so a growing worker can be pinned on
+one of them.
+"""
+import gc
+import sys
+import threading
+import tracemalloc
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import recent_writes
+from tracing import tracer
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+KEY_TYPES = ("lineno", "filename", "traceback")
+
+# Deepest traceback recorded per allocation; each frame costs memory and time on every allocation
+MAX_FRAMES = 25
+
+# Allocations made by the profiler itself are left out of reports
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+# Sessions that have begun a transaction, until they are garbage collected
+_live_sessions: "weakref.WeakSet[Session]" = weakref.WeakSet()
+_live_sessions_lock = threading.Lock()
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _track_session(session: Session, transaction):
+    if transaction.parent is None:
+        with _live_sessions_lock:
+            _live_sessions.add(session)
+
+
+_ATOMIC = (str, bytes, bytearray, int, float, complex, bool, type(None))
+_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+
+
+def deep_size(obj: Any) -> int:
+    """
+    Rough deep size of a cache: containers and plain objects are followed,
+    objects reachable twice are counted once; modules, classes and
+    functions are not followed
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, _ATOMIC):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, _CONTAINERS):
+            stack.extend(current)
+        elif hasattr(current, "__slots__"):
+            stack.extend(getattr(current, name) for name in current.__slots__ if hasattr(current, name))
+        elif hasattr(current, "__dict__") and not isinstance(current, type) and not callable(current):
+            stack.extend(vars(current).values())
+    return total
+
+
+class MemoryProfiler:
+    """tracemalloc control with a few named snapshots"""
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        """Start tracing (restarting it if the frame depth changes); frames is clamped to 1..MAX_FRAMES"""
+        frames = min(max(1, frames), MAX_FRAMES)
+        if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+            tracemalloc.stop()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        """Stop tracing and drop the snapshots"""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def take(self, label: str) -> Dict[str, Any]:
+        """Keep a snapshot under a label (the oldest goes beyond max_snapshots)"""
+        snapshot = self._snapshot()
+        with self._lock:
+            self._snapshots[label] = snapshot
+            self._snapshots.move_to_end(label)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return {"label": label, "traced_bytes": sum(stat.size for stat in snapshot.statistics("filename"))}
+
+    def labels(self) -> List[str]:
+        with self._lock:
+            return list(self._snapshots)
+
+    def top(self, limit: int = 10, key_type: str = "lineno", label: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Largest allocation sites of a snapshot (or of now)"""
+        snapshot = self._get(label) if label else self._snapshot()
+        return [_stat(stat) for stat in snapshot.statistics(_key_type(key_type))[:limit]]
+
+    def diff(self, base: str, label: Optional[str] = None, limit: int = 10,
+             key_type: str = "lineno") -> List[Dict[str, Any]]:
+        """Allocation sites that grew most since the base snapshot"""
+        old = self._get(base)
+        new = self._get(label) if label else self._snapshot()
+        return [_stat(stat) for stat in new.compare_to(old, _key_type(key_type))[:limit]]
+
+    def status(self) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False, "snapshots": self.labels()}
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "snapshots": self.labels(),
+        }
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    def _get(self, label: str) -> tracemalloc.Snapshot:
+        with self._lock:
+            snapshot = self._snapshots.get(label)
+        if snapshot is None:
+            raise KeyError(label)
+        return snapshot
+
+
+def _key_type(key_type: str) -> str:
+    if key_type not in KEY_TYPES:
+        raise ValueError(f"key_type must be one of {', '.join(KEY_TYPES)}")
+    return key_type
+
+
+def _stat(stat) -> Dict[str, Any]:
+    entry = {
+        "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "bytes": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["bytes_diff"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+def process_memory() -> Dict[str, Any]:
+    """Peak resident set size and garbage collector state (without walking the heap)"""
+    info: Dict[str, Any] = {"gc_counts": list(gc.get_count()),
+                            "gc_collections": [generation["collections"] for generation in gc.get_stats()]}
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        info["max_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return info
+
+
+def cache_sizes(tenants: Iterable, rate_limiter=None) -> Dict[str, Any]:
+    """Approximate bytes held by each in-process cache"""
+    sizes: Dict[str, Any] = {"tenants": {}}
+    for tenant in tenants:
+        carts = tenant.carts
+        cart_bytes = carts.approximate_bytes()
+        sizes["tenants"][tenant.name] = {
+            "carts": {"entries": len(carts), "bytes": cart_bytes,
+                      "bytes_per_cart": round(cart_bytes / len(carts)) if len(carts) else None,
+                      "expired_notices_bytes": deep_size(carts._expired)},
+            "menu_bodies_bytes": deep_size(tenant.menu._bodies),
+            "kitchen_board_bytes": deep_size((tenant.kitchen._orders, tenant.kitchen._item_counts,
+                                              tenant.kitchen._encoded)),
+            "eta_bytes": deep_size((tenant.eta._entered, tenant.eta._stages)),
+            "recommender_bytes": deep_size(tenant.recommender._counts),
+        }
+    sizes["traces"] = {"entries": len(tracer), "bytes": deep_size(tracer._traces)}
+    sizes["recent_writes"] = {"entries": len(recent_writes._written), "bytes": deep_size(recent_writes._written)}
+    if rate_limiter is not None:
+        sizes["rate_limit_buckets"] = {
+            name: {"entries": len(buckets), "bytes": deep_size(buckets._buckets)}
+            for name, buckets in (("session_read", rate_limiter.session_read),
+                                  ("session_write", rate_limiter.session_write),
+                                  ("client_read", rate_limiter.client_read),
+                                  ("client_write", rate_limiter.client_write))
+        }
+    # A long-lived session keeps every object it loaded in its identity map;
+    # closing a session empties it
+    with _live_sessions_lock:
+        sessions = list(_live_sessions)
+    sizes["db_sessions"] = {
+        "live": len(sessions),
+        "identity_map_objects": sum(len(session.identity_map) for session in sessions),
+    }
+    return sizes
+
+
+# Process-wide profiler used by /debug/memory
+memory_profiler = MemoryProfiler()
@@ -0,0 +1,151 @@
+"""
+Pre-serialized menu for GET /menu
+The whole menu is loaded with one query and encoded once per category
+(plain and gzip, each with a strong ETag). Requests are answered from
+memory; a background refresh re-reads the menu table and only rebuilds
+the bodies when the rows actually changed.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models import MenuItem
+from schemas import MenuItemResponse
+
+
+ALL_CATEGORIES = "*"
+
+
+class EncodedBody:
+    """One pre-encoded representation of a menu body"""
+    __slots__ = ("body", "gzip_body", "etag", "gzip_etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        # Different bytes, so a different strong validator
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+class MenuCatalog:
+    """Versioned, pre-encoded menu bodies keyed by category"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+        self._bodies: Dict[str, EncodedBody] = {}
+        self.items: List[Tuple] = []   # (item_id, item_name, price, category, is_available) rows
+        self.version = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._fingerprint is not None
+
+    def refresh(self, db: Session) -> bool:
+        """Reload the menu table; rebuild bodies only if it changed. Returns True if rebuilt"""
+        rows = db.query(MenuItem.item_id, MenuItem.item_name, MenuItem.price,
+                        MenuItem.category, MenuItem.is_available).order_by(MenuItem.item_id).all()
+        items = [tuple(row) for row in rows]
+        fingerprint = hashlib.sha256(repr(items).encode("utf-8")).hexdigest()
+        if fingerprint == self._fingerprint:
+            return False
+        self._build(items, fingerprint)
+        return True
+
+    def _build(self, items: List[Tuple], fingerprint: str):
+        entries = [
+            MenuItemResponse(item_id=item_id, item_name=item_name, price=price,
+                             category=category, is_available=bool(is_available)).model_dump()
+            for item_id, item_name, price, category, is_available in items
+        ]
+
+        by_category: Dict[str, List[dict]] = {}
+        for entry in entries:
+            by_category.setdefault(entry["category"] or "", []).append(entry)
+        categories = sorted(name for name in by_category if name)
+
+        bodies = {ALL_CATEGORIES: EncodedBody(_encode({"categories": categories, "items": entries}))}
+        for name, category_items in by_category.items():
+            bodies[name.lower()] = EncodedBody(_encode({"category": name, "items": category_items}))
+
+        with self._lock:
+            self._bodies = bodies
+            self.items = items
+            self._fingerprint = fingerprint
+            self.version += 1
+
+    def get(self, category: Optional[str] = None) -> Optional[EncodedBody]:
+        """Encoded body for a category (case-insensitive) or the whole menu"""
+        key = category.strip().lower() if category else ALL_CATEGORIES
+        return self._bodies.get(key)
+
+    def invalidate(self):
+        """Force the next refresh to rebuild (after an in-process menu change)"""
+        self._fingerprint = None
+
+
+def _encode(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """True if an Accept-Encoding header allows gzip"""
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*"):
+            quality = params.strip()
+            if not quality.startswith("q="):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check (a weak W/ prefix is ignored, as the spec allows for GET)"""
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in tags)
+
+
+async def refresh_forever(catalog: MenuCatalog, session_factory: Callable[[], Session], interval: float,
+                          on_change: Optional[Callable[[List[Tuple]], None]] = None):
+    """
+    Background task: pick up menu changes made outside the server (e.g. db_utils.py)
+    on_change is called with the menu rows whenever the version moved, also
+    when a request rebuilt the bodies in between
+    The query and the rebuild run in a worker thread, off the event loop
+    """
+    def refresh() -> bool:
+        db = session_factory()
+        try:
+            return catalog.refresh(db)
+        finally:
+            db.close()
+
+    seen = catalog.version
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await run_in_threadpool(refresh):
+                print(f"✓ Menu changed, rebuilt menu bodies (version {catalog.version})")
+            if on_change is not None and catalog.version != seen:
+                seen = catalog.version
+                on_change(catalog.items)
+        except Exception as e:
+            print(f"Error refreshing menu: {str(e)}")
+
+
+# Process-wide catalog served by GET /menu
+menu_catalog = MenuCatalog()
@@ -0,0 +1,253 @@
+"""
+Application metrics in Prometheus text format
+Counters and histograms keep one cell per thread, so recording a value
+never takes a lock or contends with other threads; a scrape sums the
+cells. Gauges are computed by callbacks at scrape time.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadCells:
+    """A list of floats per thread; value(i) is the sum over threads"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0.0] * self._size
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            cells = list(self._cells)
+        totals = [0.0] * self._size
+        for cell in cells:
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+
+class _Metric:
+    """Common parts: name, help, label names and children per label values"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._unlabelled = self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_text(self, values: Tuple[str, ...], extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("_cells",)
+
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount: float = 1.0):
+        self._cells.cell()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {_number(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "_cells")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        # One count per bucket (+Inf last), then the sum
+        self._cells = _ThreadCells(len(upper_bounds) + 2)
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self._upper_bounds, value)] += 1
+        cell[-1] += value
+
+    def totals(self) -> List[float]:
+        return self._cells.totals()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._unlabelled.observe(value)
+
+    def _render_child(self, values, child):
+        totals = child.totals()
+        lines = []
+        cumulative = 0.0
+        for bound, count in zip(self.upper_bounds + (float("inf"),), totals[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            lines.append(f"{self.name}_bucket{self._label_text(values, [('le', le)])} {_number(cumulative)}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_number(totals[-1])}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {_number(cumulative)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Value computed at scrape time
+    The callback returns a number, or {label values tuple: number} for a
+    gauge with labels
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def set_function(self, callback: Callable[[], object]):
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.callback is None:
+            return lines
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {str(e)}")
+            return lines
+        if isinstance(value, dict):
+            for values, number in sorted(value.items()):
+                values = values if isinstance(values, tuple) else (values,)
+                lines.append(f"{self.name}{self._label_text(tuple(str(v) for v in values))} {_number(number)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+class Registry:
+    """Metrics exposed together on /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# Process-wide registry and the application's metrics
+registry = Registry()
+
+webhook_requests = registry.register(Counter(
+    "chatbot_webhook_requests_total", "Webhook turns handled, by intent", ["intent"]))
+webhook_errors = registry.register(Counter(
+    "chatbot_webhook_errors_total", "Webhook turns that raised an error, by intent", ["intent"]))
+webhook_latency = registry.register(Histogram(
+    "chatbot_webhook_duration_seconds", "Time to handle a webhook turn, by intent", ["intent"]))
+unmatched_menu_items = registry.register(Counter(
+    "chatbot_unmatched_menu_items_total", "Requested food items that matched no available menu item"))
+orders_placed = registry.register(Counter(
+    "chatbot_orders_placed_total", "Orders placed, by placement mode", ["mode"]))
+order_status_changes = registry.register(Counter(
+    "chatbot_order_status_changes_total", "Orders moved to a new status, by new status", ["status"]))
+checkout_failures = registry.register(Counter(
+    "chatbot_checkout_failures_total", "order.complete turns that placed no order, by reason", ["reason"]))
+orders_dead_lettered = registry.register(Counter(
+    "chatbot_orders_dead_lettered_total", "Write-behind orders that could not be written and went to the dead-letter file"))
+rate_limited = registry.register(Counter(
+    "chatbot_rate_limited_total", "Requests rejected by the rate limiter, by budget", ["kind"]))
+
+open_carts = registry.register(Gauge(
+    "chatbot_open_carts", "In-progress carts held in memory, by tenant", ["tenant"]))
+active_orders = registry.register(Gauge(
+    "chatbot_active_orders", "Active orders on the kitchen board, by tenant and status", ["tenant", "status"]))
+db_pool_connections = registry.register(Gauge(
+    "chatbot_db_pool_connections", "Database pool connections, by tenant and state", ["tenant", "state"]))
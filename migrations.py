@@ -0,0 +1,149 @@
+"""
+Versioned schema migrations
+Brings databases created by init_db() (SQLAlchemy models) and by
+database_setup.sql to the same schema. Each migration checks the live
+schema before changing it, so it is safe on a database that already has
+the change; applied versions are recorded in schema_migrations.
+
+Usage:
+  python migrations.py            # apply pending migrations
+  python migrations.py status     # list migrations and whether they are applied
+"""
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from models import Base, OrderEvent, OrderStatus, SchemaMigration
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def _index_names(conn: Connection, table: str) -> set:
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def _create_model_index(conn: Connection, table: str, name: str):
+    """Create an index declared on a model, if the table does not have it"""
+    if name in _index_names(conn, table):
+        return
+    index = next(index for index in Base.metadata.tables[table].indexes if index.name == name)
+    index.create(conn)
+
+
+def _drop_index(conn: Connection, table: str, name: str):
+    if name not in _index_names(conn, table):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        conn.execute(text(f"DROP INDEX {name}"))
+
+
+def add_order_customer_key(conn: Connection):
+    """orders.customer_key for order history and reorders"""
+    columns = {column["name"] for column in inspect(conn).get_columns("orders")}
+    if "customer_key" not in columns:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN customer_key VARCHAR(255) NULL"))
+
+
+def add_hot_path_indexes(conn: Connection):
+    """Indexes the request paths rely on, under the names database_setup.sql uses"""
+    _create_model_index(conn, "order_items", "idx_order_id")
+    _create_model_index(conn, "orders", "idx_order_status_date")
+    _create_model_index(conn, "orders", "idx_order_date")
+    _create_model_index(conn, "orders", "idx_order_customer_date")
+    _create_model_index(conn, "menu_items", "idx_category")
+    _create_model_index(conn, "menu_items", "idx_menu_available_name")
+    # Superseded by idx_order_status_date (older database_setup.sql)
+    _drop_index(conn, "orders", "idx_order_status")
+
+
+def store_status_values(conn: Connection):
+    """
+    Store order_status as the enum values ("Placed") like database_setup.sql,
+    not the member names ("PLACED") older init_db() databases hold
+    """
+    names = [status.name for status in OrderStatus]
+    values = [status.value for status in OrderStatus]
+    if conn.dialect.name == "mysql":
+        column = next(c for c in inspect(conn).get_columns("orders") if c["name"] == "order_status")
+        if list(getattr(column["type"], "enums", [])) == values:
+            return
+        # Widen the ENUM to both spellings, rewrite the rows, then narrow it
+        both = ", ".join(f"'{label}'" for label in dict.fromkeys(names + values))
+        conn.execute(text(f"ALTER TABLE orders MODIFY order_status ENUM({both}) NOT NULL DEFAULT 'Placed'"))
+    for status in OrderStatus:
+        conn.execute(text("UPDATE orders SET order_status = :value WHERE order_status = :name"),
+                     {"value": status.value, "name": status.name})
+    if conn.dialect.name == "mysql":
+        only_values = ", ".join(f"'{value}'" for value in values)
+        conn.execute(text(f"ALTER TABLE orders MODIFY order_status ENUM({only_values}) NOT NULL DEFAULT 'Placed'"))
+
+
+def add_order_events(conn: Connection):
+    """
+    order_events status log; existing orders get their placement event
+    (earlier transitions were never recorded)
+    """
+    OrderEvent.__table__.create(conn, checkfirst=True)
+    conn.execute(text(
+        "INSERT INTO order_events (order_id, order_status, ts) "
+        "SELECT order_id, :placed, order_date FROM orders "
+        "WHERE order_id NOT IN (SELECT order_id FROM order_events)"
+    ), {"placed": OrderStatus.PLACED.value})
+
+
+# Append only; never renumber or edit a released migration
+MIGRATIONS: List[Migration] = [
+    Migration(1, "add_order_customer_key", add_order_customer_key),
+    Migration(2, "add_hot_path_indexes", add_hot_path_indexes),
+    Migration(3, "store_status_values", store_status_values),
+    Migration(4, "add_order_events", add_order_events),
+]
+
+
+def applied_versions(engine: Engine) -> set:
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return set(conn.execute(select(SchemaMigration.version)).scalars())
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations in version order; returns the versions applied"""
+    applied = applied_versions(engine)
+    newly_applied = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        with engine.begin() as conn:
+            migration.upgrade(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=migration.version, name=migration.name, applied_at=datetime.utcnow()))
+        newly_applied.append(migration.version)
+        print(f"✓ Applied migration {migration.version}: {migration.name}")
+    return newly_applied
+
+
+def print_status(engine: Engine):
+    applied = applied_versions(engine)
+    for migration in MIGRATIONS:
+        state = "applied" if migration.version in applied else "pending"
+        print(f"{migration.version:>4}  {migration.name:<30} {state}")
+
+
+if __name__ == "__main__":
+    import sys
+    from database import engine
+
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        print_status(engine)
+    else:
+        Base.metadata.create_all(bind=engine)
+        applied = run_migrations(engine)
+        print(f"{len(applied)} migration(s) applied")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -17,18 +17,34 @@ class OrderStatus(enum.Enum):
     CANCELLED = "Cancelled"
 
 
+def _status_values(statuses):
+    """Store statuses as the enum values ("Placed", ...), as in database_setup.sql"""
+    return [status.value for status in statuses]
+
+
 class Order(Base):
     """Orders table model"""
     __tablename__ = "orders"
     
     order_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
-    order_status = Column(Enum(OrderStatus), default=OrderStatus.PLACED, nullable=False)
+    # Current status: the latest of the order's events (see OrderEvent)
+    order_status = Column(Enum(OrderStatus, values_callable=_status_values),
+                          default=OrderStatus.PLACED, nullable=False)
     order_date = Column(DateTime, default=datetime.utcnow, nullable=False)
     total_amount = Column(Float, default=0.0, nullable=False)
+    customer_key = Column(String(255), nullable=True)  # "user:<id>" or "session:<id>"
     
     # Relationship with order items
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     
+    # Kitchen dashboard scan (active statuses, oldest first) and counts per
+    # status, recent orders, and a customer's latest order (reorder)
+    __table_args__ = (
+        Index("idx_order_status_date", "order_status", "order_date"),
+        Index("idx_order_date", "order_date"),
+        Index("idx_order_customer_date", "customer_key", "order_date"),
+    )
+    
     def __repr__(self):
         return f"<Order(order_id={self.order_id}, status={self.order_status.value}, date={self.order_date})>"
 
@@ -46,10 +62,33 @@ class OrderItem(Base):
     # Relationship with orders
     order = relationship("Order", back_populates="items")
     
+    # Items of an order (tracking, kitchen board, reorder)
+    __table_args__ = (
+        Index("idx_order_id", "order_id"),
+    )
+    
     def __repr__(self):
         return f"<OrderItem(item_name={self.item_name}, quantity={self.quantity}, price={self.price})>"
 
 
+class OrderEvent(Base):
+    """Append-only log of order status transitions, placement included"""
+    __tablename__ = "order_events"
+    
+    event_id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id"), nullable=False)
+    order_status = Column(Enum(OrderStatus, values_callable=_status_values), nullable=False)
+    ts = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # An order's timeline is one range scan
+    __table_args__ = (
+        Index("idx_event_order_ts", "order_id", "ts"),
+    )
+    
+    def __repr__(self):
+        return f"<OrderEvent(order_id={self.order_id}, status={self.order_status.value}, ts={self.ts})>"
+
+
 class MenuItem(Base):
     """Menu items table for available food items"""
     __tablename__ = "menu_items"
@@ -60,5 +99,34 @@ class MenuItem(Base):
     category = Column(String(50))
     is_available = Column(Integer, default=1)  # 1 for available, 0 for unavailable
     
+    # Available item names without touching the table (fuzzy menu matching)
+    __table_args__ = (
+        Index("idx_category", "category"),
+        Index("idx_menu_available_name", "is_available", "item_name"),
+    )
+    
     def __repr__(self):
         return f"<MenuItem(item_name={self.item_name}, price={self.price})>"
+
+
+class IdBlock(Base):
+    """Hi/lo ID allocator state: next unreserved ID per sequence name"""
+    __tablename__ = "id_blocks"
+    
+    name = Column(String(50), primary_key=True)
+    next_value = Column(Integer, nullable=False)
+    
+    def __repr__(self):
+        return f"<IdBlock(name={self.name}, next_value={self.next_value})>"
+
+
+class SchemaMigration(Base):
+    """Versioned schema migrations applied to this database (see migrations.py)"""
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version}, name={self.name})>"
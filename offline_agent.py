@@ -0,0 +1,233 @@
+"""
+Offline stand-in for the Dialogflow agent
+Turns free-text utterances into the WebhookRequest payloads the real agent
+(DIALOGFLOW_INTENTS.md) would send to the webhook, without network access:
+intent display names with their context suffixes, food-item /
+food-item.original / number parameters, output contexts with lifespans,
+session paths and responseIds. Intents are matched with keyword rules over
+the intent list and food items with the menu names; everything random
+(responseIds, detection confidence) comes from a seeded generator, so the
+same conversation always produces the same payloads.
+
+Usage:
+  echo "I want 2 cheese burgers and a coke" | python offline_agent.py
+  python offline_agent.py --url http://localhost:8000 --session demo
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from quantity_parser import extract_quantities
+
+
+INTENT_NEW = "new.order"
+INTENT_ADD = "order.add - context: ongoing-order"
+INTENT_REMOVE = "order.remove - context: ongoing-order"
+INTENT_COMPLETE = "order.complete - context: ongoing-order"
+INTENT_TRACK = "track.order"
+INTENT_REORDER = "reorder"
+INTENT_HOURS = "store.hours"
+INTENT_FALLBACK = "Default Fallback Intent"
+
+ONGOING_ORDER = "ongoing-order"
+
+# Keyword rules, tried in order: (intent, pattern, required input context)
+_RULES = [
+    (INTENT_TRACK, r"\b(?:track|where is|where's|status of|check (?:on )?my order)\b", None),
+    (INTENT_REORDER, r"\b(?:same as last time|re-?order|my usual|the usual|repeat my (?:last|previous) order)\b", None),
+    (INTENT_HOURS, r"\b(?:hours|what time|open|close)\b", None),
+    (INTENT_COMPLETE, r"\b(?:that's it|that is it|that's all|that is all|place (?:my|the) order|complete|"
+                      r"done|confirm|check ?out)\b", ONGOING_ORDER),
+    (INTENT_REMOVE, r"\b(?:remove|take out|take off|delete|drop)\b", ONGOING_ORDER),
+    (INTENT_ADD, r"\b(?:add|also|another|more|plus)\b", ONGOING_ORDER),
+    (INTENT_NEW, r"\b(?:order|want|like|get|have|give me)\b", None),
+]
+_RULES = [(intent, re.compile(pattern, re.IGNORECASE), context) for intent, pattern, context in _RULES]
+
+# Output contexts set by each intent (name -> lifespan), as configured in the agent
+_OUTPUT_CONTEXTS = {
+    INTENT_NEW: {ONGOING_ORDER: 5},
+    INTENT_ADD: {ONGOING_ORDER: 5},
+    INTENT_REMOVE: {ONGOING_ORDER: 5},
+    INTENT_COMPLETE: {ONGOING_ORDER: 1},
+    INTENT_REORDER: {ONGOING_ORDER: 5},
+}
+
+_ITEM_INTENTS = (INTENT_NEW, INTENT_ADD, INTENT_REMOVE)
+
+# Words around food items that @sys.any would not pick up as an item
+_FILLER_WORDS = set("""
+    i i'd i'll id ill me my we us you can could would will please want like love get have give order
+    orders add also another more plus remove take out off delete drop the a an some of to from with
+    and or for just too it them that this one ones piece pieces portion portions serving servings
+    as well in on new start make im i'm
+""".split())
+_CHUNK = re.compile(r"[^,;.!?&+]+")
+_WORD = re.compile(r"[\w'-]+")
+
+
+def _is_item_word(word: str) -> bool:
+    return word.lower() not in _FILLER_WORDS and not extract_quantities(word)
+
+
+class OfflineAgent:
+    """Rule-based detect-intent for one agent (Dialogflow project) and menu"""
+
+    def __init__(self, menu_names: Sequence[str], project_id: str = "offline-agent", seed: Optional[int] = 0):
+        self.project_id = project_id
+        self.rng = random.Random(seed)
+        # Longest names first, so "Cheese Fries" is not read as "Cheese" + "Fries"
+        names = sorted({name.strip() for name in menu_names if name and name.strip()}, key=len, reverse=True)
+        self._menu_pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(name) for name in names) + r")(?:e?s)?\b", re.IGNORECASE
+        ) if names else None
+        # session ID -> {context name: remaining lifespan}
+        self._contexts: Dict[str, Dict[str, int]] = {}
+
+    def session_path(self, session_id: str) -> str:
+        return f"projects/{self.project_id}/agent/sessions/{session_id}"
+
+    def detect_intent(self, text: str, contexts: Dict[str, int]) -> Tuple[str, float]:
+        """(intent display name, confidence) for an utterance given the active contexts"""
+        for intent, pattern, required_context in _RULES:
+            if required_context is not None and required_context not in contexts:
+                continue
+            if pattern.search(text):
+                return intent, 1.0
+        # No keyword, but it names something on the menu ("two cheese burgers")
+        if self._menu_pattern is not None and self._menu_pattern.search(text):
+            return (INTENT_ADD if ONGOING_ORDER in contexts else INTENT_NEW), 0.8
+        return INTENT_FALLBACK, 1.0
+
+    def extract_food_items(self, text: str) -> List[str]:
+        """
+        Food item spans as @sys.any would return them, in utterance order:
+        menu names (optionally plural) first, then other runs of words that
+        are not fillers or quantities
+        """
+        spans: List[Tuple[int, str]] = []
+        masked = text
+        if self._menu_pattern is not None:
+            for match in self._menu_pattern.finditer(text):
+                spans.append((match.start(), match.group(0)))
+            # Same length, so offsets still line up; commas end a run of words
+            masked = self._menu_pattern.sub(lambda m: "," * len(m.group(0)), text)
+
+        for chunk in _CHUNK.finditer(masked):
+            run: List[str] = []
+            run_start = 0
+            for token in _WORD.finditer(chunk.group(0)):
+                word = token.group(0)
+                if _is_item_word(word):
+                    if not run:
+                        run_start = chunk.start() + token.start()
+                    run.append(word)
+                elif run:
+                    spans.append((run_start, " ".join(run)))
+                    run = []
+            if run:
+                spans.append((run_start, " ".join(run)))
+        spans.sort()
+        return [span for _, span in spans]
+
+    def extract_numbers(self, text: str) -> List[int]:
+        """@sys.number values: digits and number words, but not "a"/"an" """
+        return [value for value, start, end in extract_quantities(text)
+                if text[start:end].lower() not in ("a", "an")]
+
+    def request(self, session_id: str, text: str, user_id: Optional[str] = None) -> dict:
+        """Detect the intent of one utterance and build the WebhookRequest for it"""
+        contexts = self._contexts.setdefault(session_id, {})
+        intent, confidence = self.detect_intent(text, contexts)
+
+        parameters: Dict[str, object] = {}
+        if intent in _ITEM_INTENTS:
+            items = self.extract_food_items(text)
+            parameters["food-item"] = items
+            parameters["food-item.original"] = list(items)
+            if intent != INTENT_REMOVE:
+                parameters["number"] = self.extract_numbers(text)
+        elif intent == INTENT_TRACK:
+            numbers = self.extract_numbers(text)
+            parameters["number"] = numbers[-1] if numbers else ""
+
+        # Every active context loses one turn, then the intent sets its own
+        for name in list(contexts):
+            contexts[name] -= 1
+            if contexts[name] <= 0:
+                del contexts[name]
+        contexts.update(_OUTPUT_CONTEXTS.get(intent, {}))
+
+        session = self.session_path(session_id)
+        payload = {
+            "responseId": f"{self._uuid()}-{self.rng.getrandbits(32):08x}",
+            "queryResult": {
+                "queryText": text,
+                "parameters": parameters,
+                "allRequiredParamsPresent": True,
+                "fulfillmentMessages": [{"text": {"text": [""]}}],
+                "outputContexts": [
+                    {"name": f"{session}/contexts/{name}", "lifespanCount": lifespan, "parameters": parameters}
+                    for name, lifespan in contexts.items()
+                ],
+                "intent": {
+                    "name": f"projects/{self.project_id}/agent/intents/{uuid.uuid5(uuid.NAMESPACE_URL, intent)}",
+                    "displayName": intent,
+                },
+                "intentDetectionConfidence": round(confidence - self.rng.random() * 0.05, 4) if confidence < 1 else 1,
+                "languageCode": "en",
+            },
+            "originalDetectIntentRequest": {"source": "DIALOGFLOW_CONSOLE", "payload": {}},
+            "session": session,
+        }
+        if user_id is not None:
+            payload["originalDetectIntentRequest"]["payload"]["userId"] = user_id
+        return payload
+
+    def end_session(self, session_id: str):
+        """Forget a session's contexts"""
+        self._contexts.pop(session_id, None)
+
+    def _uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+
+def _menu_names(url: Optional[str]) -> List[str]:
+    if url:
+        import httpx
+        response = httpx.get(f"{url.rstrip('/')}/menu")
+        response.raise_for_status()
+        return [item["item_name"] for item in response.json()["items"]]
+    from init_db import build_sample_menu
+    return [item.item_name for item in build_sample_menu()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Turn utterances (one per line on stdin) into Dialogflow webhook requests")
+    parser.add_argument("--url", help="Post each request to this webhook and print the reply (menu is read from it too)")
+    parser.add_argument("--project", default="offline-agent", help="Dialogflow project ID in the session path")
+    parser.add_argument("--session", default="offline-session")
+    parser.add_argument("--user-id", help="Platform user ID sent in originalDetectIntentRequest")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    agent = OfflineAgent(_menu_names(args.url), args.project, args.seed)
+    for line in sys.stdin:
+        text = line.strip()
+        if not text:
+            continue
+        payload = agent.request(args.session, text, args.user_id)
+        if not args.url:
+            print(json.dumps(payload))
+            continue
+        import httpx
+        reply = httpx.post(f"{args.url.rstrip('/')}/", json=payload).json()
+        print(f"[{payload['queryResult']['intent']['displayName']}] {reply.get('fulfillmentText')}")
+
+
+if __name__ == "__main__":
+    main()
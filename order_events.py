@@ -0,0 +1,45 @@
+"""
+Order status event log
+Every status transition, placement included, is appended to order_events;
+orders.order_status keeps the current status as a compacted projection.
+Events are only ever inserted, never updated or deleted.
+"""
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.orm import Session
+
+from models import OrderEvent, OrderStatus
+
+
+# An order's events, oldest first: one range scan of idx_event_order_ts
+_TIMELINE = (
+    select(OrderEvent.order_status, OrderEvent.ts)
+    .where(OrderEvent.order_id == bindparam("order_id"))
+    .order_by(OrderEvent.ts, OrderEvent.event_id)
+)
+
+
+def append_events(db: Session, events: Iterable[Tuple[int, OrderStatus, datetime]]):
+    """
+    Add (order_id, status, ts) events to the session's transaction
+    A batch is one executemany (a multi-row INSERT with PyMySQL); the
+    caller commits
+    """
+    rows = [{"order_id": order_id, "order_status": status, "ts": ts} for order_id, status, ts in events]
+    if rows:
+        db.execute(insert(OrderEvent), rows)
+
+
+def append_event(db: Session, order_id: int, status: OrderStatus, ts: datetime = None):
+    append_events(db, [(order_id, status, ts or datetime.utcnow())])
+
+
+def timeline(db: Session, order_id: int) -> List[Tuple[OrderStatus, datetime]]:
+    """(status, ts) transitions of an order, oldest first"""
+    return [(row.order_status, row.ts) for row in db.execute(_TIMELINE, {"order_id": order_id})]
+
+
+def format_timeline(events: List[Tuple[OrderStatus, datetime]]) -> str:
+    return ", ".join(f"{status.value} {ts.strftime('%Y-%m-%d %H:%M:%S')}" for status, ts in events)
@@ -0,0 +1,464 @@
+"""
+Write-behind order placement
+Order IDs are reserved from the database in blocks (hi/lo), each placed order
+is appended to a local fsync'd log and acknowledged immediately, and a
+background writer drains the log into orders/order_items in batches.
+Every worker process has its own log (ORDER_LOG_PATH with the PID added),
+held under an exclusive lock. Orders left in the log by a crash are
+replayed on the next start, and logs of workers that are gone are adopted
+by the next worker to start. Orders that cannot be written go to a
+dead-letter file instead of holding back the ones after them.
+Tracking looks up orders still in other workers' logs through an index of
+those logs that only reads what was appended since the last lookup.
+"""
+import glob
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from database import use_primary
+from metrics import orders_dead_lettered
+from models import IdBlock, Order, OrderItem, OrderStatus
+from order_events import append_events
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+# Database unreachable or connection lost: the whole queue waits and retries.
+# Any other error is the record's own (bad row, duplicate key, bad JSON value)
+_TRANSIENT_ERRORS = (OperationalError, InterfaceError, DisconnectionError)
+
+
+def worker_log_path(log_path: str, pid: Optional[int] = None) -> str:
+    """One worker's log: data/order_log.jsonl -> data/order_log.<pid>.jsonl"""
+    root, ext = os.path.splitext(log_path)
+    return f"{root}.{pid or os.getpid()}{ext}"
+
+
+def dead_letter_path(log_path: str) -> str:
+    """data/order_log.jsonl -> data/order_log.dead.jsonl (shared, appended under a lock)"""
+    root, ext = os.path.splitext(log_path)
+    return f"{root}.dead{ext}"
+
+
+def worker_logs(log_path: str) -> List[str]:
+    """Every worker log next to ORDER_LOG_PATH, plus the log itself if an older version left it"""
+    root, ext = os.path.splitext(log_path)
+    pattern = re.compile(re.escape(root) + r"\.\d+" + re.escape(ext) + "$")
+    paths = sorted(path for path in glob.glob(glob.escape(root) + ".*" + ext) if pattern.match(path))
+    return ([log_path] if os.path.exists(log_path) else []) + paths
+
+
+def _lock(f, blocking: bool = False) -> bool:
+    """Exclusive advisory lock on an open file; False if another process holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _read_records(f) -> Iterator[Dict]:
+    for line in f:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Torn final write from a crash; the customer never got this ID
+            continue
+
+
+# Bytes at the start of a log kept to notice it was truncated and written again
+_HEAD_BYTES = 64
+
+
+class _LogIndex:
+    """Records of one other worker's log, read up to the last complete line"""
+    __slots__ = ("inode", "offset", "head", "records")
+
+    def __init__(self):
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.head = b""
+        self.records: Dict[int, Dict] = {}
+
+    def refresh(self, path: str):
+        """Read what was appended since the last refresh; start over if the log was rewritten"""
+        stat = os.stat(path)
+        if stat.st_ino == self.inode and stat.st_size == self.offset:
+            return
+        with open(path, "rb") as f:
+            head = f.read(min(self.offset, _HEAD_BYTES))
+            # Compacted (a new file), emptied, or emptied and appended to since
+            if stat.st_ino != self.inode or stat.st_size < self.offset or head != self.head[:len(head)]:
+                self.inode, self.offset, self.head, self.records = stat.st_ino, 0, b"", {}
+            f.seek(self.offset)
+            data = f.read()
+        # A line still being written is read on a later refresh
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.records[record["order_id"]] = record
+        if self.offset < _HEAD_BYTES:
+            self.head = (self.head + complete)[:_HEAD_BYTES]
+        self.offset += len(complete)
+
+
+class HiLoIdAllocator:
+    """
+    Hands out IDs from blocks reserved in the id_blocks table
+    One short transaction per block; IDs of a block left unused when the
+    process stops are skipped, never reused
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], block_size: int = 50, name: str = "orders"):
+        self._session_factory = session_factory
+        self.block_size = max(1, block_size)
+        self.name = name
+        self._lock = threading.Lock()
+        self._next = 0
+        self._hi = 0
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._next >= self._hi:
+                self._next, self._hi = self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve_block(self):
+        db = use_primary(self._session_factory())
+        try:
+            block = db.query(IdBlock).filter(IdBlock.name == self.name).with_for_update().first()
+            # Never hand out IDs below ones already used by synchronous placement
+            max_order_id = db.query(func.max(Order.order_id)).scalar() or 0
+            if block is None:
+                block = IdBlock(name=self.name, next_value=max_order_id + 1)
+                db.add(block)
+            start = max(block.next_value, max_order_id + 1)
+            block.next_value = start + self.block_size
+            db.commit()
+            return start, start + self.block_size
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class WriteBehindOrderQueue:
+    """
+    Durable queue of placed-but-not-yet-written orders
+    The in-memory pending map mirrors this worker's log so tracking can
+    answer for orders the writer has not flushed yet
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], log_path: str,
+                 allocator: HiLoIdAllocator, batch_size: int = 100,
+                 flush_interval: float = 0.5, compact_bytes: int = 1_048_576,
+                 pid: Optional[int] = None):
+        self._session_factory = session_factory
+        self.shared_log_path = log_path
+        self.log_path = worker_log_path(log_path, pid)
+        self.dead_letter_path = dead_letter_path(log_path)
+        self.allocator = allocator
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[int, Dict]" = OrderedDict()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._log = None
+        self._others_lock = threading.Lock()
+        self._others: Dict[str, _LogIndex] = {}
+
+    # ---- placement -------------------------------------------------------
+
+    def place(self, items: Dict[str, Dict], total_amount: float, customer_key: Optional[str] = None) -> int:
+        """Durably record an order and return its ID without touching the orders table"""
+        order_id = self.allocator.next_id()
+        record = {
+            "order_id": order_id,
+            "order_date": datetime.utcnow().isoformat(),
+            "total_amount": total_amount,
+            "customer_key": customer_key,
+            "items": [{"item_name": name, "quantity": details["quantity"], "price": details["price"]}
+                      for name, details in items.items()],
+        }
+        line = json.dumps(record) + "\n"
+
+        with self._lock:
+            self._log.write(line)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._pending[order_id] = record
+            backlog = len(self._pending)
+
+        if backlog >= self.batch_size:
+            self._wakeup.set()
+        return order_id
+
+    def get_pending(self, order_id: int) -> Optional[Dict]:
+        """Return the logged record of an order that is not in the database yet"""
+        return self._pending.get(order_id)
+
+    def find_logged(self, order_id: int) -> Optional[Dict]:
+        """
+        Record of an order in another worker's log (it may have been written
+        since; check the database first)
+        Each lookup stats the other logs and reads only what they gained since
+        """
+        with self._others_lock:
+            self._refresh_others()
+            for index in self._others.values():
+                record = index.records.get(order_id)
+                if record is not None:
+                    return record
+        return None
+
+    def latest_pending_for(self, customer_key: str) -> Optional[Dict]:
+        """Newest not-yet-written order of a customer in this worker"""
+        with self._lock:
+            for record in reversed(self._pending.values()):
+                if record.get("customer_key") == customer_key:
+                    return record
+        return None
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    # ---- lifecycle -------------------------------------------------------
+
+    def start(self):
+        """
+        Replay this worker's log, adopt logs of workers that are gone and
+        start the background writer
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        self._log = open(self.log_path, "a+", encoding="utf-8")
+        if not _lock(self._log):
+            self._log.close()
+            self._log = None
+            raise RuntimeError(f"Order log {self.log_path} is in use by another process")
+        self._log.seek(0)
+        for record in _read_records(self._log):
+            self._pending[record["order_id"]] = record
+        adopted = self._adopt_orphans()
+        self._compact(force=True)
+        self._writer = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self._writer.start()
+        print(f"✓ Write-behind order queue started on {self.log_path} "
+              f"({len(self._pending)} orders replayed, {adopted} adopted from stopped workers)")
+
+    def stop(self, timeout: float = 10.0):
+        """Drain what can be written and stop the writer"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join(timeout)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def flush(self) -> int:
+        """
+        Write pending orders to the database; returns how many left the queue
+        A batch that fails is retried one order at a time, so one bad order
+        goes to the dead-letter file and the rest are written
+        """
+        done_count = 0
+        while True:
+            with self._lock:
+                batch = list(self._pending.values())[:self.batch_size]
+            if not batch:
+                break
+            try:
+                self._write_batch(batch)
+            except _TRANSIENT_ERRORS:
+                raise
+            except Exception:
+                for record in batch:
+                    self._write_one(record)
+            with self._lock:
+                for record in batch:
+                    self._pending.pop(record["order_id"], None)
+            done_count += len(batch)
+        self._compact()
+        return done_count
+
+    def _write_one(self, record: Dict):
+        """Write a single order; dead-letter it if the order itself is the problem"""
+        try:
+            self._write_batch([record])
+        except _TRANSIENT_ERRORS:
+            raise
+        except Exception as e:
+            self._dead_letter(record, e)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Database unavailable: orders stay in the log and in memory;
+                # retry on the next tick
+                print(f"Error flushing queued orders: {str(e)}")
+                self._stopping.wait(self.flush_interval)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing queued orders on shutdown: {str(e)}")
+
+    # ---- database and log ------------------------------------------------
+
+    def _write_batch(self, batch: List[Dict]):
+        db = use_primary(self._session_factory())
+        try:
+            ids = [record["order_id"] for record in batch]
+            existing = {row[0] for row in db.query(Order.order_id).filter(Order.order_id.in_(ids))}
+            events = []
+            for record in batch:
+                if record["order_id"] in existing:
+                    continue  # Written before a crash, log not yet compacted
+                order_date = datetime.fromisoformat(record["order_date"])
+                db.add(Order(
+                    order_id=record["order_id"],
+                    order_status=OrderStatus.PLACED,
+                    order_date=order_date,
+                    total_amount=record["total_amount"],
+                    customer_key=record.get("customer_key"),
+                    items=[OrderItem(**item) for item in record["items"]]
+                ))
+                events.append((record["order_id"], OrderStatus.PLACED, order_date))
+            db.flush()
+            append_events(db, events)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _dead_letter(self, record: Dict, error: Exception):
+        """Append an unwritable order to the dead-letter file, with the error"""
+        entry = {"failed_at": datetime.utcnow().isoformat(), "error": f"{type(error).__name__}: {error}",
+                 "log_path": self.log_path, "record": record}
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            _lock(f, blocking=True)
+            f.write(json.dumps(entry, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        orders_dead_lettered.inc()
+        print(f"Order {record.get('order_id')} could not be written and was moved to "
+              f"{self.dead_letter_path}: {entry['error']}")
+
+    def _refresh_others(self):
+        """Bring the index of other workers' logs (read without their lock) up to date"""
+        paths = [path for path in worker_logs(self.shared_log_path)
+                 if os.path.abspath(path) != os.path.abspath(self.log_path)]
+        for path in set(self._others) - set(paths):
+            del self._others[path]      # Adopted by a worker that started since
+        for path in paths:
+            index = self._others.setdefault(path, _LogIndex())
+            try:
+                index.refresh(path)
+            except FileNotFoundError:
+                del self._others[path]  # Adopted meanwhile
+
+    def _adopt_orphans(self) -> int:
+        """
+        Take over the logs no live worker holds: their orders are appended to
+        this worker's log, then the orphan is removed
+        """
+        adopted = 0
+        if fcntl is None:
+            return adopted  # Without locks a live worker's log can't be told apart
+        for path in worker_logs(self.shared_log_path):
+            if os.path.abspath(path) == os.path.abspath(self.log_path):
+                continue
+            try:
+                orphan = open(path, "r", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with orphan:
+                # Held by a live worker, or already adopted and removed by another
+                if not _lock(orphan) or os.fstat(orphan.fileno()).st_nlink == 0:
+                    continue
+                records = [record for record in _read_records(orphan) if record["order_id"] not in self._pending]
+                for record in records:
+                    self._log.write(json.dumps(record) + "\n")
+                    self._pending[record["order_id"]] = record
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                os.remove(path)
+                adopted += len(records)
+        return adopted
+
+    def _compact(self, force: bool = False):
+        """Drop flushed orders from this worker's log once it is empty or large"""
+        with self._lock:
+            if self._log is None:
+                return
+            if not self._pending:
+                self._log.truncate(0)
+                self._log.seek(0)
+                return
+            if self._log.tell() < self.compact_bytes and not force:
+                return
+            # The new file is locked before it replaces the old one, so no
+            # starting worker can mistake it for an orphan
+            tmp_path = self.log_path + ".tmp"
+            tmp = open(tmp_path, "w", encoding="utf-8")
+            _lock(tmp, blocking=True)
+            for record in self._pending.values():
+                tmp.write(json.dumps(record) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.log_path)
+            self._log.close()
+            self._log = tmp
+
+
+# Active queue when ORDER_PLACEMENT_MODE is "write_behind", otherwise None
+active_queue: Optional[WriteBehindOrderQueue] = None
+
+
+def start_write_behind(session_factory: Callable[[], Session], log_path: str, block_size: int,
+                       batch_size: int, flush_interval: float) -> WriteBehindOrderQueue:
+    """Create, replay and start this worker's write-behind queue"""
+    global active_queue
+    allocator = HiLoIdAllocator(session_factory, block_size)
+    queue = WriteBehindOrderQueue(session_factory, log_path, allocator,
+                                  batch_size=batch_size, flush_interval=flush_interval)
+    queue.start()
+    active_queue = queue
+    return queue
+
+
+def stop_write_behind():
+    """Flush and stop the process-wide write-behind queue"""
+    global active_queue
+    if active_queue is not None:
+        active_queue.stop()
+        active_queue = None
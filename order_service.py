@@ -1,12 +1,85 @@
+import functools
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from models import Order, OrderItem, MenuItem, OrderStatus
 from datetime import datetime
+from order_events import append_event, format_timeline, timeline
+from database import recent_writes, use_primary
+from tenants import current_tenant, default_tenant
+from tracing import span
+from cart_store import EVICTED_CAPACITY
+from metrics import checkout_failures, order_status_changes, orders_placed, unmatched_menu_items
 
 
 # In-progress orders tracking (session-based storage)
+# Bounded by an idle TTL and an LRU cap so abandoned carts don't accumulate.
+# Each tenant has its own store (current_tenant().carts); this is the default one.
 # In production, use Redis or database for session management
-inprogress_orders: Dict[str, Dict] = {}
+inprogress_orders = default_tenant.carts
+
+CART_EXPIRED_MESSAGE = "Your previous cart expired after being idle for a while, so we started a new one."
+CART_EVICTED_MESSAGE = "We're very busy right now and couldn't keep your previous cart, so we started a new one."
+
+
+def cart_lost_message(reason: str) -> str:
+    """What to tell a customer whose cart was evicted (reason from consume_expired)"""
+    return CART_EVICTED_MESSAGE if reason == EVICTED_CAPACITY else CART_EXPIRED_MESSAGE
+
+
+# Read-only hot-path queries as prebuilt Core statements
+# They are built once, hit SQLAlchemy's compiled cache on every call and
+# return plain row tuples instead of identity-mapped ORM objects.
+# The ORM is used for writes only.
+_MENU_BY_NAME = (
+    select(MenuItem.item_name, MenuItem.price, MenuItem.is_available)
+    .where(MenuItem.item_name == bindparam("name"))
+    .limit(1)
+)
+_MENU_BY_NAME_ILIKE = (
+    select(MenuItem.item_name, MenuItem.price, MenuItem.is_available)
+    .where(MenuItem.item_name.ilike(bindparam("pattern")))
+    .limit(1)
+)
+_AVAILABLE_MENU_NAMES = select(MenuItem.item_name).where(MenuItem.is_available == 1)
+_ORDER_WITH_ITEMS = (
+    select(Order.order_status, Order.total_amount, Order.order_date,
+           OrderItem.item_name, OrderItem.quantity)
+    .outerjoin(OrderItem, OrderItem.order_id == Order.order_id)
+    .where(Order.order_id == bindparam("order_id"))
+    .order_by(OrderItem.item_id)
+)
+# Items of a customer's latest order: one range scan of idx_order_customer_date
+_LATEST_ORDER_ID = (
+    select(Order.order_id)
+    .where(Order.customer_key == bindparam("customer_key"))
+    .order_by(Order.order_date.desc(), Order.order_id.desc())
+    .limit(1)
+    .scalar_subquery()
+)
+_LATEST_ORDER_ITEMS = (
+    select(OrderItem.order_id, OrderItem.item_name, OrderItem.quantity)
+    .where(OrderItem.order_id == _LATEST_ORDER_ID)
+    .order_by(OrderItem.item_id)
+)
+# Current price of several items at once, available ones only
+_AVAILABLE_PRICES = (
+    select(MenuItem.item_name, MenuItem.price)
+    .where(MenuItem.item_name.in_(bindparam("names", expanding=True)), MenuItem.is_available == 1)
+)
+
+
+def _one_turn_per_session(func):
+    """
+    Run a cart operation holding the session's cart lock, so concurrent turns
+    of one session (e.g. offloaded to threads) can't lose updates or place
+    the same cart twice
+    """
+    @functools.wraps(func)
+    def wrapper(session_id: str, *args, **kwargs):
+        with current_tenant().carts.session_lock(session_id):
+            return func(session_id, *args, **kwargs)
+    return wrapper
 
 
 def get_menu_item_price(db: Session, item_name: str) -> Optional[float]:
@@ -14,23 +87,19 @@ def get_menu_item_price(db: Session, item_name: str) -> Optional[float]:
     Get price of a menu item from database with fuzzy matching
     """
     # First try exact match
-    menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
-    if menu_item and menu_item.is_available:
-        return menu_item.price
+    row = db.execute(_MENU_BY_NAME, {"name": item_name}).first()
+    if row and row.is_available:
+        return row.price
     
     # Try case-insensitive match
-    menu_item = db.query(MenuItem).filter(
-        MenuItem.item_name.ilike(item_name)
-    ).first()
-    if menu_item and menu_item.is_available:
-        return menu_item.price
+    row = db.execute(_MENU_BY_NAME_ILIKE, {"pattern": item_name}).first()
+    if row and row.is_available:
+        return row.price
     
     # Try partial match (e.g., "Chicken Pizza" contains "Pizza")
-    menu_item = db.query(MenuItem).filter(
-        MenuItem.item_name.ilike(f"%{item_name}%")
-    ).first()
-    if menu_item and menu_item.is_available:
-        return menu_item.price
+    row = db.execute(_MENU_BY_NAME_ILIKE, {"pattern": f"%{item_name}%"}).first()
+    if row and row.is_available:
+        return row.price
     
     return None
 
@@ -41,60 +110,70 @@ def find_menu_item_name(db: Session, item_name: str) -> Optional[str]:
     Returns the correct name from database
     """
     # First try exact match
-    menu_item = db.query(MenuItem).filter(MenuItem.item_name == item_name).first()
-    if menu_item and menu_item.is_available:
-        return menu_item.item_name
+    row = db.execute(_MENU_BY_NAME, {"name": item_name}).first()
+    if row and row.is_available:
+        return row.item_name
     
     # Try case-insensitive exact match
-    menu_item = db.query(MenuItem).filter(
-        MenuItem.item_name.ilike(item_name)
-    ).first()
-    if menu_item and menu_item.is_available:
-        return menu_item.item_name
+    row = db.execute(_MENU_BY_NAME_ILIKE, {"pattern": item_name}).first()
+    if row and row.is_available:
+        return row.item_name
     
     # Try matching individual words BEFORE partial match
     # (e.g., "chicken pizza" finds "BBQ Chicken Pizza" specifically)
     words = item_name.lower().split()
     if len(words) > 1:
-        # Build a query that checks if ALL words appear in the item name
-        all_items = db.query(MenuItem).filter(MenuItem.is_available == 1).all()
-        for item in all_items:
-            item_name_lower = item.item_name.lower()
+        # Check if ALL words appear in the item name
+        for name in db.execute(_AVAILABLE_MENU_NAMES).scalars():
+            item_name_lower = name.lower()
             # Check if all words from search term are in the menu item name
             if all(word in item_name_lower for word in words):
-                return item.item_name
+                return name
     
     # Try partial match as last resort (e.g., "Pizza" finds any pizza)
     # This is less specific so comes last
-    menu_item = db.query(MenuItem).filter(
-        MenuItem.item_name.ilike(f"%{item_name}%")
-    ).first()
-    if menu_item and menu_item.is_available:
-        return menu_item.item_name
+    row = db.execute(_MENU_BY_NAME_ILIKE, {"pattern": f"%{item_name}%"}).first()
+    if row and row.is_available:
+        return row.item_name
     
     return None
 
 
-def add_to_order(session_id: str, food_items: List[str], quantities: List[int], db: Session) -> str:
+@_one_turn_per_session
+def add_to_order(session_id: str, food_items: List[str], quantities: List[int], db: Session,
+                 menu_cache: Optional[Dict[str, Tuple[Optional[str], Optional[float]]]] = None) -> str:
     """
     Add items to in-progress order
+    menu_cache optionally memoizes (menu name, price) lookups across calls,
+    e.g. for every turn of a webhook batch
     """
-    if session_id not in inprogress_orders:
-        inprogress_orders[session_id] = {}
+    carts = current_tenant().carts
+    cart_expired = carts.consume_expired(session_id)
+    if session_id not in carts:
+        carts[session_id] = {}
     
-    current_order = inprogress_orders[session_id]
+    current_order = carts[session_id]
     
     for food_item, quantity in zip(food_items, quantities):
-        # Find the actual menu item name (with fuzzy matching)
-        actual_item_name = find_menu_item_name(db, food_item)
+        if menu_cache is not None and food_item in menu_cache:
+            actual_item_name, price = menu_cache[food_item]
+        else:
+            with span("menu.match", item=food_item):
+                # Find the actual menu item name (with fuzzy matching)
+                actual_item_name = find_menu_item_name(db, food_item)
+                
+                # Get price from database
+                price = get_menu_item_price(db, actual_item_name) if actual_item_name else None
+            
+            if menu_cache is not None:
+                menu_cache[food_item] = (actual_item_name, price)
         
         if actual_item_name is None:
+            unmatched_menu_items.inc()
             return f"Sorry, {food_item} is not available on our menu."
         
-        # Get price from database
-        price = get_menu_item_price(db, actual_item_name)
-        
         if price is None:
+            unmatched_menu_items.inc()
             return f"Sorry, {actual_item_name} is not available on our menu."
         
         # Add or update item in current order using the actual menu item name
@@ -110,18 +189,36 @@ def add_to_order(session_id: str, food_items: List[str], quantities: List[int],
     order_summary = ", ".join([f"{item}: {details['quantity']}" 
                                for item, details in current_order.items()])
     
-    return f"Added to your order: {order_summary}. Would you like to add more items or complete your order?"
+    response = f"Added to your order: {order_summary}. "
+    
+    # Most likely add-on, from what other customers ordered with these items
+    addon = current_tenant().recommender.suggest(list(current_order), k=1)
+    if addon:
+        addon_name, addon_price = addon[0]
+        response += f"Customers often add {addon_name} (${addon_price:.2f}) with that. "
+    
+    response += "Would you like to add more items or complete your order?"
+    
+    if cart_expired:
+        response = f"{cart_lost_message(cart_expired)} {response}"
+    
+    return response
 
 
+@_one_turn_per_session
 def remove_from_order(session_id: str, food_items: List[str], quantities: List[int] = None) -> str:
     """
     Remove items from in-progress order
     If quantities provided, reduce by that amount; otherwise remove completely
     """
-    if session_id not in inprogress_orders:
+    carts = current_tenant().carts
+    if session_id not in carts:
+        cart_expired = carts.consume_expired(session_id)
+        if cart_expired:
+            return f"{cart_lost_message(cart_expired)} Please add the items you'd like to order."
         return "You don't have any items in your order yet."
     
-    current_order = inprogress_orders[session_id]
+    current_order = carts[session_id]
     removed_items = []
     reduced_items = []
     not_found_items = []
@@ -194,80 +291,296 @@ def remove_from_order(session_id: str, food_items: List[str], quantities: List[i
     return response
 
 
-def complete_order(session_id: str, db: Session) -> str:
+def customer_key_for(session_id: str, user_id: Optional[str] = None) -> str:
+    """Key that links a customer's orders: the platform user ID if known, else the session"""
+    if user_id:
+        return f"user:{user_id}"
+    return f"session:{session_id}"
+
+
+def revalidate_cart(current_order: Dict[str, dict], db: Session) -> List[str]:
+    """
+    Bring cart lines up to date with the menu in one query
+    Items no longer available are removed and repriced items take the
+    current price; returns a description of each changed line
+    """
+    with span("menu.prices", items=len(current_order)):
+        prices = dict(db.execute(_AVAILABLE_PRICES, {"names": list(current_order)}).all())
+    
+    changes = []
+    for item_name, details in list(current_order.items()):
+        price = prices.get(item_name)
+        if price is None:
+            del current_order[item_name]
+            changes.append(f"{item_name} is no longer available and was removed")
+        elif price != details["price"]:
+            changes.append(f"{item_name} now costs ${price:.2f} (was ${details['price']:.2f})")
+            details["price"] = price
+    return changes
+
+
+@_one_turn_per_session
+def complete_order(session_id: str, db: Session, customer_key: Optional[str] = None) -> str:
     """
     Complete the order and save to database
+    customer_key links the order to the customer for reorders
+    (defaults to the session)
     """
-    if session_id not in inprogress_orders or not inprogress_orders[session_id]:
+    tenant = current_tenant()
+    carts = tenant.carts
+    customer_key = customer_key or customer_key_for(session_id)
+    if session_id not in carts or not carts[session_id]:
+        cart_expired = carts.consume_expired(session_id)
+        if cart_expired:
+            checkout_failures.labels("expired_cart").inc()
+            return f"{cart_lost_message(cart_expired)} Please add items before completing the order."
+        checkout_failures.labels("empty_cart").inc()
         return "Your order is empty. Please add items before completing the order."
     
-    current_order = inprogress_orders[session_id]
+    current_order = carts[session_id]
+    
+    # Prices and availability may have changed since items were added;
+    # read the menu from the primary so a just-made change is seen
+    use_primary(db)
+    changes = revalidate_cart(current_order, db)
+    if changes:
+        checkout_failures.labels("cart_changed").inc()
+        if not current_order:
+            del carts[session_id]
+            return (f"Sorry, your order could not be placed: {'; '.join(changes)}. "
+                    f"Please add items before completing the order.")
+        total_amount = sum(details["quantity"] * details["price"] for details in current_order.values())
+        order_details = ", ".join([f"{item}: {details['quantity']}" for item, details in current_order.items()])
+        return (f"Some items in your cart changed since you added them: {'; '.join(changes)}. "
+                f"Your cart is now: {order_details}. Total: ${total_amount:.2f}. "
+                f"Say 'complete order' again to place it.")
     
     # Calculate total amount
     total_amount = sum(details["quantity"] * details["price"] 
                        for details in current_order.values())
     
+    order_details = ", ".join([f"{item}: {details['quantity']}" 
+                               for item, details in current_order.items()])
+    
+    # Write-behind mode: log durably, reply now, let the background writer insert
+    queue = tenant.order_queue
+    if queue is not None:
+        try:
+            with span("order.place", mode="write_behind", items=len(current_order)):
+                order_id = queue.place(current_order, total_amount, customer_key)
+        except Exception:
+            checkout_failures.labels("error").inc()
+            raise
+        orders_placed.labels("write_behind").inc()
+        recent_writes.mark(f"session:{session_id}", f"order:{order_id}", f"customer:{customer_key}")
+        placed_at = datetime.utcnow()
+        tenant.kitchen.order_placed(order_id, placed_at,
+                                    [(item, details["quantity"]) for item, details in current_order.items()])
+        tenant.eta.order_placed(order_id, placed_at)
+        tenant.recommender.order_placed(current_order)
+        del carts[session_id]
+        return f"Your order has been placed successfully! Order ID: {order_id}. Total: ${total_amount:.2f}. Items: {order_details}"
+    
     # Create new order
     new_order = Order(
         order_status=OrderStatus.PLACED,
         order_date=datetime.utcnow(),
-        total_amount=total_amount
+        total_amount=total_amount,
+        customer_key=customer_key
     )
     
-    db.add(new_order)
-    db.flush()  # Get the order_id
+    try:
+        with span("order.place", mode="sync", items=len(current_order)):
+            db.add(new_order)
+            db.flush()  # Get the order_id
+            
+            # Add order items
+            for item_name, details in current_order.items():
+                order_item = OrderItem(
+                    order_id=new_order.order_id,
+                    item_name=item_name,
+                    quantity=details["quantity"],
+                    price=details["price"]
+                )
+                db.add(order_item)
+            append_event(db, new_order.order_id, OrderStatus.PLACED, new_order.order_date)
+            
+            db.commit()
+            db.refresh(new_order)
+    except Exception:
+        checkout_failures.labels("error").inc()
+        raise
+    orders_placed.labels("sync").inc()
+    
+    # Reads about this order/customer go to the primary until replicas catch up
+    recent_writes.mark(f"session:{session_id}", f"order:{new_order.order_id}", f"customer:{customer_key}")
+    tenant.kitchen.order_placed(new_order.order_id, new_order.order_date,
+                                [(item, details["quantity"]) for item, details in current_order.items()])
+    tenant.eta.order_placed(new_order.order_id, new_order.order_date)
+    tenant.recommender.order_placed(current_order)
     
-    # Add order items
-    for item_name, details in current_order.items():
-        order_item = OrderItem(
-            order_id=new_order.order_id,
-            item_name=item_name,
-            quantity=details["quantity"],
-            price=details["price"]
-        )
-        db.add(order_item)
+    # Clear the in-progress order
+    del carts[session_id]
     
-    db.commit()
-    db.refresh(new_order)
+    return f"Your order has been placed successfully! Order ID: {new_order.order_id}. Total: ${total_amount:.2f}. Items: {order_details}"
+
+
+@_one_turn_per_session
+def reorder_last_order(session_id: str, customer_key: str, db: Session) -> str:
+    """
+    Rebuild the cart from the customer's latest order
+    One query for the order's items and one batched availability and
+    price check; items are added at today's prices
+    """
+    tenant = current_tenant()
+    carts = tenant.carts
+    queue = tenant.order_queue
+    pending = queue.latest_pending_for(customer_key) if queue is not None else None
+    if pending is not None:
+        # Placed in write-behind mode and not written yet: the newest order
+        previous_items = [(item["item_name"], item["quantity"]) for item in pending["items"]]
+    else:
+        if recent_writes.contains(f"customer:{customer_key}"):
+            use_primary(db)
+        with span("order.latest", customer_key=customer_key):
+            rows = db.execute(_LATEST_ORDER_ITEMS, {"customer_key": customer_key}).all()
+        previous_items = [(row.item_name, row.quantity) for row in rows]
+    
+    if not previous_items:
+        return "I couldn't find a previous order to repeat. What would you like to order?"
+    
+    with span("menu.prices", items=len(previous_items)):
+        names = list({name for name, _ in previous_items})
+        prices = dict(db.execute(_AVAILABLE_PRICES, {"names": names}).all())
+    
+    cart_expired = carts.consume_expired(session_id)
+    if session_id not in carts:
+        carts[session_id] = {}
+    current_order = carts[session_id]
+    
+    unavailable = []
+    for item_name, quantity in previous_items:
+        price = prices.get(item_name)
+        if price is None:
+            unavailable.append(item_name)
+            continue
+        if item_name in current_order:
+            current_order[item_name]["quantity"] += quantity
+        else:
+            current_order[item_name] = {"quantity": quantity, "price": price}
     
-    # Clear the in-progress order
-    del inprogress_orders[session_id]
+    if not current_order:
+        del carts[session_id]
+        return (f"Sorry, none of the items from your last order are available right now "
+                f"({', '.join(unavailable)}). What would you like to order?")
     
-    order_details = ", ".join([f"{item}: {details['quantity']}" 
+    order_summary = ", ".join([f"{item}: {details['quantity']}" 
                                for item, details in current_order.items()])
+    response = f"I've added your last order to your cart: {order_summary}."
+    if unavailable:
+        response += f" Not available right now: {', '.join(unavailable)}."
+    response += " Would you like to add more items or complete your order?"
     
-    return f"Your order has been placed successfully! Order ID: {new_order.order_id}. Total: ${total_amount:.2f}. Items: {order_details}"
+    if cart_expired:
+        response = f"{cart_lost_message(cart_expired)} {response}"
+    
+    return response
+
+
+def _pending_order_details(tenant, order_id: int, record: Dict) -> str:
+    """Tracking reply for a write-behind order from its log record"""
+    item_details = ", ".join([f"{item['item_name']} (x{item['quantity']})" for item in record["items"]])
+    order_date = datetime.fromisoformat(record["order_date"])
+    return (f"Order ID: {order_id}\n"
+            f"Status: {OrderStatus.PLACED.value}\n"
+            f"Items: {item_details}\n"
+            f"Total Amount: ${record['total_amount']:.2f}\n"
+            f"Order Date: {order_date.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"Timeline: {format_timeline([(OrderStatus.PLACED, order_date)])}\n"
+            f"{tenant.eta.describe(OrderStatus.PLACED, order_date)}")
 
 
 def track_order(order_id: int, db: Session) -> str:
     """
     Track order status by order ID
     """
-    order = db.query(Order).filter(Order.order_id == order_id).first()
-    
-    if not order:
+    tenant = current_tenant()
+
+    # Orders placed in write-behind mode may not be in the database yet
+    queue = tenant.order_queue
+    pending = queue.get_pending(order_id) if queue is not None else None
+    if pending is not None:
+        return _pending_order_details(tenant, order_id, pending)
+    
+    if recent_writes.contains(f"order:{order_id}"):
+        use_primary(db)
+    
+    # Order and its items in one round trip, then its status timeline
+    with span("order.lookup", order_id=order_id):
+        rows = db.execute(_ORDER_WITH_ITEMS, {"order_id": order_id}).all()
+    
+    if not rows:
+        # Placed through another worker, whose writer has not flushed it yet
+        logged = queue.find_logged(order_id) if queue is not None else None
+        if logged is not None:
+            return _pending_order_details(tenant, order_id, logged)
         return f"Sorry, I couldn't find any order with ID: {order_id}"
     
-    # Get order items
-    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
-    
-    item_details = ", ".join([f"{item.item_name} (x{item.quantity})" for item in items])
+    with span("order.timeline", order_id=order_id):
+        events = timeline(db, order_id)
+    
+    order = rows[0]
+    item_details = ", ".join([f"{row.item_name} (x{row.quantity})" for row in rows if row.item_name is not None])
+    
+    response = (f"Order ID: {order_id}\n"
+                f"Status: {order.order_status.value}\n"
+                f"Items: {item_details}\n"
+                f"Total Amount: ${order.total_amount:.2f}\n"
+                f"Order Date: {order.order_date.strftime('%Y-%m-%d %H:%M:%S')}")
+    if events:
+        response += f"\nTimeline: {format_timeline(events)}"
+    # Time in the current status counts from its latest event
+    entered_at = events[-1][1] if events else order.order_date
+    estimate = tenant.eta.describe(order.order_status, entered_at)
+    if estimate:
+        response += f"\n{estimate}"
+    return response
+
+
+def set_order_status(order_id: int, new_status: OrderStatus, db: Session) -> Optional[Order]:
+    """
+    Update the status of a stored order and keep the kitchen board in sync
+    Returns None if the order does not exist
+    """
+    tenant = current_tenant()
+    use_primary(db)
+    order = db.query(Order).filter(Order.order_id == order_id).first()
+    if not order:
+        return None
     
-    return (f"Order ID: {order_id}\n"
-            f"Status: {order.order_status.value}\n"
-            f"Items: {item_details}\n"
-            f"Total Amount: ${order.total_amount:.2f}\n"
-            f"Order Date: {order.order_date.strftime('%Y-%m-%d %H:%M:%S')}")
+    changed_at = datetime.utcnow()
+    order.order_status = new_status
+    append_event(db, order_id, new_status, changed_at)
+    db.commit()
+    order_status_changes.labels(new_status.value).inc()
+    recent_writes.mark(f"order:{order_id}")
+    tenant.kitchen.status_changed(order_id, new_status)
+    tenant.eta.status_changed(order_id, new_status, changed_at)
+    return order
 
 
 def get_order_summary(session_id: str) -> str:
     """
     Get summary of current in-progress order
     """
-    if session_id not in inprogress_orders or not inprogress_orders[session_id]:
+    carts = current_tenant().carts
+    if session_id not in carts or not carts[session_id]:
+        cart_expired = carts.consume_expired(session_id)
+        if cart_expired:
+            return f"{cart_lost_message(cart_expired)} Your order is empty."
         return "Your order is empty."
     
-    current_order = inprogress_orders[session_id]
+    current_order = carts[session_id]
     total_amount = sum(details["quantity"] * details["price"] 
                        for details in current_order.values())
     
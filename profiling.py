@@ -0,0 +1,179 @@
+"""
+Opt-in request profiling
+Profiles one request in N (or any request carrying the profile header) with
+cProfile and dumps slow ones to a rotating directory as .pstats plus a
+collapsed-stack .folded file that flamegraph tools read directly.
+cProfile only sees the thread that enabled it: a profile covers everything
+on the event loop while the request is in flight (including coroutines of
+other requests that ran at its awaits) and nothing done in worker threads
+(sync endpoints, batch turns). Profile a quiet worker for clean results.
+"""
+import cProfile
+import os
+import pstats
+import re
+import time
+from datetime import datetime
+from itertools import count
+from typing import Dict, List, Optional, Tuple
+
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _func_label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        # Built-in, e.g. "<method 'execute' of 'sqlite3.Cursor' objects>"
+        return name
+    return f"{os.path.basename(filename)}:{name}:{line}"
+
+
+def collapsed_stacks(stats: pstats.Stats, max_depth: int = 64) -> List[str]:
+    """
+    Convert a cProfile call graph into collapsed stacks ("a;b;c <usec>")
+    cProfile keeps caller/callee edges, not full stacks, so time below a
+    function is split across its call paths in proportion to each edge
+    """
+    raw = stats.stats
+    callees: Dict[tuple, List[tuple]] = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    roots = [func for func, entry in raw.items() if not entry[4]]
+    totals: Dict[str, float] = {}
+
+    def walk(func, path, share):
+        _, _, self_time, cum_time, _ = raw[func]
+        path = path + [_func_label(func)]
+        key = ";".join(path)
+        totals[key] = totals.get(key, 0.0) + self_time * share
+        if len(path) >= max_depth:
+            return
+        for callee in callees.get(func, ()):
+            if _func_label(callee) in path:
+                continue  # Recursion: already accounted on this path
+            callee_cum = raw[callee][3]
+            edge_cum = raw[callee][4][func][3]
+            if callee_cum > 0 and edge_cum > 0:
+                walk(callee, path, share * edge_cum / callee_cum)
+
+    for root in roots:
+        walk(root, [], 1.0)
+
+    return [f"{stack} {int(seconds * 1_000_000)}"
+            for stack, seconds in totals.items() if seconds * 1_000_000 >= 1]
+
+
+class ProfileStore:
+    """Directory of dumped profiles, keeping only the newest max_files"""
+
+    def __init__(self, directory: str, max_files: int = 50):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, profiler: cProfile.Profile, method: str, path: str, elapsed_ms: float) -> str:
+        """Write .pstats and .folded files for one request and rotate old ones"""
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        route = _UNSAFE_CHARS.sub("_", path.strip("/")) or "root"
+        name = f"{stamp}_{method}_{route}_{int(elapsed_ms)}ms"
+        base = os.path.join(self.directory, name)
+
+        profiler.dump_stats(base + ".pstats")
+        stats = pstats.Stats(profiler)
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            f.write("\n".join(collapsed_stacks(stats)) + "\n")
+
+        self._rotate()
+        return name
+
+    def _rotate(self):
+        profiles = sorted(self._names())
+        for name in profiles[:-self.max_files] if self.max_files > 0 else []:
+            for ext in (".pstats", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, name + ext))
+                except FileNotFoundError:
+                    pass
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [f[:-len(".pstats")] for f in os.listdir(self.directory) if f.endswith(".pstats")]
+
+    def list_profiles(self) -> List[Dict]:
+        """Newest first, with the request latency parsed from the name"""
+        profiles = []
+        for name in sorted(self._names(), reverse=True):
+            pstats_path = os.path.join(self.directory, name + ".pstats")
+            try:
+                created = os.path.getmtime(pstats_path)
+            except FileNotFoundError:
+                continue
+            latency = name.rsplit("_", 1)[-1]
+            profiles.append({
+                "name": name,
+                "latency_ms": int(latency[:-2]) if latency.endswith("ms") and latency[:-2].isdigit() else None,
+                "created": datetime.utcfromtimestamp(created).isoformat() + "Z",
+                "files": [name + ".pstats", name + ".folded"],
+            })
+        return profiles
+
+    def file_path(self, filename: str) -> Optional[str]:
+        """Resolve a profile file name inside the store, rejecting anything else"""
+        if os.path.basename(filename) != filename or not filename.endswith((".pstats", ".folded")):
+            return None
+        full_path = os.path.join(self.directory, filename)
+        return full_path if os.path.isfile(full_path) else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles sampled requests
+    Unsampled requests only pay for a counter increment and a header scan;
+    install it only when profiling is enabled so the default path pays nothing.
+    Profiles are of the event loop thread (see the module docstring)
+    """
+
+    def __init__(self, app, store: ProfileStore, sample_every: int = 0,
+                 header: str = "X-Profile", threshold_ms: float = 500.0):
+        self.app = app
+        self.store = store
+        self.sample_every = sample_every
+        self.header = header.lower().encode("latin-1")
+        self.threshold_ms = threshold_ms
+        self._counter = count(1)
+        # cProfile can only observe one request at a time per thread
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active:
+            await self.app(scope, receive, send)
+            return
+
+        forced = any(name == self.header and value not in (b"", b"0")
+                     for name, value in scope.get("headers", ()))
+        sampled = self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+        if not (forced or sampled):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = cProfile.Profile()
+        self._active = True
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.disable()
+            self._active = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            # An explicitly requested profile is always kept
+            if forced or elapsed_ms >= self.threshold_ms:
+                try:
+                    name = self.store.save(profiler, scope.get("method", ""), scope.get("path", ""), elapsed_ms)
+                    print(f"Profiled {scope.get('method')} {scope.get('path')} in {elapsed_ms:.1f}ms -> {name}")
+                except OSError as e:
+                    print(f"Error writing profile: {str(e)}")
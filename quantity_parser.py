@@ -0,0 +1,119 @@
+"""
+Quantity extraction for order utterances
+One precompiled pattern finds number words and digits in the query text;
+quantities are then aligned to the position of each food item, so
+"remove two burgers and three cokes" gives burgers -> 2, cokes -> 3.
+Shared by the add and remove intents.
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'single': 1,
+    'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+    'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14, 'fifteen': 15,
+    'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19, 'twenty': 20,
+    'a couple of': 2, 'couple of': 2, 'a pair of': 2, 'pair of': 2,
+    'a dozen': 12, 'dozen': 12, 'half a dozen': 6, 'half dozen': 6,
+}
+
+# Longest phrases first so "a couple of" wins over "a"
+_QUANTITY_PATTERN = re.compile(
+    r'\b(?:(\d+)|(' + '|'.join(re.escape(word) for word in sorted(NUMBER_WORDS, key=len, reverse=True)) + r'))\b',
+    re.IGNORECASE
+)
+
+
+def extract_quantities(text: str) -> List[Tuple[int, int, int]]:
+    """All quantities in text as (value, start, end), in order of appearance; "0" is not a quantity"""
+    quantities = []
+    for match in _QUANTITY_PATTERN.finditer(text):
+        digits, word = match.groups()
+        value = int(digits) if digits else NUMBER_WORDS[word.lower()]
+        if value < 1:
+            continue
+        quantities.append((value, match.start(), match.end()))
+    return quantities
+
+
+def _find_item_spans(text_lower: str, food_items: Sequence[str]) -> List[Optional[Tuple[int, int]]]:
+    """Position of each food item in the text, without two items claiming the same span"""
+    spans: List[Optional[Tuple[int, int]]] = []
+    claimed: List[Tuple[int, int]] = []
+    for item in food_items:
+        needle = item.lower().strip()
+        span = None
+        start = text_lower.find(needle) if needle else -1
+        while start != -1:
+            end = start + len(needle)
+            if not any(start < c_end and c_start < end for c_start, c_end in claimed):
+                span = (start, end)
+                claimed.append(span)
+                break
+            start = text_lower.find(needle, start + 1)
+        spans.append(span)
+    return spans
+
+
+def align_quantities(query_text: str, food_items: Sequence[str]) -> List[Optional[int]]:
+    """
+    Quantity for each food item, or None where the utterance gives none
+    A quantity belongs to the next item after it: the last number between
+    the previous item and this one ("two burgers and three cokes")
+    """
+    if not query_text or not food_items:
+        return [None] * len(food_items)
+
+    quantities = extract_quantities(query_text)
+    spans = _find_item_spans(query_text.lower(), food_items)
+    result: List[Optional[int]] = [None] * len(food_items)
+    if not quantities:
+        return result
+
+    ordered = sorted((span[0], span[1], index) for index, span in enumerate(spans) if span is not None)
+    previous_end = 0
+    for start, end, index in ordered:
+        for value, q_start, q_end in quantities:
+            if q_start >= previous_end and q_end <= start:
+                result[index] = value
+        previous_end = end
+
+    # A single item that the text didn't name verbatim ("remove 2 of them")
+    if len(food_items) == 1 and spans[0] is None and len(quantities) == 1:
+        result[0] = quantities[0][0]
+
+    return result
+
+
+def quantities_for_add(query_text: str, food_items: Sequence[str], numbers: Sequence) -> List[int]:
+    """
+    Quantities to add: aligned from the utterance (1 where an item has none),
+    else Dialogflow's number parameter padded with 1s
+    """
+    aligned = align_quantities(query_text, food_items)
+    if any(quantity is not None for quantity in aligned):
+        return [quantity if quantity is not None else 1 for quantity in aligned]
+
+    if not isinstance(numbers, (list, tuple)):
+        numbers = [numbers] if numbers not in (None, "") else []
+    quantities = []
+    for number in numbers[:len(food_items)]:
+        try:
+            quantities.append(max(1, int(float(number))))
+        except (TypeError, ValueError):
+            quantities.append(1)
+    quantities.extend([1] * (len(food_items) - len(quantities)))
+    return quantities
+
+
+def quantities_for_remove(query_text: str, food_items: Sequence[str]) -> Optional[List[Optional[int]]]:
+    """
+    Quantities to remove per item; None for an item (or for the whole list)
+    means remove it completely
+    """
+    aligned = align_quantities(query_text, food_items)
+    if all(quantity is None for quantity in aligned):
+        return None
+    return aligned
@@ -0,0 +1,135 @@
+"""
+In-memory token-bucket rate limiting
+Each key (a Dialogflow session or a client IP) owns one bucket per budget,
+stored as [tokens, last_refill]. Buckets are refilled lazily when checked,
+so a check is O(1); buckets are kept in last-use order and a periodic
+cleanup drops the ones that have refilled completely (forgetting a full
+bucket changes nothing).
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+
+class TokenBuckets:
+    """Buckets for one budget: rate tokens per second, at most burst tokens"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        # key -> [tokens, last_refill], least recently used first
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refilled(self, key: str, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[key] = bucket
+            while self.max_keys > 0 and len(self._buckets) > self.max_keys:
+                # Forgetting a bucket only makes its key's next check lenient
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _wait_time(self, bucket: list, cost: float) -> float:
+        return max(0.0, (cost - bucket[0]) / self.rate)
+
+    def cleanup(self, now: float) -> int:
+        """Drop buckets that would be full by now; returns how many were dropped"""
+        full_after = self.burst / self.rate
+        dropped = 0
+        while self._buckets:
+            key, (_, last_refill) = next(iter(self._buckets.items()))
+            if now - last_refill < full_after:
+                break
+            del self._buckets[key]
+            dropped += 1
+        return dropped
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """
+    Separate read and write budgets per session and per client IP
+    A request is allowed only if every bucket it draws from has a token,
+    and then it takes one from each
+    """
+
+    def __init__(self, session_read: TokenBuckets, session_write: TokenBuckets,
+                 client_read: TokenBuckets, client_write: TokenBuckets,
+                 clock: Callable[[], float] = time.monotonic):
+        self.session_read = session_read
+        self.session_write = session_write
+        self.client_read = client_read
+        self.client_write = client_write
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+
+    def check(self, session_id: Optional[str], client_ip: Optional[str], write: bool = False,
+              cost: float = 1.0) -> Optional[float]:
+        """None if the request may proceed, else seconds until it would be allowed"""
+        targets: List[Tuple[TokenBuckets, str]] = []
+        if session_id:
+            targets.append((self.session_write if write else self.session_read, session_id))
+        if client_ip:
+            targets.append((self.client_write if write else self.client_read, client_ip))
+        targets = [(buckets, key) for buckets, key in targets if buckets.enabled]
+        if not targets:
+            return None
+
+        now = self._clock()
+        with self._lock:
+            buckets = [(budget, budget._refilled(key, now)) for budget, key in targets]
+            wait = max(budget._wait_time(bucket, cost) for budget, bucket in buckets)
+            if wait > 0:
+                self.throttled += 1
+                return wait
+            for _, bucket in buckets:
+                bucket[0] -= cost
+            self.allowed += 1
+            return None
+
+    def cleanup(self) -> int:
+        """Drop idle buckets from every budget"""
+        now = self._clock()
+        with self._lock:
+            return sum(budget.cleanup(now) for budget in self._budgets() if budget.enabled)
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "tracked_keys": {
+                "session_read": len(self.session_read),
+                "session_write": len(self.session_write),
+                "client_read": len(self.client_read),
+                "client_write": len(self.client_write),
+            },
+        }
+
+    def _budgets(self) -> List[TokenBuckets]:
+        return [self.session_read, self.session_write, self.client_read, self.client_write]
+
+
+async def cleanup_forever(limiter: RateLimiter, interval: float):
+    """Background task: forget buckets of sessions and clients that went quiet"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            limiter.cleanup()
+        except Exception as e:
+            print(f"Error cleaning up rate limit buckets: {str(e)}")
@@ -0,0 +1,209 @@
+"""
+Add-on suggestions from items ordered together
+Keeps an item x item co-occurrence matrix over order_items, indexed by
+menu item_id: cell [a, b] counts the orders that contained both a and b
+(the diagonal counts the orders containing a). On startup it is rebuilt
+from order history in one vectorized pass (B.T @ B over an orders x items
+incidence matrix, block by block) when NumPy is installed; every placed
+order then bumps its cells in place. A suggestion adds up the rows of the
+items in the cart and picks the best available item not already in it.
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+
+from models import MenuItem, Order, OrderItem
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional speedup
+    np = None
+
+
+# Items of orders placed since a cutoff: idx_order_date, then idx_order_id
+_ITEMS_SINCE = (
+    select(OrderItem.order_id, OrderItem.item_name)
+    .join(Order, Order.order_id == OrderItem.order_id)
+    .where(Order.order_date >= bindparam("since"))
+    .order_by(OrderItem.order_id)
+)
+_MENU = select(MenuItem.item_id, MenuItem.item_name, MenuItem.price, MenuItem.category, MenuItem.is_available)
+
+# Orders per incidence block during a rebuild; bounds its memory and keeps
+# float32 block counts exact
+_BLOCK_ORDERS = 10000
+
+
+class Recommender:
+    """Co-occurrence counts of menu items and the menu they are indexed by"""
+
+    def __init__(self, min_count: int = 2):
+        self.min_count = min_count     # Orders together before an item is suggested
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._prices: Dict[int, float] = {}
+        self._available = _new_vector(0)
+        self._counts = _new_matrix(0)
+        self.orders = 0
+
+    # ---- menu ------------------------------------------------------------
+
+    def menu_changed(self, items: Iterable[Tuple]):
+        """
+        Take names, prices and availability from menu rows
+        (item_id, item_name, price, category, is_available), as loaded by
+        MenuCatalog; grows the matrix for new item IDs
+        """
+        items = list(items)
+        size = max((item_id for item_id, *_ in items), default=-1) + 1
+        available = _new_vector(max(size, len(self._available)))
+        for item_id, _, _, _, is_available in items:
+            available[item_id] = bool(is_available)
+        with self._lock:
+            self._ids = {item_name: item_id for item_id, item_name, *_ in items}
+            self._names = {item_id: item_name for item_id, item_name, *_ in items}
+            self._prices = {item_id: price for item_id, _, price, _, _ in items}
+            self._available = available
+            if size > len(self._counts):
+                self._counts = _grow(self._counts, size)
+
+    # ---- updates ---------------------------------------------------------
+
+    def order_placed(self, item_names: Iterable[str]):
+        """Count one order's items as ordered together"""
+        with self._lock:
+            ids = sorted({self._ids[name] for name in item_names if name in self._ids})
+            if not ids:
+                return
+            if np is not None:
+                self._counts[np.ix_(ids, ids)] += 1
+            else:
+                for a in ids:
+                    row = self._counts[a]
+                    for b in ids:
+                        row[b] += 1
+            self.orders += 1
+
+    def load(self, db: Session, since: datetime) -> int:
+        """
+        Rebuild the menu and the counts from orders placed since a cutoff
+        Returns the number of orders read
+        """
+        self.menu_changed(db.execute(_MENU).all())
+        rows = db.execute(_ITEMS_SINCE, {"since": since}).all()
+        with self._lock:
+            ids = self._ids
+            pairs = [(row.order_id, ids[row.item_name]) for row in rows if row.item_name in ids]
+            counts, orders = _count_pairs(pairs, len(self._counts))
+            self._counts, self.orders = counts, orders
+        return orders
+
+    # ---- lookups ---------------------------------------------------------
+
+    def suggest(self, cart_items: Sequence[str], k: int = 1) -> List[Tuple[str, float]]:
+        """
+        Up to k (item name, price) add-ons for a cart, best first: available,
+        not in the cart, ordered with its items at least min_count times
+        """
+        with self._lock:
+            ids = [self._ids[name] for name in cart_items if name in self._ids]
+            if not ids:
+                return []
+            if np is not None:
+                scores = self._counts[ids].sum(axis=0)
+                scores[ids] = 0
+                scores[~self._available] = 0
+                candidates = np.flatnonzero(scores >= max(self.min_count, 1))
+                if len(candidates) > k:
+                    candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+                best = sorted(candidates.tolist(), key=lambda item_id: (-scores[item_id], item_id))
+            else:
+                scores = [sum(column) for column in zip(*(self._counts[item_id] for item_id in ids))]
+                in_cart = set(ids)
+                best = heapq.nsmallest(k, (
+                    (-score, item_id) for item_id, score in enumerate(scores)
+                    if score >= max(self.min_count, 1) and item_id not in in_cart and self._available[item_id]
+                ))
+                best = [item_id for _, item_id in best]
+            return [(self._names[item_id], self._prices[item_id]) for item_id in best[:k] if item_id in self._names]
+
+    def related(self, item_name: str, k: int = 5) -> Optional[List[Dict[str, object]]]:
+        """Items most often ordered with one item (None if it's not on the menu)"""
+        with self._lock:
+            item_id = self._ids.get(item_name)
+            if item_id is None:
+                return None
+            row = [int(count) for count in self._counts[item_id]]
+            names = self._names
+        together = [(count, other) for other, count in enumerate(row) if other != item_id and count and other in names]
+        return [{"item_name": names[other], "orders_together": count}
+                for count, other in heapq.nlargest(k, together)]
+
+
+def _new_vector(size: int):
+    return np.zeros(size, dtype=bool) if np is not None else [False] * size
+
+
+def _new_matrix(size: int):
+    return np.zeros((size, size), dtype=np.int32) if np is not None else [[0] * size for _ in range(size)]
+
+
+def _grow(counts, size: int):
+    if np is not None:
+        grown = np.zeros((size, size), dtype=np.int32)
+        grown[:len(counts), :len(counts)] = counts
+        return grown
+    for row in counts:
+        row.extend([0] * (size - len(row)))
+    counts.extend([0] * size for _ in range(size - len(counts)))
+    return counts
+
+
+def _count_pairs(pairs: Sequence[Tuple[int, int]], size: int):
+    """
+    Co-occurrence matrix and order count from (order_id, item_id) pairs
+    sorted by order_id
+    """
+    if np is None or not pairs:
+        counts = _new_matrix(size)
+        orders = 0
+        index = 0
+        while index < len(pairs):
+            order_id = pairs[index][0]
+            ids = set()
+            while index < len(pairs) and pairs[index][0] == order_id:
+                ids.add(pairs[index][1])
+                index += 1
+            for a in ids:
+                row = counts[a]
+                for b in ids:
+                    row[b] += 1
+            orders += 1
+        return counts, orders
+
+    order_ids = np.fromiter((order_id for order_id, _ in pairs), dtype=np.int64, count=len(pairs))
+    item_ids = np.fromiter((item_id for _, item_id in pairs), dtype=np.int64, count=len(pairs))
+    # Row of each pair in the orders x items incidence matrix
+    _, rows = np.unique(order_ids, return_inverse=True)
+    orders = int(rows.max()) + 1
+    counts = np.zeros((size, size), dtype=np.int64)
+    for start in range(0, orders, _BLOCK_ORDERS):
+        in_block = (rows >= start) & (rows < start + _BLOCK_ORDERS)
+        block = np.zeros((min(_BLOCK_ORDERS, orders - start), size), dtype=np.float32)
+        block[rows[in_block] - start, item_ids[in_block]] = 1.0
+        counts += (block.T @ block).astype(np.int64)
+    return counts.astype(np.int32), orders
+
+
+# The default tenant's recommender, fed by order_service and rebuilt on startup
+recommender = Recommender()
+
+
+def rebuild_recent(target: Recommender, db: Session, days: float) -> int:
+    """Rebuild a recommender from the last `days` of orders"""
+    return target.load(db, datetime.utcnow() - timedelta(days=days))
@@ -70,6 +70,10 @@ class OrderResponse(OrderBase):
         from_attributes = True
 
 
+class OrderStatusUpdate(BaseModel):
+    order_status: OrderStatusEnum
+
+
 # Dialogflow Webhook Schemas
 class DialogflowParameter(BaseModel):
     """Parameters extracted from Dialogflow intent"""
@@ -96,6 +100,20 @@ class DialogflowRequest(BaseModel):
     session: str
 
 
+class DialogflowTurn(BaseModel):
+    """
+    Slim view of a webhook request holding only the fields the handlers read
+    Built by fast_json from the decoded body; everything else in the
+    payload (outputContexts, originalDetectIntentRequest, ...) is skipped
+    """
+    intent: str
+    parameters: Dict[str, Any] = {}
+    queryText: str = ""
+    session: str = ""
+    responseId: Optional[str] = None
+    userId: Optional[str] = None  # From originalDetectIntentRequest.payload, when the platform sends one
+
+
 class DialogflowResponse(BaseModel):
     """Response to send back to Dialogflow"""
     fulfillmentText: str
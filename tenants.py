@@ -0,0 +1,170 @@
+"""
+Tenants: restaurant branches served from one deployment
+A tenant bundles everything that used to be process-wide: a database
+engine with its own connection pool, the menu catalog, the cart store,
+the kitchen board, the ETA statistics and the add-on recommender. The default tenant is the
+original single-restaurant setup (primary database, read replicas,
+write-behind placement). Other tenants come from TENANT_DATABASE_URLS and
+TENANT_SCHEMAS; a request is mapped to one by the Dialogflow project ID in
+its session path, and the tenant being served lives in a context variable
+for the rest of the request.
+"""
+import contextlib
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+import database
+import order_queue
+from cart_store import CartStore
+from config import parse_pairs, settings
+from eta import EtaEstimator, eta_estimator
+from kitchen import KitchenBoard, kitchen_board
+from menu_catalog import MenuCatalog, menu_catalog
+from recommender import Recommender, recommender
+
+
+DEFAULT_TENANT = "default"
+
+
+class Tenant:
+    """One restaurant's database and in-memory state"""
+
+    def __init__(self, name: str, engine: Engine, session_factory: Callable[[], Session],
+                 carts: CartStore, menu: MenuCatalog, kitchen: KitchenBoard, eta: EtaEstimator,
+                 recommender: Recommender):
+        self.name = name
+        self.engine = engine
+        self.session_factory = session_factory
+        self.carts = carts
+        self.menu = menu
+        self.kitchen = kitchen
+        self.eta = eta
+        self.recommender = recommender
+
+    @property
+    def is_default(self) -> bool:
+        return self.name == DEFAULT_TENANT
+
+    @property
+    def order_queue(self) -> Optional["order_queue.WriteBehindOrderQueue"]:
+        """Write-behind queue, if running; other tenants always place orders synchronously"""
+        return order_queue.active_queue if self.is_default else None
+
+    def session(self) -> Session:
+        return self.session_factory()
+
+    def __repr__(self):
+        return f"<Tenant(name={self.name})>"
+
+
+def _new_cart_store() -> CartStore:
+    return CartStore(idle_ttl=settings.CART_IDLE_TTL, max_entries=settings.CART_MAX_ENTRIES)
+
+
+def schema_url(base_url: str, schema: str) -> str:
+    """The primary's URL pointed at another database (MySQL) or file next to it (SQLite)"""
+    url = make_url(base_url)
+    if url.get_backend_name() == "sqlite":
+        directory = url.database.rsplit("/", 1)[0] + "/" if url.database and "/" in url.database else ""
+        return url.set(database=f"{directory}{schema}.db").render_as_string(hide_password=False)
+    return url.set(database=schema).render_as_string(hide_password=False)
+
+
+class TenantRegistry:
+    """Configured tenants, built on first use, and the project ID -> tenant map"""
+
+    def __init__(self, default: Tenant, database_urls: Dict[str, str], agents: Dict[str, str]):
+        self.default = default
+        self.database_urls = dict(database_urls)
+        self.agents = dict(agents)
+        self._tenants: Dict[str, Tenant] = {default.name: default}
+        self._lock = threading.Lock()
+
+    @property
+    def names(self) -> List[str]:
+        return [DEFAULT_TENANT] + sorted(self.database_urls)
+
+    def get(self, name: Optional[str]) -> Optional[Tenant]:
+        """Tenant by name (None: the default); None if not configured"""
+        if not name or name == DEFAULT_TENANT:
+            return self.default
+        tenant = self._tenants.get(name)
+        if tenant is not None:
+            return tenant
+        if name not in self.database_urls:
+            return None
+        with self._lock:
+            tenant = self._tenants.get(name)
+            if tenant is None:
+                tenant = self._build(name)
+                self._tenants[name] = tenant
+        return tenant
+
+    def _build(self, name: str) -> Tenant:
+        engine = database.make_engine(self.database_urls[name])
+        return Tenant(
+            name, engine,
+            sessionmaker(bind=engine, autocommit=False, autoflush=False),
+            carts=_new_cart_store(),
+            menu=MenuCatalog(),
+            kitchen=KitchenBoard(max_age=self.default.kitchen.max_age),
+            eta=EtaEstimator(alpha=self.default.eta.alpha),
+            recommender=Recommender(min_count=self.default.recommender.min_count),
+        )
+
+    def all(self) -> List[Tenant]:
+        """Every configured tenant, default first"""
+        return [self.get(name) for name in self.names]
+
+    def resolve(self, session_path: Optional[str]) -> Tenant:
+        """
+        Tenant of a Dialogflow session path
+        ("projects/PROJECT_ID/agent/sessions/..." or with locations/environments)
+        """
+        project_id = project_id_from_path(session_path)
+        if project_id is None:
+            return self.default
+        name = self.agents.get(project_id, project_id)
+        return self.get(name) or self.default
+
+
+def project_id_from_path(session_path: Optional[str]) -> Optional[str]:
+    if not session_path or not session_path.startswith("projects/"):
+        return None
+    parts = session_path.split("/")
+    return parts[1] if len(parts) > 1 and parts[1] else None
+
+
+# The original single-restaurant state is the default tenant
+default_tenant = Tenant(DEFAULT_TENANT, database.engine, database.SessionLocal,
+                        carts=_new_cart_store(), menu=menu_catalog, kitchen=kitchen_board, eta=eta_estimator,
+                        recommender=recommender)
+
+tenant_registry = TenantRegistry(
+    default_tenant,
+    {**{name: schema_url(settings.database_url, schema) for name, schema in parse_pairs(settings.TENANT_SCHEMAS).items()},
+     **parse_pairs(settings.TENANT_DATABASE_URLS)},
+    parse_pairs(settings.TENANT_AGENTS),
+)
+
+
+_current_tenant: ContextVar[Optional[Tenant]] = ContextVar("current_tenant", default=None)
+
+
+def current_tenant() -> Tenant:
+    """Tenant of the request being handled (the default outside one)"""
+    return _current_tenant.get() or default_tenant
+
+
+@contextlib.contextmanager
+def use_tenant(tenant: Tenant) -> Iterator[Tenant]:
+    """Serve the enclosed code for a tenant"""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
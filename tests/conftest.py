@@ -0,0 +1,47 @@
+"""
+Test setup: point the app at a throwaway SQLite database before any app
+module reads its settings. Set TEST_DATABASE_URL to run against another
+database, e.g. a scratch MySQL schema:
+  TEST_DATABASE_URL=mysql+pymysql://root:pw@localhost/food_ordering_test pytest
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DATABASE_URL"] = (os.environ.get("TEST_DATABASE_URL")
+                              or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ["DB_REPLICA_URLS"] = ""
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+# App modules only after the environment above is set
+import pytest
+
+import database
+import order_service
+from init_db import build_sample_menu
+
+
+@pytest.fixture
+def db():
+    """Fresh schema with the sample menu, and no carts before or after the test"""
+    database.drop_db()
+    database.init_db()
+    session = database.SessionLocal()
+    session.add_all(build_sample_menu())
+    session.commit()
+    order_service.inprogress_orders.clear()
+    yield session
+    session.close()
+    order_service.inprogress_orders.clear()
+    database.drop_db()
+
+
+@pytest.fixture
+def client(db):
+    """The app, started against the db fixture's database"""
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,119 @@
+"""
+Batch webhook endpoint: input-order results, per-index errors, per-session ordering and the item limit
+"""
+import asyncio
+import json
+import random
+import time
+
+import main
+from config import settings
+
+
+def turn(session, intent, query_text="", **parameters):
+    return {"queryResult": {"intent": {"displayName": intent}, "parameters": parameters, "queryText": query_text},
+            "session": f"projects/p/agent/sessions/{session}"}
+
+
+def post_batch(client, lines):
+    """POST an NDJSON body (payloads or raw lines) and return the decoded result lines"""
+    body = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+    response = client.post("/webhook/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_results_come_back_in_input_order(client):
+    payloads = [turn(f"order-{i % 5}", "store.hours") for i in range(30)]
+    results = post_batch(client, payloads)
+    assert [result["index"] for result in results] == list(range(30))
+    assert all("fulfillmentText" in result for result in results)
+
+    # A JSON array body gives the same results
+    array = client.post("/webhook/batch", json=payloads).text.splitlines()
+    assert [json.loads(line) for line in array] == results
+
+
+def test_malformed_lines_are_reported_at_their_index(client):
+    results = post_batch(client, [
+        turn("bad-1", "store.hours"),
+        '{"queryResult": {"intent": ',
+        {"session": "projects/p/agent/sessions/bad-1"},
+        turn("bad-1", "store.hours"),
+    ])
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert results[1]["error"].startswith("Invalid JSON")
+    assert results[2]["error"].startswith("Invalid webhook request")
+    assert "error" not in results[0] and "error" not in results[3]
+    assert results[0]["fulfillmentText"] == results[3]["fulfillmentText"]
+
+
+def test_turns_of_one_session_run_in_order(client, monkeypatch):
+    handled = []
+    process = main.process_webhook_turn
+
+    def slow_process(turn, db, menu_cache=None):
+        # Random delays would reorder the turns of a session if they ran concurrently
+        time.sleep(random.uniform(0, 0.01))
+        handled.append((turn.session, turn.queryText))
+        return process(turn, db, menu_cache)
+
+    monkeypatch.setattr(main, "process_webhook_turn", slow_process)
+    payloads = [turn(f"seq-{i % 4}", "store.hours", query_text=str(i)) for i in range(40)]
+    post_batch(client, payloads)
+
+    for session in range(4):
+        path = f"projects/p/agent/sessions/seq-{session}"
+        assert [int(text) for name, text in handled if name == path] == list(range(session, 40, 4))
+
+
+def test_cart_turns_in_one_batch_build_one_order(client):
+    results = post_batch(client, [
+        turn("cart-1", "new.order", **{"food-item": ["Cheese Burger"], "number": [2]}),
+        turn("cart-2", "new.order", **{"food-item": ["Veggie Pizza"], "number": [1]}),
+        turn("cart-1", "order.add - context: ongoing-order", **{"food-item": ["Pepperoni Pizza"], "number": [1]}),
+        turn("cart-1", "order.complete - context: ongoing-order"),
+    ])
+    placed = results[3]["fulfillmentText"]
+    assert "placed successfully" in placed
+    assert "Cheese Burger: 2" in placed and "Pepperoni Pizza: 1" in placed
+    assert "Veggie Pizza" not in placed
+
+
+def test_payloads_over_the_limit_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_ITEMS", 2)
+    results = post_batch(client, [turn("limit", "store.hours")] * 4)
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert "fulfillmentText" in results[0] and "fulfillmentText" in results[1]
+    assert results[2]["error"] == results[3]["error"] == "Batch limit of 2 payloads exceeded"
+
+
+def test_results_stream_while_the_body_is_still_arriving(client):
+    lines = [json.dumps(turn(f"live-{i}", "store.hours")).encode() + b"\n" for i in range(2)]
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+             "method": "POST", "scheme": "http", "path": "/webhook/batch", "raw_path": b"/webhook/batch",
+             "root_path": "", "query_string": b"", "headers": [(b"content-type", b"application/x-ndjson")],
+             "client": ("127.0.0.1", 50000), "server": ("testserver", 80)}
+
+    async def run():
+        bodies = []
+        first_result = asyncio.Event()
+
+        async def receive():
+            if len(lines) == 1:
+                # The second line is only sent once the first result is back
+                await asyncio.wait_for(first_result.wait(), timeout=5)
+            if lines:
+                return {"type": "http.request", "body": lines.pop(0), "more_body": len(lines) > 0}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message["body"]:
+                bodies.append(message["body"])
+                first_result.set()
+
+        await main.app(scope, receive, send)
+        return bodies
+
+    bodies = asyncio.run(run())
+    assert [json.loads(body)["index"] for body in bodies] == [0, 1]
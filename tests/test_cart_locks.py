@@ -0,0 +1,102 @@
+"""
+Concurrent turns of one session are serialized; different sessions never wait on each other
+"""
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import database
+import order_service
+from cart_store import CartStore
+from models import Order
+
+THREADS_PER_SESSION = 8
+TURNS_PER_THREAD = 200
+
+MENU_CACHE = {"burger": ("Cheese Burger", 8.99), "cola": ("Coca Cola", 1.99)}
+
+
+@pytest.fixture(autouse=True)
+def frequent_thread_switches():
+    # Switch threads as often as possible so unsynchronized updates would be lost
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    order_service.inprogress_orders.clear()
+    yield
+    sys.setswitchinterval(interval)
+    order_service.inprogress_orders.clear()
+
+
+def test_no_lost_updates():
+    sessions = [f"stress-{i}" for i in range(4)]
+
+    def add_and_remove(session_id):
+        # Each thread removes only what it added, so serially no removal can miss
+        missed = 0
+        for _ in range(TURNS_PER_THREAD):
+            order_service.add_to_order(session_id, ["burger", "cola"], [1, 2], None, MENU_CACHE)
+            reply = order_service.remove_from_order(session_id, ["Cheese Burger", "Coca Cola"], [1, 1])
+            missed += "not in your order" in reply
+        return missed
+
+    with ThreadPoolExecutor(max_workers=len(sessions) * THREADS_PER_SESSION) as pool:
+        futures = [pool.submit(add_and_remove, session_id)
+                   for session_id in sessions for _ in range(THREADS_PER_SESSION)]
+        assert sum(future.result() for future in futures) == 0
+
+    expected = THREADS_PER_SESSION * TURNS_PER_THREAD
+    for session_id in sessions:
+        cart = order_service.inprogress_orders[session_id]
+        assert "Cheese Burger" not in cart
+        assert cart["Coca Cola"]["quantity"] == expected
+
+
+def test_concurrent_checkouts_place_each_cart_once(db):
+    sessions = [f"checkout-{i}" for i in range(4)]
+    for session_id in sessions:
+        order_service.inprogress_orders[session_id] = {"Cheese Burger": {"quantity": 1, "price": 8.99}}
+
+    def checkout(session_id):
+        with database.SessionLocal() as db:
+            return order_service.complete_order(session_id, db)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        replies = list(pool.map(checkout, [session_id for session_id in sessions for _ in range(4)]))
+
+    assert sum("placed successfully" in reply for reply in replies) == len(sessions)
+    with database.SessionLocal() as db:
+        assert db.query(Order).count() == len(sessions)
+
+
+def test_sessions_do_not_share_locks():
+    carts = CartStore()
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold_a():
+        with carts.session_lock("a"):
+            held.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_a)
+    holder.start()
+    try:
+        assert held.wait(5)
+        acquired = threading.Event()
+
+        def lock_b():
+            with carts.session_lock("b"):
+                acquired.set()
+
+        other = threading.Thread(target=lock_b)
+        other.start()
+        assert acquired.wait(1)
+        other.join()
+        assert list(carts._session_locks) == ["a"]
+    finally:
+        release.set()
+        holder.join()
+    # Nothing is kept for sessions without a turn in flight
+    assert len(carts._session_locks) == 0
@@ -0,0 +1,123 @@
+"""
+Cart store: idle expiry, the LRU cap, eviction notices and the background sweeper
+"""
+import asyncio
+
+import order_service
+from cart_store import EVICTED_CAPACITY, EVICTED_IDLE, CartStore, sweep_forever
+from tenants import Tenant, default_tenant, use_tenant
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_idle_carts_expire():
+    clock = Clock()
+    carts = CartStore(idle_ttl=60, max_entries=10, clock=clock)
+    carts["s1"] = {"Coca Cola": {"quantity": 1, "price": 1.99}}
+    carts["s2"] = {}
+    clock.now += 45
+    assert carts["s1"]                  # Reading a cart keeps it alive
+    clock.now += 45
+
+    assert "s1" in carts
+    assert "s2" not in carts
+    assert carts.get("s2") is None
+    assert carts.stats()["evictions_ttl"] == 1
+
+
+def test_least_recently_used_cart_is_evicted_at_the_cap():
+    clock = Clock()
+    carts = CartStore(idle_ttl=60, max_entries=2, clock=clock)
+    carts["s1"] = {}
+    carts["s2"] = {}
+    carts["s1"]
+    carts["s3"] = {}
+
+    assert list(carts) == ["s1", "s3"]
+    assert carts.stats()["evictions_lru"] == 1
+    assert carts.stats()["evictions_ttl"] == 0
+
+
+def test_consume_expired_reports_the_reason_once():
+    clock = Clock()
+    carts = CartStore(idle_ttl=60, max_entries=1, clock=clock)
+    carts["full"] = {}
+    carts["idle"] = {}
+    clock.now += 61
+
+    assert carts.consume_expired("full") == EVICTED_CAPACITY
+    assert carts.consume_expired("full") is None
+    assert carts.consume_expired("idle") == EVICTED_IDLE
+    assert carts.consume_expired("idle") is None
+    assert carts.consume_expired("never-seen") is None
+
+    # Starting a new cart drops a pending notice
+    carts["a"] = {}
+    carts["b"] = {}
+    carts["a"] = {}
+    assert carts.consume_expired("b") == EVICTED_CAPACITY
+    del carts["a"]
+    assert carts.consume_expired("a") is None
+
+
+def test_sweep_evicts_expired_carts_in_batches():
+    clock = Clock()
+    carts = CartStore(idle_ttl=60, max_entries=100, clock=clock)
+    for i in range(5):
+        carts[f"old-{i}"] = {}
+    clock.now += 30
+    carts["recent"] = {}
+    clock.now += 31
+
+    assert carts.sweep(max_items=3) == 3
+    assert carts.sweep(max_items=3) == 2
+    assert carts.sweep(max_items=3) == 0
+    assert list(carts) == ["recent"]
+    assert carts.stats()["expired_notices_pending"] == 5
+
+    # Notices nobody came back for are forgotten after another TTL
+    clock.now += 61
+    assert carts.sweep() == 1
+    assert carts.stats()["expired_notices_pending"] == 1
+    assert carts.consume_expired("recent") == EVICTED_IDLE
+
+
+def test_sweep_forever_keeps_sweeping():
+    clock = Clock()
+    carts = CartStore(idle_ttl=60, max_entries=100, clock=clock)
+    for i in range(7):
+        carts[f"s{i}"] = {}
+    clock.now += 61
+
+    async def run():
+        task = asyncio.create_task(sweep_forever(carts, interval=0.01, batch_size=2))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not len(carts):
+                break
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(carts) == 0
+    assert carts.stats()["evictions_ttl"] == 7
+
+
+def test_reply_names_why_the_cart_was_lost():
+    clock = Clock()
+    tenant = Tenant("cart-test", default_tenant.engine, default_tenant.session_factory,
+                    CartStore(idle_ttl=60, max_entries=1, clock=clock), default_tenant.menu,
+                    default_tenant.kitchen, default_tenant.eta, default_tenant.recommender)
+    with use_tenant(tenant):
+        tenant.carts["crowded-out"] = {"Coca Cola": {"quantity": 1, "price": 1.99}}
+        tenant.carts["idle"] = {"Coca Cola": {"quantity": 1, "price": 1.99}}
+        assert order_service.get_order_summary("crowded-out").startswith(order_service.CART_EVICTED_MESSAGE)
+
+        clock.now += 61
+        assert order_service.get_order_summary("idle").startswith(order_service.CART_EXPIRED_MESSAGE)
+        assert order_service.get_order_summary("idle") == "Your order is empty."
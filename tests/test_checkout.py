@@ -0,0 +1,79 @@
+"""
+Checkout revalidates the cart against the menu in one query
+"""
+from sqlalchemy import event
+
+import database
+import order_service
+from init_db import build_sample_menu
+from models import MenuItem, Order
+
+
+SESSION = "checkout-test"
+
+
+def fill_cart(items):
+    order_service.inprogress_orders[SESSION] = {
+        name: {"quantity": quantity, "price": price} for name, quantity, price in items
+    }
+
+
+def menu_item(db, name):
+    return db.query(MenuItem).filter(MenuItem.item_name == name).one()
+
+
+def count_selects(action):
+    selects = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        result = action()
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+    return result, selects
+
+
+def test_unchanged_cart_is_placed_after_one_menu_query(db):
+    names = [item.item_name for item in build_sample_menu()][:12]
+    fill_cart([(name, 1, menu_item(db, name).price) for name in names])
+    db.expire_all()
+
+    response, selects = count_selects(lambda: order_service.complete_order(SESSION, db))
+
+    assert "placed successfully" in response
+    assert len([s for s in selects if "menu_items" in s]) == 1
+    assert db.query(Order).count() == 1
+
+
+def test_changed_lines_are_reported_before_placing(db):
+    menu_item(db, "Coca Cola").is_available = 0
+    menu_item(db, "Cheese Burger").price = 12.0
+    db.commit()
+    fill_cart([("Coca Cola", 2, 2.5), ("Cheese Burger", 1, 9.0)])
+
+    response = order_service.complete_order(SESSION, db)
+
+    assert "Coca Cola is no longer available" in response
+    assert "Cheese Burger now costs $12.00 (was $9.00)" in response
+    assert db.query(Order).count() == 0
+    assert order_service.inprogress_orders[SESSION] == {"Cheese Burger": {"quantity": 1, "price": 12.0}}
+
+    # Confirming again places the updated cart
+    assert "Total: $12.00" in order_service.complete_order(SESSION, db)
+    assert db.query(Order).count() == 1
+
+
+def test_cart_with_nothing_left_is_not_placed(db):
+    menu_item(db, "Coca Cola").is_available = 0
+    db.commit()
+    fill_cart([("Coca Cola", 1, 2.5)])
+
+    response = order_service.complete_order(SESSION, db)
+
+    assert "could not be placed" in response
+    assert SESSION not in order_service.inprogress_orders
+    assert db.query(Order).count() == 0
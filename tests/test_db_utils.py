@@ -0,0 +1,68 @@
+"""
+db_utils batch mode: many commands over one session, JSON lines out
+"""
+import io
+import json
+
+import pytest
+
+import db_utils
+from models import MenuItem, Order, OrderStatus
+
+
+@pytest.fixture
+def db(db):
+    db.add(Order(order_id=7, order_status=OrderStatus.PLACED, total_amount=8.99))
+    db.commit()
+    return db
+
+
+def run(lines, transaction=False):
+    out = io.StringIO()
+    summary = db_utils.run_batch(lines, out, transaction)
+    return [json.loads(line) for line in out.getvalue().splitlines()], summary
+
+
+def price(db, name):
+    db.expire_all()
+    return db.query(MenuItem.price).filter(MenuItem.item_name == name).scalar()
+
+
+def test_each_command_is_committed_on_its_own(db):
+    records, summary = run([
+        'update_price "Cheese Burger" 9.49\n',
+        "# comments and blank lines are skipped\n",
+        "\n",
+        "update_price Nope 1\n",
+        "update_status 7 preparing\n",
+        "get_order 7\n",
+        "update_price Pepsi cheap\n",
+    ])
+    assert [record["ok"] for record in records[:-1]] == [True, False, True, True, False]
+    assert records[1] == {"line": 4, "command": "update_price", "ok": False, "error": "Menu item 'Nope' not found"}
+    assert records[3]["result"]["order_status"] == "Preparing"
+    assert [event["order_status"] for event in records[3]["result"]["timeline"]] == ["Preparing"]
+    assert records[4]["error"] == "Not a number: cheap"
+    assert summary == records[-1] == {"summary": True, "executed": 5, "failed": 2, "transaction": False,
+                                      "committed": True}
+    assert price(db, "Cheese Burger") == 9.49
+
+
+def test_transaction_is_all_or_nothing(db):
+    records, summary = run(['update_price "Cheese Burger" 9.49', "toggle_item Pepsi", "update_status 99 PREPARING",
+                            "sales_summary"], transaction=True)
+    assert len(records) == 4 and records[2]["error"] == "Order 99 not found"
+    assert summary["committed"] is False
+    assert price(db, "Cheese Burger") == 8.99
+
+    records, summary = run(['update_price "Cheese Burger" 9.49', 'add_item "Hawaiian Pizza" 12.99 Pizza',
+                            "list_menu Pizza"], transaction=True)
+    assert summary["committed"] is True
+    assert "Hawaiian Pizza" in [item["item_name"] for item in records[2]["result"]]
+    assert price(db, "Cheese Burger") == 9.49
+
+
+def test_usage_errors(db):
+    records, _ = run(["toggle_item", "bogus", 'update_price "unterminated'])
+    assert [record["error"] for record in records[:-1]] == [
+        "Usage: toggle_item <name>", "Unknown command: bogus", "Cannot parse line: No closing quotation"]
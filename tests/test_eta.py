@@ -0,0 +1,164 @@
+"""
+ETA statistics: live updates, estimates and replay from order_events
+"""
+import asyncio
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+import database
+import eta
+from eta import EtaEstimator, StageStats
+from models import Order, OrderEvent, OrderStatus
+
+
+START = datetime(2024, 1, 1, 12, 0)
+
+
+def minutes(n):
+    return START + timedelta(minutes=n)
+
+
+def test_estimates_follow_observed_stage_durations():
+    estimator = EtaEstimator(alpha=0.5)
+    for order_id in range(1, 4):
+        estimator.order_placed(order_id, minutes(0))
+        estimator.status_changed(order_id, OrderStatus.PREPARING, minutes(2))
+        estimator.status_changed(order_id, OrderStatus.OUT_FOR_DELIVERY, minutes(12))
+
+    # Placed just now: ~2 min waiting plus ~10 min preparing
+    assert estimator.describe(OrderStatus.PLACED, minutes(20), now=minutes(20)) == "Estimated ready in ~12 min"
+    # Preparing for 4 of ~10 min
+    assert estimator.describe(OrderStatus.PREPARING, minutes(20), now=minutes(24)) == "Estimated ready in ~6 min"
+    assert estimator.describe(OrderStatus.DELIVERED, minutes(20)) is None
+
+
+def test_upper_bound_follows_the_p90():
+    rng = random.Random(7)
+    estimator = EtaEstimator(alpha=0.05)
+    for order_id in range(1, 2001):
+        placed = minutes(30 * order_id)
+        estimator.order_placed(order_id, placed)
+        estimator.status_changed(order_id, OrderStatus.PREPARING, placed + timedelta(minutes=rng.uniform(0, 20)))
+
+    # Waits of 0..20 min: ~10 min on average, 90% within ~18, plus 20 min preparing (no samples yet)
+    reply = estimator.describe(OrderStatus.PLACED, minutes(0), now=minutes(0))
+    estimate, bound = map(int, re.fullmatch(r"Estimated ready in ~(\d+) min \(up to (\d+) min\)", reply).groups())
+    assert 27 <= estimate <= 33 and 36 <= bound <= 40
+    stage = estimator.snapshot()["Placed"]
+    assert stage["upper_seconds"] == stage["p90_seconds"] > stage["expected_seconds"]
+
+
+def test_backlog_stretches_the_wait():
+    estimator = EtaEstimator(alpha=1.0)
+    # Orders leave Placed one minute apart after a 1 minute wait each
+    for order_id in range(1, 3):
+        estimator.order_placed(order_id, minutes(order_id - 1))
+        estimator.status_changed(order_id, OrderStatus.PREPARING, minutes(order_id))
+    for order_id in range(10, 20):
+        estimator.order_placed(order_id, minutes(3))
+
+    # Ten orders queued, one leaves per minute
+    assert estimator.seconds_until(OrderStatus.PLACED, minutes(3), OrderStatus.PREPARING,
+                                   now=minutes(3)) == pytest.approx(600)
+
+
+def test_stage_stats_p90_settles_near_the_quantile():
+    rng = random.Random(3)
+    stats = StageStats(alpha=0.05)
+    for i in range(5000):
+        stats.observe(rng.uniform(0, 100), float(i))
+    assert 84 <= stats.p90 <= 96
+
+
+def seed_history(db, count):
+    path = [(OrderStatus.PLACED, 0), (OrderStatus.PREPARING, 3), (OrderStatus.OUT_FOR_DELIVERY, 15),
+            (OrderStatus.DELIVERED, 40)]
+    db.execute(insert(Order), [
+        {"order_id": order_id, "order_status": OrderStatus.DELIVERED, "order_date": minutes(order_id),
+         "total_amount": 10.0} for order_id in range(1, count + 1)
+    ])
+    db.execute(insert(OrderEvent), [
+        {"order_id": order_id, "order_status": status, "ts": minutes(order_id + offset)}
+        for order_id in range(1, count + 1) for status, offset in path
+    ])
+    # Still being prepared
+    db.execute(insert(Order), [{"order_id": count + 1, "order_status": OrderStatus.PREPARING,
+                                "order_date": minutes(count + 1), "total_amount": 10.0}])
+    db.execute(insert(OrderEvent), [
+        {"order_id": count + 1, "order_status": OrderStatus.PLACED, "ts": minutes(count + 1)},
+        {"order_id": count + 1, "order_status": OrderStatus.PREPARING, "ts": minutes(count + 4)},
+    ])
+    db.commit()
+
+
+def test_replay_rebuilds_statistics(db):
+    seed_history(db, 50)
+    estimator = EtaEstimator()
+    assert estimator.replay(db, START) == 50 * 4 + 2
+
+    stages = estimator.snapshot()
+    assert stages["Placed"]["mean_seconds"] == 180
+    assert stages["Preparing"]["mean_seconds"] == 720
+    assert stages["Out for Delivery"]["samples"] == 50
+    assert stages["Preparing"]["orders_in_stage"] == 1
+
+
+def test_replay_matches_live_updates(db, monkeypatch):
+    pytest.importorskip("numpy")
+    seed_history(db, 30)
+    vectorized = EtaEstimator(alpha=0.3)
+    vectorized.replay(db, START)
+    monkeypatch.setattr(eta, "np", None)
+    sequential = EtaEstimator(alpha=0.3)
+    sequential.replay(db, START)
+
+    for stage, stats in vectorized.snapshot().items():
+        expected = sequential.snapshot()[stage]
+        assert stats["mean_seconds"] == pytest.approx(expected["mean_seconds"])
+        assert stats["exit_gap_seconds"] == pytest.approx(expected["exit_gap_seconds"])
+
+
+def test_reconcile_picks_up_status_changes_made_elsewhere(db):
+    seed_history(db, 3)
+    estimator = EtaEstimator(alpha=1.0)
+    estimator.replay(db, START)
+    assert estimator.snapshot()["Preparing"]["orders_in_stage"] == 1
+
+    # Another worker (or db_utils) moves order 4 on and places order 5
+    db.execute(update(Order).where(Order.order_id == 4).values(order_status=OrderStatus.OUT_FOR_DELIVERY))
+    db.execute(insert(Order), [{"order_id": 5, "order_status": OrderStatus.PLACED,
+                                "order_date": minutes(30), "total_amount": 10.0}])
+    db.execute(insert(OrderEvent), [
+        {"order_id": 4, "order_status": OrderStatus.OUT_FOR_DELIVERY, "ts": minutes(10)},
+        {"order_id": 5, "order_status": OrderStatus.PLACED, "ts": minutes(30)},
+    ])
+    db.commit()
+    assert estimator.snapshot()["Preparing"]["orders_in_stage"] == 1
+
+    assert estimator.reconcile(db) == 2
+    stages = estimator.snapshot()
+    assert stages["Placed"]["orders_in_stage"] == 1
+    assert stages["Preparing"]["orders_in_stage"] == 0
+    assert stages["Out for Delivery"]["orders_in_stage"] == 1
+    # Order 4 spent minutes 7..10 preparing
+    assert stages["Preparing"]["mean_seconds"] == 180
+
+
+def test_reconcile_runs_as_a_background_task(db):
+    seed_history(db, 3)
+    estimator = EtaEstimator()
+    db.execute(update(Order).where(Order.order_id == 4).values(order_status=OrderStatus.OUT_FOR_DELIVERY))
+    db.commit()
+
+    async def run_briefly():
+        task = asyncio.create_task(eta.reconcile_forever(estimator, database.SessionLocal, 0.01))
+        while estimator.snapshot()["Out for Delivery"]["orders_in_stage"] == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(run_briefly(), timeout=5))
+    assert estimator.snapshot()["Preparing"]["orders_in_stage"] == 0
@@ -0,0 +1,90 @@
+"""
+Webhook bodies give the same turn through orjson and through the slim pydantic fallback
+"""
+import json
+
+import pytest
+from pydantic import ValidationError
+
+import fast_json
+from fast_json import parse_webhook_turn, turn_from_payload
+
+# Size of the large bodies real agents send (outputContexts, diagnostics, history)
+LARGE_BYTES = 20000
+
+
+def payload(**overrides):
+    body = {
+        "responseId": "r-1",
+        "session": "projects/p/agent/sessions/s1",
+        "queryResult": {"queryText": "two burgers", "parameters": {"food-item": ["burger"], "number": [2]},
+                        "intent": {"displayName": "new.order"}},
+        "originalDetectIntentRequest": {"payload": {"userId": "u-1"}},
+    }
+    for path, value in overrides.items():
+        target = body
+        *parents, key = path.split("__")
+        for parent in parents:
+            target = target[parent]
+        target[key] = value
+    return body
+
+
+def padded(body):
+    """Same payload, padded to LARGE_BYTES with a field the handlers ignore"""
+    return json.dumps({**body, "diagnosticInfo": {"blob": "x" * LARGE_BYTES}}).encode("utf-8")
+
+
+CASES = {
+    "full": payload(),
+    "null parameters": payload(queryResult__parameters=None),
+    "null query text": payload(queryResult__queryText=None),
+    "missing query text": {k: v for k, v in payload().items() if k != "queryResult"} | {
+        "queryResult": {"intent": {"displayName": "track.order"}, "parameters": {"number": 7}}},
+    "null session": payload(session=None),
+    "numeric user id": payload(originalDetectIntentRequest__payload={"userId": 42}),
+    "nested user id": payload(originalDetectIntentRequest__payload={"user": {"userId": "g-1"}}),
+    "empty user id": payload(originalDetectIntentRequest__payload={"userId": "", "user": {"userId": "g-1"}}),
+    "null payload": payload(originalDetectIntentRequest={"payload": None}),
+    "odd original request": payload(originalDetectIntentRequest="console"),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_orjson_and_fallback_give_the_same_turn(name, monkeypatch):
+    body = CASES[name]
+    expected = turn_from_payload(body)
+    raw = [json.dumps(body).encode("utf-8"), padded(body)]
+    assert [parse_webhook_turn(data) for data in raw] == [expected, expected]
+    monkeypatch.setattr(fast_json, "orjson", None)
+    assert [parse_webhook_turn(data) for data in raw] == [expected, expected]
+
+
+@pytest.mark.parametrize("body", [payload(queryResult__intent=None), payload(queryResult=None),
+                                  payload(queryResult__intent={"name": "no display name"})])
+def test_both_paths_reject_the_same_bodies(body, monkeypatch):
+    with pytest.raises(ValidationError):
+        parse_webhook_turn(padded(body))
+    monkeypatch.setattr(fast_json, "orjson", None)
+    with pytest.raises(ValidationError):
+        parse_webhook_turn(padded(body))
+
+
+def test_large_bodies_use_orjson(monkeypatch):
+    pytest.importorskip("orjson")
+
+    # The slim model is slower than orjson at every size; it is only the fallback
+    def slim_parser(body):
+        raise AssertionError("slim model used with orjson installed")
+
+    monkeypatch.setattr(fast_json._SlimWebhookRequest, "model_validate_json", slim_parser)
+    assert parse_webhook_turn(padded(payload())) == turn_from_payload(payload())
+
+
+def test_large_body_with_null_fields_is_answered(client):
+    body = padded(payload(queryResult__parameters=None, queryResult__queryText=None,
+                          queryResult__intent={"displayName": "store.hours"}))
+    response = client.post("/webhook", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 200
+    reply = client.post("/", content=body, headers={"Content-Type": "application/json"}).json()["fulfillmentText"]
+    assert "something went wrong" not in reply
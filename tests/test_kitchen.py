@@ -0,0 +1,108 @@
+"""
+Kitchen board: per-item cook counts by status, status moves, reloads and the dashboard endpoint
+"""
+import json
+from datetime import datetime, timedelta
+
+import order_service
+from kitchen import KitchenBoard
+from models import Order, OrderItem, OrderStatus
+
+START = datetime(2024, 1, 1, 12, 0)
+
+
+def board_with_orders():
+    board = KitchenBoard()
+    board.order_placed(1, START, [("Cheese Burger", 2), ("Coca Cola", 1)])
+    board.order_placed(2, START - timedelta(minutes=5), [("Cheese Burger", 1)])
+    return board
+
+
+def status(board, name):
+    return json.loads(board.snapshot())["statuses"][name]
+
+
+def test_orders_are_grouped_with_cook_counts():
+    board = board_with_orders()
+    placed = status(board, "Placed")
+    assert placed["order_count"] == 2
+    assert [order["order_id"] for order in placed["orders"]] == [2, 1]    # Oldest first
+    assert placed["items"] == [
+        {"item_name": "Cheese Burger", "quantity": 3, "label": "3× Cheese Burger pending"},
+        {"item_name": "Coca Cola", "quantity": 1, "label": "1× Coca Cola pending"},
+    ]
+    assert status(board, "Preparing") == {"order_count": 0, "items": [], "orders": []}
+    assert board.order_counts() == {"Placed": 2, "Preparing": 0, "Out for Delivery": 0}
+
+
+def test_status_changes_move_orders_and_their_counts():
+    board = board_with_orders()
+    board.status_changed(1, OrderStatus.PREPARING)
+    assert status(board, "Placed")["items"] == [
+        {"item_name": "Cheese Burger", "quantity": 1, "label": "1× Cheese Burger pending"}]
+    assert [item["label"] for item in status(board, "Preparing")["items"]] == [
+        "2× Cheese Burger preparing", "1× Coca Cola preparing"]
+
+    board.status_changed(1, OrderStatus.OUT_FOR_DELIVERY)
+    assert status(board, "Preparing")["items"] == []
+    assert status(board, "Out for Delivery")["order_count"] == 1
+
+    # Delivered and cancelled orders leave the board
+    board.status_changed(1, OrderStatus.DELIVERED)
+    board.status_changed(2, OrderStatus.CANCELLED)
+    snapshot = json.loads(board.snapshot())
+    assert snapshot["total_active"] == 0
+    assert all(group["items"] == [] for group in snapshot["statuses"].values())
+
+
+def test_snapshot_is_reencoded_only_after_a_change():
+    board = board_with_orders()
+    first = board.snapshot()
+    assert board.snapshot() is first
+    board.status_changed(2, OrderStatus.PREPARING)
+    assert board.snapshot() is not first
+
+
+def seed_active_order(db, order_id, order_status, items):
+    db.add(Order(order_id=order_id, order_status=order_status, order_date=START, total_amount=10.0))
+    db.add_all([OrderItem(order_id=order_id, item_name=name, quantity=quantity, price=1.0)
+                for name, quantity in items])
+    db.commit()
+
+
+def test_unknown_order_marks_the_board_stale(db):
+    board = KitchenBoard(max_age=3600)
+    board.load(db)
+    assert not board.is_stale()
+
+    # Delivered elsewhere: nothing to show either way
+    board.status_changed(40, OrderStatus.DELIVERED)
+    assert not board.is_stale()
+
+    # Placed by another worker, then moved on here: reload to show it
+    seed_active_order(db, 41, OrderStatus.PREPARING, [("Veggie Pizza", 2)])
+    board.status_changed(41, OrderStatus.PREPARING)
+    assert board.is_stale()
+    board.load(db)
+    assert status(board, "Preparing")["items"] == [
+        {"item_name": "Veggie Pizza", "quantity": 2, "label": "2× Veggie Pizza preparing"}]
+
+
+def test_dashboard_follows_placement_and_status_updates(client, db):
+    seed_active_order(db, 50, OrderStatus.OUT_FOR_DELIVERY, [("Coca Cola", 3)])
+    board = order_service.current_tenant().kitchen
+    board.load(db)
+    order_service.add_to_order("kitchen", ["Cheese Burger"], [2], db)
+    order_service.complete_order("kitchen", db)
+    placed_id = max(order_id for (order_id,) in db.query(Order.order_id))
+
+    active = client.get("/kitchen/active").json()
+    assert active["total_active"] == 2
+    assert active["statuses"]["Placed"]["items"][0]["label"] == "2× Cheese Burger pending"
+    assert active["statuses"]["Out for Delivery"]["orders"][0]["order_id"] == 50
+
+    order_service.set_order_status(placed_id, OrderStatus.PREPARING, db)
+    order_service.set_order_status(50, OrderStatus.DELIVERED, db)
+    active = client.get("/kitchen/active").json()
+    assert active["total_active"] == 1
+    assert active["statuses"]["Preparing"]["items"][0]["label"] == "2× Cheese Burger preparing"
@@ -0,0 +1,39 @@
+"""
+Load generator smoke run: a couple of sessions against the in-process app fill in the report
+"""
+import asyncio
+import json
+
+import httpx
+
+import load_test
+import main
+
+
+def test_short_run_fills_in_the_report(db, capsys):
+    main.tenant_registry.default.menu.invalidate()
+    args = load_test.parse_args(["--sessions", "2", "--duration", "2", "--tracks", "1", "--seed", "5"])
+    stats = load_test.LoadStats()
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+            return await load_test.run_load(client, args, stats)
+
+    duration = asyncio.run(run())
+    orders_written = load_test.count_orders(str(db.get_bind().url))
+    capsys.readouterr()
+    load_test.report(stats, duration, orders_written, as_json=True)
+    summary = json.loads(capsys.readouterr().out)
+
+    assert 2 <= summary["duration_s"] < 10
+    assert summary["conversations"] >= 2 and summary["turns"] >= 5 * summary["conversations"]
+    assert summary["turns_per_second"] > 0 and summary["conversations_per_second"] > 0
+    assert summary["error_rate"] == 0
+    assert summary["orders_acknowledged"] == summary["conversations"] == orders_written
+    assert set(summary["intents"]) == {
+        "new.order", "order.add - context: ongoing-order", "order.remove - context: ongoing-order",
+        "order.complete - context: ongoing-order", "track.order"}
+    for row in summary["intents"].values():
+        assert row["count"] > 0 and row["errors"] == 0
+        assert 0 < row["p50_ms"] <= row["p90_ms"] <= row["p99_ms"] <= row["max_ms"]
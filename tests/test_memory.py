@@ -0,0 +1,112 @@
+"""
+Memory per open cart stays within CART_BYTES_BUDGET, and /debug/memory reports it
+"""
+import sys
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+import order_service
+from cart_store import CartStore
+from config import settings
+from memory_profile import MAX_FRAMES, MemoryProfiler, cache_sizes, deep_size
+from models import MenuItem
+from tenants import Tenant, default_tenant, use_tenant
+
+
+SESSIONS = 100_000
+TRACED_SESSIONS = 10_000
+
+# Menu lookups memoized as in a webhook batch, so no database is needed
+MENU_CACHE = {"burger": ("Cheese Burger", 8.99), "fries": ("French Fries", 2.99)}
+
+
+@pytest.fixture
+def tenant():
+    carts = CartStore(idle_ttl=0, max_entries=0)
+    tenant = Tenant("memory-test", default_tenant.engine, default_tenant.session_factory,
+                    carts, default_tenant.menu, default_tenant.kitchen, default_tenant.eta,
+                    default_tenant.recommender)
+    with use_tenant(tenant):
+        yield tenant
+
+
+def open_carts(start, count):
+    for i in range(start, start + count):
+        order_service.add_to_order(f"session-{i:07d}", ["burger", "fries"], [1, 2], None, MENU_CACHE)
+
+
+def test_bytes_per_cart_within_budget(tenant):
+    open_carts(0, SESSIONS - TRACED_SESSIONS)
+
+    # Allocations are traced for the last sessions only; tracing all of them is slow
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        open_carts(SESSIONS - TRACED_SESSIONS, TRACED_SESSIONS)
+        traced = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    assert len(tenant.carts) == SESSIONS
+    assert traced / TRACED_SESSIONS <= settings.CART_BYTES_BUDGET
+    assert tenant.carts.approximate_bytes() / SESSIONS <= settings.CART_BYTES_BUDGET
+
+
+def test_deep_size_counts_shared_objects_once():
+    line = {"quantity": 1, "price": 2.5}
+    shared = [line, line]
+    assert deep_size(shared) == sys.getsizeof(shared) + deep_size(line)
+
+
+def test_snapshot_diff_shows_growth():
+    profiler = MemoryProfiler()
+    profiler.start()
+    try:
+        profiler.take("before")
+        hoard = [bytearray(1000) for _ in range(1000)]
+        growth = profiler.diff("before", limit=3)
+    finally:
+        profiler.stop()
+    assert growth[0]["bytes_diff"] >= 1_000_000
+    assert growth[0]["site"][0].rsplit(":", 1)[0].endswith("test_memory.py")
+    assert len(hoard) == 1000
+
+
+def test_debug_memory_endpoint(monkeypatch):
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "s3cret")
+    assert TestClient(main.app).get("/debug/memory").status_code == 401
+    assert TestClient(main.app).post("/debug/memory/start").status_code == 401
+    client = TestClient(main.app, headers={"Authorization": "Bearer s3cret"})
+    report = client.get("/debug/memory").json()
+    assert report["tracing"] is False
+    assert "carts" in report["caches"]["tenants"]["default"]
+    assert "gc_objects" not in report["process"]
+    assert report["caches"]["db_sessions"]["live"] >= 0
+
+    # The traceback depth is clamped
+    assert client.post("/debug/memory/start", params={"frames": 10_000}).json()["frames"] == MAX_FRAMES
+    client.post("/debug/memory/start", params={"frames": 2})
+    try:
+        assert client.post("/debug/memory/snapshots/base").status_code == 200
+        assert client.get("/debug/memory").json()["top"]
+        assert client.get("/debug/memory/diff", params={"base": "base"}).status_code == 200
+        assert client.get("/debug/memory/diff", params={"base": "missing"}).status_code == 404
+    finally:
+        client.post("/debug/memory/stop")
+    assert client.post("/debug/memory/snapshots/late").status_code == 409
+
+
+def test_sessions_holding_objects_are_counted(db):
+    before = cache_sizes([])["db_sessions"]
+    session = database.SessionLocal()
+    items = session.query(MenuItem).all()
+    during = cache_sizes([])["db_sessions"]
+    assert during["live"] == before["live"] + 1
+    assert during["identity_map_objects"] == before["identity_map_objects"] + len(items)
+
+    session.close()
+    assert cache_sizes([])["db_sessions"]["identity_map_objects"] == before["identity_map_objects"]
@@ -0,0 +1,128 @@
+"""
+GET /menu: ETag revalidation, gzip negotiation and rebuilding the pre-encoded bodies
+"""
+import asyncio
+import gzip
+import json
+import threading
+
+import pytest
+
+import database
+import main
+from menu_catalog import MenuCatalog, accepts_gzip, etag_matches, refresh_forever
+from models import MenuItem
+
+PLAIN = {"Accept-Encoding": "identity"}
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+@pytest.fixture
+def menu(client):
+    return main.tenant_registry.default.menu
+
+
+def test_unchanged_menu_is_revalidated_with_304(client):
+    first = client.get("/menu", headers=PLAIN)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert "Accept-Encoding" in first.headers["Vary"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+        again = client.get("/menu", headers={**PLAIN, "If-None-Match": if_none_match})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["ETag"] == etag
+
+    assert client.get("/menu", headers={**PLAIN, "If-None-Match": '"stale"'}).status_code == 200
+    # Each category has its own body and validator
+    pizza = client.get("/menu", params={"category": "pizza"}, headers=PLAIN)
+    assert pizza.headers["ETag"] != etag
+    assert {item["category"] for item in pizza.json()["items"]} == {"Pizza"}
+
+
+def test_gzip_is_served_when_accepted(client):
+    plain = client.get("/menu", headers=PLAIN)
+    zipped = client.get("/menu", headers=GZIP)
+    assert "Content-Encoding" not in plain.headers
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert zipped.json() == plain.json()
+    # Different bytes, so a different strong ETag, and the plain one does not match
+    assert zipped.headers["ETag"] != plain.headers["ETag"]
+    assert client.get("/menu", headers={**GZIP, "If-None-Match": plain.headers["ETag"]}).status_code == 200
+    assert client.get("/menu", headers={**GZIP, "If-None-Match": zipped.headers["ETag"]}).status_code == 304
+
+    refused = client.get("/menu", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in refused.headers
+
+
+def test_encoded_gzip_body_is_the_compressed_plain_body(menu, client):
+    encoded = menu.get()
+    assert gzip.decompress(encoded.gzip_body) == encoded.body
+    assert json.loads(encoded.body)["categories"] == sorted({item[3] for item in menu.items})
+
+
+def test_price_change_rebuilds_after_invalidate(menu, client, db):
+    before = client.get("/menu", headers=PLAIN)
+    version = menu.version
+    db.query(MenuItem).filter(MenuItem.item_name == "Cheese Burger").update({"price": 9.49})
+    db.commit()
+
+    # Served from memory until the catalog is refreshed or invalidated
+    assert client.get("/menu", headers={**PLAIN, "If-None-Match": before.headers["ETag"]}).status_code == 304
+    menu.invalidate()
+    after = client.get("/menu", headers={**PLAIN, "If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    prices = {item["item_name"]: item["price"] for item in after.json()["items"]}
+    assert prices["Cheese Burger"] == 9.49
+    assert menu.version == version + 1
+
+
+def test_refresh_rebuilds_only_when_rows_changed(menu, client, db):
+    menu.refresh(db)
+    version = menu.version
+    assert menu.refresh(db) is False
+    assert menu.version == version
+
+    db.query(MenuItem).filter(MenuItem.item_name == "Cheese Burger").update({"is_available": 0})
+    db.commit()
+    assert menu.refresh(db) is True
+    assert menu.version == version + 1
+    burger = [item for item in client.get("/menu", headers=PLAIN).json()["items"]
+              if item["item_name"] == "Cheese Burger"]
+    assert burger[0]["is_available"] is False
+
+
+def test_background_refresh_queries_off_the_event_loop(db):
+    catalog = MenuCatalog()
+    threads, changes = [], []
+
+    def session_factory():
+        threads.append(threading.get_ident())
+        return database.SessionLocal()
+
+    async def run_briefly():
+        task = asyncio.create_task(refresh_forever(catalog, session_factory, 0.01, on_change=changes.append))
+        while not changes:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(asyncio.wait_for(run_briefly(), timeout=5))
+    assert catalog.loaded and len(changes[0]) == len(catalog.items)
+    assert threads and loop_thread not in threads
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", True), ("deflate, gzip;q=0.5", True), ("*", True), ("GZIP", True),
+    ("", False), ("identity", False), ("gzip;q=0", False), ("gzip;q=bad", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_etag_matches():
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert not etag_matches('"a"', '"b"')
@@ -0,0 +1,122 @@
+"""
+/metrics: Prometheus text format, per-thread cells merged on scrape, and label sets
+"""
+import re
+import threading
+
+import pytest
+
+from metrics import Counter, Histogram, Registry
+
+SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text):
+    """{(sample name, frozenset of label pairs): value} and {family: type}, checking the exposition format"""
+    assert text.endswith("\n")
+    samples, types, helped = {}, {}, set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            helped.add(line.split(" ", 3)[2])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name in helped and kind in ("counter", "gauge", "histogram")
+            types[name] = kind
+        else:
+            name, labels, value = SAMPLE.fullmatch(line).groups()
+            family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in types else name
+            assert family in types, f"sample before its # TYPE: {line}"
+            pairs = LABEL.findall(labels or "")
+            assert ",".join(f'{k}="{v}"' for k, v in pairs) == (labels or "")
+            samples[(name, frozenset(pairs))] = float(value)
+    return samples, types
+
+
+def scrape(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return parse(response.text)
+
+
+def turn(session, intent, **parameters):
+    return {"queryResult": {"intent": {"displayName": intent}, "parameters": parameters, "queryText": ""},
+            "session": f"projects/p/agent/sessions/{session}"}
+
+
+def test_scrape_counts_webhook_turns(client):
+    before, _ = scrape(client)
+    for _ in range(3):
+        client.post("/", json=turn("m1", "store.hours"))
+    client.post("/", json=turn("m1", "new.order", **{"food-item": ["Cheese Burger"], "number": [1]}))
+    client.post("/", json=turn("m1", "order.complete - context: ongoing-order"))
+    client.post("/", json=turn("m1", "smalltalk.greetings"))
+    after, types = scrape(client)
+
+    def delta(name, **labels):
+        key = (name, frozenset(labels.items()))
+        return after[key] - before.get(key, 0.0)
+
+    assert types["chatbot_webhook_requests_total"] == "counter"
+    assert types["chatbot_webhook_duration_seconds"] == "histogram"
+    assert delta("chatbot_webhook_requests_total", intent="store.hours") == 3
+    assert delta("chatbot_webhook_requests_total", intent="other") == 1
+    assert delta("chatbot_orders_placed_total", mode="sync") == 1
+    assert delta("chatbot_webhook_duration_seconds_count", intent="store.hours") == 3
+
+    # Buckets are cumulative and end at +Inf == _count
+    buckets = sorted((float(dict(labels)["le"]), value) for (name, labels), value in after.items()
+                     if name == "chatbot_webhook_duration_seconds_bucket" and ("intent", "store.hours") in labels)
+    assert [count for _, count in buckets] == sorted(count for _, count in buckets)
+    assert buckets[-1] == (float("inf"), after[("chatbot_webhook_duration_seconds_count",
+                                                 frozenset({("intent", "store.hours")}))])
+
+    # Gauges by tenant, computed at scrape time
+    assert after[("chatbot_open_carts", frozenset({("tenant", "default")}))] == 0
+    assert ("chatbot_active_orders", frozenset({("tenant", "default"), ("status", "Placed")})) in after
+    assert {frozenset(dict(labels)) for (name, labels) in after if name == "chatbot_db_pool_connections"} \
+        == {frozenset({"tenant", "state"})}
+
+
+def test_values_from_many_threads_are_merged():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests", ["intent"]))
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+
+    def work():
+        for i in range(1000):
+            requests.labels("a").inc()
+            latency.observe(0.0625 if i % 2 else 0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    requests.labels("b").inc(2.5)
+
+    assert registry.render().decode("utf-8").splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{intent="a"} 8000',
+        'requests_total{intent="b"} 2.5',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 4000',
+        'latency_seconds_bucket{le="1"} 8000',
+        'latency_seconds_bucket{le="+Inf"} 8000',
+        "latency_seconds_sum 2250",
+        "latency_seconds_count 8000",
+    ]
+
+
+def test_label_values_are_escaped_and_checked():
+    registry = Registry()
+    counter = registry.register(Counter("odd_total", "Odd labels", ["value"]))
+    counter.labels('say "hi"\\\n').inc()
+    samples, _ = parse(registry.render().decode("utf-8"))
+    assert samples == {("odd_total", frozenset({("value", 'say \\"hi\\"\\\\\\n')})): 1}
+
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
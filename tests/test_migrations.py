@@ -0,0 +1,100 @@
+"""
+Migrations bring an old init_db() database to the schema the models declare
+"""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from migrations import MIGRATIONS, run_migrations
+from models import Base, Order, OrderEvent, OrderStatus
+
+
+# Schema created by init_db() before migrations existed
+LEGACY_SCHEMA = [
+    """CREATE TABLE orders (
+        order_id INTEGER NOT NULL PRIMARY KEY,
+        order_status VARCHAR(16) NOT NULL,
+        order_date DATETIME NOT NULL,
+        total_amount FLOAT NOT NULL
+    )""",
+    "CREATE INDEX ix_orders_order_id ON orders (order_id)",
+    """CREATE TABLE order_items (
+        item_id INTEGER NOT NULL PRIMARY KEY,
+        order_id INTEGER NOT NULL REFERENCES orders (order_id),
+        item_name VARCHAR(100) NOT NULL,
+        quantity INTEGER NOT NULL,
+        price FLOAT NOT NULL
+    )""",
+    """CREATE TABLE menu_items (
+        item_id INTEGER NOT NULL PRIMARY KEY,
+        item_name VARCHAR(100) NOT NULL,
+        price FLOAT NOT NULL,
+        category VARCHAR(50),
+        is_available INTEGER
+    )""",
+    "CREATE UNIQUE INDEX ix_menu_items_item_name ON menu_items (item_name)",
+]
+
+
+def sqlite_engine():
+    return create_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "migrate.db"))
+
+
+def index_names(engine):
+    inspector = inspect(engine)
+    return {table: {index["name"] for index in inspector.get_indexes(table)}
+            for table in ("orders", "order_items", "menu_items", "order_events")}
+
+
+@pytest.fixture
+def legacy_engine():
+    engine = sqlite_engine()
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO orders (order_status, order_date, total_amount) "
+                          "VALUES ('OUT_FOR_DELIVERY', '2024-01-01 12:00:00', 9.5)"))
+    yield engine
+    engine.dispose()
+
+
+def test_legacy_database_converges_with_models(legacy_engine):
+    Base.metadata.create_all(legacy_engine)
+    assert run_migrations(legacy_engine) == [migration.version for migration in MIGRATIONS]
+
+    fresh = sqlite_engine()
+    Base.metadata.create_all(fresh)
+    run_migrations(fresh)
+
+    assert index_names(legacy_engine) == index_names(fresh)
+    columns = {column["name"] for column in inspect(legacy_engine).get_columns("orders")}
+    assert "customer_key" in columns
+
+
+def test_status_names_are_rewritten_as_values(legacy_engine):
+    Base.metadata.create_all(legacy_engine)
+    run_migrations(legacy_engine)
+
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT order_status FROM orders")).scalar() == "Out for Delivery"
+    with Session(legacy_engine) as db:
+        assert db.query(Order).one().order_status is OrderStatus.OUT_FOR_DELIVERY
+
+
+def test_existing_orders_get_a_placement_event(legacy_engine):
+    Base.metadata.create_all(legacy_engine)
+    run_migrations(legacy_engine)
+
+    with Session(legacy_engine) as db:
+        event = db.query(OrderEvent).one()
+        assert (event.order_id, event.order_status) == (1, OrderStatus.PLACED)
+        assert event.ts == db.query(Order).one().order_date
+
+
+def test_migrations_apply_once(legacy_engine):
+    Base.metadata.create_all(legacy_engine)
+    run_migrations(legacy_engine)
+    assert run_migrations(legacy_engine) == []
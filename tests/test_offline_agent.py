@@ -0,0 +1,69 @@
+"""
+The offline Dialogflow stand-in builds the webhook requests the real agent sends
+"""
+import re
+
+from fast_json import turn_from_payload
+from init_db import build_sample_menu
+from offline_agent import (INTENT_ADD, INTENT_COMPLETE, INTENT_FALLBACK, INTENT_NEW, INTENT_REMOVE,
+                           INTENT_TRACK, OfflineAgent)
+
+
+MENU = [item.item_name for item in build_sample_menu()]
+
+
+def test_intents_parameters_and_contexts():
+    agent = OfflineAgent(MENU, project_id="demo-agent")
+    payload = agent.request("s1", "I want 2 cheese burgers and a Rice Bowl with Chicken")
+    turn = turn_from_payload(payload)
+    assert turn.intent == INTENT_NEW
+    assert turn.session == "projects/demo-agent/agent/sessions/s1"
+    assert turn.parameters == {
+        "food-item": ["cheese burgers", "Rice Bowl with Chicken"],
+        "food-item.original": ["cheese burgers", "Rice Bowl with Chicken"],
+        "number": [2],
+    }
+    context = payload["queryResult"]["outputContexts"][0]
+    assert context["name"] == "projects/demo-agent/agent/sessions/s1/contexts/ongoing-order"
+    assert context["lifespanCount"] == 5
+
+    assert agent.request("s1", "also some sushi")["queryResult"]["parameters"]["food-item"] == ["sushi"]
+    assert agent.request("s1", "remove the sushi")["queryResult"]["intent"]["displayName"] == INTENT_REMOVE
+    assert agent.request("s1", "two veggie pizzas")["queryResult"]["intent"]["displayName"] == INTENT_ADD
+    complete = agent.request("s1", "that's it")["queryResult"]
+    assert complete["intent"]["displayName"] == INTENT_COMPLETE
+    assert complete["outputContexts"][0]["lifespanCount"] == 1
+
+    track = agent.request("s1", "where is order 42")["queryResult"]
+    assert (track["intent"]["displayName"], track["parameters"], track["outputContexts"]) == (INTENT_TRACK, {"number": 42}, [])
+
+
+def test_context_intents_need_the_context():
+    agent = OfflineAgent(MENU)
+    assert agent.request("fresh", "that's it")["queryResult"]["intent"]["displayName"] == INTENT_FALLBACK
+    assert agent.request("fresh", "add fries")["queryResult"]["intent"]["displayName"] == INTENT_FALLBACK
+    assert agent.request("fresh", "I want fries")["queryResult"]["intent"]["displayName"] == INTENT_NEW
+
+
+def test_same_seed_same_payloads():
+    def conversation(seed):
+        agent = OfflineAgent(MENU, seed=seed)
+        return [agent.request("s", text, user_id="u1") for text in ("I want a pepsi", "that's all")]
+
+    assert conversation(7) == conversation(7)
+    assert conversation(7)[0]["responseId"] != conversation(8)[0]["responseId"]
+    assert conversation(7)[0]["originalDetectIntentRequest"]["payload"] == {"userId": "u1"}
+
+
+def test_conversation_against_the_webhook(client):
+    agent = OfflineAgent(MENU, seed=1)
+
+    def say(text):
+        return client.post("/", json=agent.request("e2e", text)).json()["fulfillmentText"]
+
+    assert say("I'd like a cheese burger and two sprite") == (
+        "Added to your order: Cheese Burger: 1, Sprite: 2. Would you like to add more items or complete your order?")
+    assert "Bacon Fries: 3" in say("add three bacon fries")
+    assert "Sprite" not in say("remove the sprite").split("Current order:")[1]
+    order_id = re.search(r"Order ID: (\d+)", say("place my order")).group(1)
+    assert say(f"track order {order_id}").startswith(f"Order ID: {order_id}")
@@ -0,0 +1,73 @@
+"""
+Every order status transition is appended to order_events
+"""
+import os
+import tempfile
+
+import database
+import order_queue
+import order_service
+from config import settings
+from models import Order, OrderEvent, OrderStatus
+
+
+SESSION = "events-test"
+
+
+def place_order(db):
+    order_service.inprogress_orders[SESSION] = {"Cheese Burger": {"quantity": 2, "price": 8.99}}
+    order_service.complete_order(SESSION, db)
+    return db.query(Order.order_id).scalar()
+
+
+def statuses(db, order_id):
+    return [event.order_status for event in
+            db.query(OrderEvent).filter(OrderEvent.order_id == order_id).order_by(OrderEvent.event_id)]
+
+
+def test_transitions_are_appended_and_tracked(db):
+    order_id = place_order(db)
+    order_service.set_order_status(order_id, OrderStatus.PREPARING, db)
+    order_service.set_order_status(order_id, OrderStatus.OUT_FOR_DELIVERY, db)
+
+    assert statuses(db, order_id) == [OrderStatus.PLACED, OrderStatus.PREPARING, OrderStatus.OUT_FOR_DELIVERY]
+    assert db.query(Order.order_status).scalar() is OrderStatus.OUT_FOR_DELIVERY
+
+    response = order_service.track_order(order_id, db)
+    timeline = response.split("Timeline: ")[1]
+    assert [part.split(" 20")[0] for part in timeline.split(", ")] == ["Placed", "Preparing", "Out for Delivery"]
+
+
+def test_write_behind_batch_records_placement_events(db):
+    log_path = os.path.join(tempfile.mkdtemp(), "orders.log")
+    allocator = order_queue.HiLoIdAllocator(database.SessionLocal, block_size=10)
+    queue = order_queue.WriteBehindOrderQueue(database.SessionLocal, log_path, allocator, flush_interval=60)
+    queue.start()
+    try:
+        order_ids = [queue.place({"Coca Cola": {"quantity": 1, "price": 1.99}}, 1.99) for _ in range(3)]
+    finally:
+        queue.stop()
+
+    db.expire_all()
+    for order_id in order_ids:
+        assert statuses(db, order_id) == [OrderStatus.PLACED]
+
+
+def test_status_endpoint_requires_the_staff_token(client, db, monkeypatch):
+    place_order(db)
+    order_id = db.query(Order.order_id).scalar()
+    url, body = f"/orders/{order_id}/status", {"order_status": "Preparing"}
+
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "")
+    assert client.put(url, json=body, headers={"Authorization": "Bearer anything"}).status_code == 403
+
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "s3cret")
+    assert client.put(url, json=body).status_code == 401
+    assert client.put(url, json=body, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    db.expire_all()
+    assert statuses(db, order_id) == [OrderStatus.PLACED]
+
+    response = client.put(url, json=body, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    db.expire_all()
+    assert statuses(db, order_id) == [OrderStatus.PLACED, OrderStatus.PREPARING]
@@ -0,0 +1,175 @@
+"""
+Write-behind queue: dead-lettering, crash replay, compaction and per-worker logs
+"""
+import json
+import os
+import tempfile
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import database
+import order_queue
+import order_service
+from metrics import orders_dead_lettered
+from models import Order
+from order_queue import HiLoIdAllocator, WriteBehindOrderQueue, worker_log_path
+
+COLA = {"Coca Cola": {"quantity": 1, "price": 1.99}}
+
+
+@pytest.fixture
+def log_path():
+    return os.path.join(tempfile.mkdtemp(), "order_log.jsonl")
+
+
+def new_queue(log_path, pid=1, **kwargs):
+    allocator = HiLoIdAllocator(database.SessionLocal, block_size=10)
+    return WriteBehindOrderQueue(database.SessionLocal, log_path, allocator, flush_interval=60, pid=pid, **kwargs)
+
+
+def record(order_id, quantity=1):
+    return {"order_id": order_id, "order_date": "2024-01-01T12:00:00", "total_amount": 1.99,
+            "customer_key": "session:s", "items": [{"item_name": "Coca Cola", "quantity": quantity, "price": 1.99}]}
+
+
+def written_ids(db):
+    db.expire_all()
+    return sorted(order_id for (order_id,) in db.query(Order.order_id))
+
+
+def test_bad_order_is_dead_lettered_and_the_rest_written(db, log_path):
+    queue = new_queue(log_path)
+    queue.start()
+    try:
+        first = queue.place(COLA, 1.99)
+        bad = queue.place({"Coca Cola": {"quantity": None, "price": 1.99}}, 1.99)
+        last = queue.place(COLA, 1.99)
+        before = orders_dead_lettered._unlabelled.value
+        assert queue.flush() == 3
+    finally:
+        queue.stop()
+
+    assert written_ids(db) == [first, last]
+    assert orders_dead_lettered._unlabelled.value == before + 1
+    with open(queue.dead_letter_path, encoding="utf-8") as f:
+        [entry] = [json.loads(line) for line in f]
+    assert entry["record"]["order_id"] == bad
+    assert entry["error"].startswith("IntegrityError")
+    assert queue.pending_count() == 0
+
+
+def test_database_outage_keeps_orders_queued(db, log_path, monkeypatch):
+    queue = new_queue(log_path)
+    queue.start()
+    order_id = queue.place(COLA, 1.99)
+
+    def unreachable(batch):
+        raise OperationalError("INSERT", {}, Exception("server has gone away"))
+
+    monkeypatch.setattr(queue, "_write_batch", unreachable)
+    with pytest.raises(OperationalError):
+        queue.flush()
+    assert queue.get_pending(order_id) is not None
+    assert not os.path.exists(queue.dead_letter_path)
+
+    monkeypatch.undo()
+    queue.stop()
+    assert written_ids(db) == [order_id]
+
+
+def test_replay_after_crash_skips_torn_last_line(db, log_path):
+    with open(worker_log_path(log_path, 1), "w", encoding="utf-8") as f:
+        f.write(json.dumps(record(101)) + "\n" + json.dumps(record(102)) + "\n" + '{"order_id": 103, "ord')
+
+    queue = new_queue(log_path)
+    queue.start()
+    try:
+        assert [queue.get_pending(order_id) is not None for order_id in (101, 102, 103)] == [True, True, False]
+        queue.flush()
+    finally:
+        queue.stop()
+    assert written_ids(db) == [101, 102]
+    # Flushed: nothing left to replay
+    assert os.path.getsize(queue.log_path) == 0
+
+
+def test_compaction_keeps_only_pending_orders(db, log_path):
+    queue = new_queue(log_path, compact_bytes=1)
+    queue.start()
+    try:
+        written = queue.place(COLA, 1.99)
+        waiting = queue.place(COLA, 1.99)
+        with queue._lock:
+            queue._pending.pop(written)
+        queue._compact()
+        with open(queue.log_path, encoding="utf-8") as f:
+            assert [json.loads(line)["order_id"] for line in f] == [waiting]
+
+        # Still appended to after the rewrite; emptied once everything is written
+        third = queue.place(COLA, 1.99)
+        with open(queue.log_path, encoding="utf-8") as f:
+            assert [json.loads(line)["order_id"] for line in f] == [waiting, third]
+        queue.flush()
+        assert os.path.getsize(queue.log_path) == 0
+    finally:
+        queue.stop()
+    assert written_ids(db) == [waiting, third]
+
+
+@pytest.mark.skipif(order_queue.fcntl is None, reason="needs file locks")
+def test_each_worker_has_its_own_log_and_adopts_stopped_workers(db, log_path, monkeypatch):
+    # A worker that is still running, and one that crashed
+    running = new_queue(log_path, pid=2)
+    running.start()
+    placed = running.place(COLA, 1.99, customer_key="session:other-worker")
+    with open(worker_log_path(log_path, 7), "w", encoding="utf-8") as f:
+        f.write(json.dumps(record(201)) + "\n")
+
+    queue = new_queue(log_path, pid=3)
+    with pytest.raises(RuntimeError):
+        new_queue(log_path, pid=2).start()
+    queue.start()
+    try:
+        assert queue.get_pending(201) is not None
+        assert not os.path.exists(worker_log_path(log_path, 7))
+        assert queue.get_pending(placed) is None     # Still the running worker's
+
+        # Tracking in this worker finds the order the other worker has not written yet
+        monkeypatch.setattr(order_queue, "active_queue", queue)
+        assert "Status: Placed" in order_service.track_order(placed, db)
+    finally:
+        queue.stop()
+        running.stop()
+    assert written_ids(db) == sorted([201, placed])
+
+
+def test_other_workers_logs_are_indexed_as_they_grow(db, log_path):
+    running = new_queue(log_path, pid=2)
+    running.start()
+    queue = new_queue(log_path, pid=3)
+    queue.start()
+    try:
+        first = running.place(COLA, 1.99)
+        assert queue.find_logged(first)["order_id"] == first
+        [index] = queue._others.values()
+        offset = index.offset
+
+        # Unknown IDs are answered from the index without reading the log again
+        assert queue.find_logged(999_999) is None
+        assert index.offset == offset
+
+        # Only the appended order is read
+        second = running.place(COLA, 1.99, customer_key="session:later")
+        assert queue.find_logged(second)["customer_key"] == "session:later"
+        assert index.offset > offset
+
+        # Written and emptied, then appended to past the old offset: the index starts over
+        running.flush()
+        later = [running.place(COLA, 1.99) for _ in range(3)]
+        assert os.path.getsize(running.log_path) > index.offset
+        assert all(queue.find_logged(order_id) is not None for order_id in later)
+        assert queue.find_logged(first) is None
+    finally:
+        queue.stop()
+        running.stop()
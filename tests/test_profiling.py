@@ -0,0 +1,115 @@
+"""
+Request profiling: profile rotation, collapsed stacks, profile downloads and when requests are captured
+"""
+import cProfile
+import os
+import pstats
+import re
+import tempfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from profiling import ProfileStore, ProfilingMiddleware, collapsed_stacks
+
+
+def inner():
+    return sum(i * i for i in range(20000))
+
+
+def outer():
+    return inner() + inner()
+
+
+INNER = f"test_profiling.py:inner:{inner.__code__.co_firstlineno}"
+OUTER = f"test_profiling.py:outer:{outer.__code__.co_firstlineno}"
+
+
+def profile_of(func) -> cProfile.Profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    func()
+    profiler.disable()
+    return profiler
+
+
+@pytest.fixture
+def store():
+    return ProfileStore(os.path.join(tempfile.mkdtemp(), "profiles"), max_files=10)
+
+
+def test_store_keeps_the_newest_profiles(store):
+    store.max_files = 2
+    names = [store.save(profile_of(outer), "POST", "/webhook", elapsed_ms) for elapsed_ms in (700, 800.5, 900)]
+    assert names[0].endswith("_POST_webhook_700ms")
+
+    profiles = store.list_profiles()
+    assert [profile["name"] for profile in profiles] == names[:0:-1]
+    assert [profile["latency_ms"] for profile in profiles] == [900, 800]
+    assert sorted(os.listdir(store.directory)) == sorted(f"{name}{ext}" for name in names[1:]
+                                                         for ext in (".pstats", ".folded"))
+    # The dump is a regular pstats file
+    assert pstats.Stats(os.path.join(store.directory, names[2] + ".pstats")).total_calls > 0
+
+
+def test_collapsed_stacks_follow_call_paths():
+    lines = collapsed_stacks(pstats.Stats(profile_of(outer)))
+    assert all(re.fullmatch(r"\S.* \d+", line) for line in lines)
+    stacks = [line.rsplit(" ", 1)[0] for line in lines]
+    # inner's work is attributed below outer, never the other way round
+    assert any(f"{OUTER};{INNER};" in stack for stack in stacks)
+    assert not any(f"{INNER};" in stack and OUTER in stack.split(f"{INNER};", 1)[1] for stack in stacks)
+
+
+def test_profile_downloads_stay_inside_the_store(store, client, monkeypatch):
+    name = store.save(profile_of(outer), "GET", "/menu", 1)
+    secret = os.path.join(os.path.dirname(store.directory), "secret.pstats")
+    with open(secret, "w") as f:
+        f.write("not a profile")
+
+    assert store.file_path(name + ".folded") == os.path.join(store.directory, name + ".folded")
+    for filename in ("../secret.pstats", secret, name + ".txt", "missing.pstats", ".."):
+        assert store.file_path(filename) is None
+
+    monkeypatch.setattr(main, "profile_store", store)
+    assert client.get(f"/debug/profiles/{name}.folded").status_code == 200
+    assert client.get("/debug/profiles/..%2Fsecret.pstats").status_code == 404
+    assert client.get("/debug/profiles/%2E%2E%2Fsecret.pstats").status_code == 404
+    assert client.get("/debug/profiles/secret.pstats").status_code == 404
+
+
+def profiled_app(store, **kwargs):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        return {"total": outer()}
+
+    return TestClient(ProfilingMiddleware(app, store, **kwargs))
+
+
+def test_header_forces_a_profile(store):
+    client = profiled_app(store, header="X-Profile", threshold_ms=60_000)
+    client.get("/work")
+    client.get("/work", headers={"X-Profile": "0"})
+    assert store.list_profiles() == []
+
+    client.get("/work", headers={"X-Profile": "1"})
+    [profile] = store.list_profiles()
+    assert "_GET_work_" in profile["name"]
+    with open(os.path.join(store.directory, profile["name"] + ".folded"), encoding="utf-8") as f:
+        assert OUTER in f.read()
+
+
+def test_one_request_in_n_is_sampled_and_kept_if_slow(store):
+    client = profiled_app(store, sample_every=3, threshold_ms=0)
+    for _ in range(7):
+        client.get("/work")
+    assert len(store.list_profiles()) == 2
+
+    # Sampled but faster than the threshold: not kept
+    slow_only = profiled_app(store, sample_every=1, threshold_ms=60_000)
+    slow_only.get("/work")
+    assert len(store.list_profiles()) == 2
@@ -0,0 +1,49 @@
+"""
+Quantity extraction: the utterance corpus shared with benchmarks/bench_quantity_parser.py
+"""
+import json
+import os
+
+import pytest
+
+import order_service
+from quantity_parser import align_quantities, extract_quantities
+
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "benchmarks", "quantity_corpus.json")
+
+with open(CORPUS_PATH, encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[f"{case['text']} {case['items']}" for case in CORPUS])
+def test_corpus_utterance_is_aligned(case):
+    assert align_quantities(case["text"], case["items"]) == case["expected"]
+
+
+def test_extract_finds_words_phrases_and_digits_in_order():
+    text = "Half a dozen wings, 3 fries and a couple of cokes"
+    assert [value for value, _, _ in extract_quantities(text)] == [6, 3, 2]
+    value, start, end = extract_quantities(text)[0]
+    assert text[start:end] == "Half a dozen"
+
+
+def test_webhook_handlers_use_the_utterance_quantities(client):
+    def turn(intent, text, items, numbers):
+        return {"queryResult": {"intent": {"displayName": intent}, "queryText": text,
+                                "parameters": {"food-item": items, "number": numbers}},
+                "session": "projects/p/agent/sessions/quantities"}
+
+    # Dialogflow's number list is not in item order; the utterance is
+    client.post("/webhook", json=turn("new.order", "two cheese burger and three coca cola",
+                                      ["Cheese Burger", "Coca Cola"], [3, 2]))
+    client.post("/webhook", json=turn("order.add - context: ongoing-order", "add 0 veggie pizza",
+                                      ["Veggie Pizza"], [0]))
+    reply = client.post("/webhook", json=turn("order.remove - context: ongoing-order", "remove one coca cola",
+                                              ["Coca Cola"], [1])).json()["fulfillmentText"]
+    cart = order_service.inprogress_orders["projects/p/agent/sessions/quantities"]
+    assert cart["Cheese Burger"]["quantity"] == 2
+    assert cart["Coca Cola"]["quantity"] == 2
+    assert cart["Veggie Pizza"]["quantity"] == 1
+    assert "Coca Cola" in reply
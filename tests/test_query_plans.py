@@ -0,0 +1,147 @@
+"""
+EXPLAIN every query the hot request paths issue and fail on full table scans
+Queries are captured from the real code paths, so a changed query shape or
+a missing index shows up here. Runs on SQLite by default and on MySQL when
+TEST_DATABASE_URL points at one (see conftest.py).
+"""
+import contextlib
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, insert, text
+
+import database
+import db_utils
+import order_service
+from eta import EtaEstimator
+from init_db import build_sample_menu
+from kitchen import KitchenBoard
+from models import MenuItem, Order, OrderEvent, OrderItem, OrderStatus
+import recommender
+
+
+ORDER_COUNT = 2000
+CUSTOMER = "user:regular"
+
+# Fuzzy menu fallbacks (ILIKE '%name%') cannot use a B-tree index; they only
+# run when the exact lookup misses and the menu table is small
+ALLOWED_SCANS = [re.compile(r"lower\(menu_items\.item_name\) LIKE lower", re.IGNORECASE)]
+
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    database.drop_db()
+    database.init_db()
+    rng = random.Random(7)
+    menu = build_sample_menu()
+    start = datetime(2024, 1, 1)
+    with database.engine.begin() as conn:
+        conn.execute(insert(MenuItem), [
+            {"item_name": item.item_name, "price": item.price, "category": item.category,
+             "is_available": item.is_available} for item in menu
+        ])
+        conn.execute(insert(Order), [
+            {"order_id": order_id,
+             # Like production: most orders are finished, the newest are active
+             "order_status": (rng.choice([OrderStatus.PLACED, OrderStatus.PREPARING, OrderStatus.OUT_FOR_DELIVERY])
+                              if order_id > ORDER_COUNT - 40
+                              else rng.choice([OrderStatus.DELIVERED, OrderStatus.CANCELLED])),
+             "order_date": start + timedelta(minutes=order_id),
+             "total_amount": 10.0,
+             "customer_key": CUSTOMER if order_id % 100 == 0 else f"session:s{order_id}"}
+            for order_id in range(1, ORDER_COUNT + 1)
+        ])
+        conn.execute(insert(OrderItem), [
+            {"order_id": order_id, "item_name": rng.choice(menu).item_name, "quantity": 1, "price": 5.0}
+            for order_id in range(1, ORDER_COUNT + 1) for _ in range(2)
+        ])
+        conn.execute(insert(OrderEvent), [
+            {"order_id": order_id, "order_status": OrderStatus.PLACED, "ts": start + timedelta(minutes=order_id)}
+            for order_id in range(1, ORDER_COUNT + 1)
+        ])
+        if conn.dialect.name == "mysql":
+            conn.execute(text("ANALYZE TABLE orders, order_items, menu_items, order_events"))
+        else:
+            conn.execute(text("ANALYZE"))
+    yield
+    database.drop_db()
+
+
+@contextlib.contextmanager
+def captured_selects():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+
+
+def full_scans(statement, parameters):
+    """Tables the database would read in full for this statement"""
+    with database.engine.connect() as conn:
+        if conn.dialect.name == "mysql":
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).mappings().all()
+            return [row["table"] for row in rows if row["type"] == "ALL"]
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        return [match.group(1) for match in (_SQLITE_FULL_SCAN.match(row[3]) for row in rows) if match]
+
+
+def run_in_session(action):
+    db = database.SessionLocal()
+    try:
+        action(db)
+    finally:
+        db.close()
+
+
+HOT_PATHS = {
+    "menu exact match": lambda db: (order_service.find_menu_item_name(db, "Cheese Burger"),
+                                    order_service.get_menu_item_price(db, "Cheese Burger")),
+    "menu word match": lambda db: db.execute(order_service._AVAILABLE_MENU_NAMES).all(),
+    "menu fuzzy match": lambda db: order_service.find_menu_item_name(db, "chicken pizza"),
+    "track order": lambda db: order_service.track_order(ORDER_COUNT // 2, db),
+    "reorder": lambda db: order_service.reorder_last_order("plan-test", CUSTOMER, db),
+    "kitchen board": lambda db: KitchenBoard().load(db),
+    "order status update": lambda db: order_service.set_order_status(7, OrderStatus.PREPARING, db),
+    "recent orders": lambda db: db_utils.list_recent_orders(10),
+    "orders per status": lambda db: [db.query(Order).filter(Order.order_status == status).count()
+                                     for status in OrderStatus],
+    "eta replay": lambda db: EtaEstimator().replay(db, datetime(2024, 1, 1, 20)),
+    "eta reconcile": lambda db: EtaEstimator().reconcile(db),
+    # The rebuild also reads the whole (small) menu, as the menu catalog does
+    "recommender rebuild": lambda db: db.execute(recommender._ITEMS_SINCE, {"since": datetime(2024, 1, 1, 20)}).all(),
+    "write-behind existing ids": lambda db: db.query(Order.order_id).filter(Order.order_id.in_([3, 5, 8])).all(),
+}
+
+
+@pytest.mark.parametrize("path", sorted(HOT_PATHS))
+def test_hot_path_has_no_full_scans(seeded, path):
+    with captured_selects() as statements:
+        run_in_session(HOT_PATHS[path])
+    assert statements, f"{path} issued no SELECT"
+
+    problems = []
+    for statement, parameters in statements:
+        if any(pattern.search(statement) for pattern in ALLOWED_SCANS):
+            continue
+        scanned = full_scans(statement, parameters)
+        if scanned:
+            problems.append(f"full scan of {', '.join(scanned)}:\n{statement[:500]}")
+    assert not problems, "\n\n".join(problems)
+
+
+def test_detects_a_full_scan(seeded):
+    # Guard against a plan parser that never reports anything
+    with captured_selects() as statements:
+        run_in_session(lambda db: db.query(func.sum(Order.total_amount)).scalar())
+    assert full_scans(*statements[0]) == ["orders"]
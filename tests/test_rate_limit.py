@@ -0,0 +1,95 @@
+"""
+Token buckets: lazy refill, separate read/write budgets, cleanup, and the batch endpoint
+"""
+import json
+
+import pytest
+
+import main
+from rate_limit import RateLimiter, TokenBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def limiter(clock, session_read=(1.0, 2), session_write=(0.5, 1), client_read=(0, 1), client_write=(0, 1)):
+    return RateLimiter(TokenBuckets(*session_read), TokenBuckets(*session_write),
+                       TokenBuckets(*client_read), TokenBuckets(*client_write), clock=clock)
+
+
+def test_buckets_refill_lazily_up_to_the_burst():
+    clock = Clock()
+    limits = limiter(clock)
+    assert limits.check("s1", None) is None
+    assert limits.check("s1", None) is None
+    # Burst of 2 spent; one token per second comes back
+    assert limits.check("s1", None) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert limits.check("s1", None) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limits.check("s1", None) is None
+    # A long pause refills to the burst, not beyond
+    clock.now += 60
+    assert [limits.check("s1", None) is None for _ in range(3)] == [True, True, False]
+    assert limits.stats()["throttled"] == 3
+
+
+def test_read_and_write_budgets_are_separate():
+    clock = Clock()
+    limits = limiter(clock)
+    assert limits.check("s1", None, write=True) is None
+    assert limits.check("s1", None, write=True) == pytest.approx(2.0)
+    # Writes exhausted, reads still allowed; other sessions unaffected
+    assert limits.check("s1", None) is None
+    assert limits.check("s2", None, write=True) is None
+
+
+def test_client_budget_applies_across_sessions():
+    clock = Clock()
+    limits = limiter(clock, client_read=(1.0, 3))
+    assert [limits.check(f"s{i}", "10.0.0.1") for i in range(3)] == [None, None, None]
+    assert limits.check("s9", "10.0.0.1") is not None
+    assert limits.check("s9", "10.0.0.2") is None
+
+
+def test_cleanup_drops_only_buckets_that_refilled():
+    clock = Clock()
+    limits = limiter(clock)
+    limits.check("idle", None)
+    clock.now += 1
+    limits.check("busy", None)
+    limits.check("busy", None)
+    # "idle" is full again after 2 s at 1 token/s; "busy" is not
+    clock.now += 1.5
+    assert limits.cleanup() == 1
+    assert limits.stats()["tracked_keys"]["session_read"] == 1
+    assert limits.check("busy", None) is None
+
+
+def test_max_keys_forgets_least_recently_used():
+    buckets = TokenBuckets(rate=1.0, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        buckets._refilled(key, 0.0)
+    assert list(buckets._buckets) == ["b", "c"]
+
+
+def turn(session, intent):
+    return {"queryResult": {"intent": {"displayName": intent}, "parameters": {}, "queryText": ""},
+            "session": f"projects/p/agent/sessions/{session}"}
+
+
+def test_batch_payloads_are_charged_to_the_rate_limit(client, monkeypatch):
+    monkeypatch.setattr(main, "rate_limiter", limiter(Clock(), session_read=(0.001, 2), session_write=(0.001, 1)))
+    complete = "order.complete - context: ongoing-order"
+    lines = client.post("/webhook/batch", json=[
+        turn("b1", "store.hours"), turn("b1", "store.hours"), turn("b1", "store.hours"),
+        turn("b1", complete), turn("b1", complete), turn("b2", "store.hours"),
+    ]).text.splitlines()
+    texts = [json.loads(line)["fulfillmentText"] for line in lines]
+    throttled = [text == main.THROTTLED_MESSAGE for text in texts]
+    assert throttled == [False, False, True, False, True, False]
@@ -0,0 +1,119 @@
+"""
+Add-on suggestions: incremental counts, rebuild from order_items, and the add_to_order reply
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+import order_service
+import recommender as recommender_module
+from models import Order, OrderItem
+from recommender import Recommender
+from tenants import Tenant, default_tenant, use_tenant
+
+
+START = datetime(2024, 1, 1, 12, 0)
+
+MENU = [
+    (1, "Cheese Burger", 8.99, "Burger", 1),
+    (2, "Regular Fries", 2.99, "Fries", 1),
+    (3, "Coca Cola", 1.99, "Drinks", 1),
+    (4, "Chocolate Ice Cream", 4.49, "Desserts", 1),
+]
+
+HISTORY = (
+    [["Cheese Burger", "Regular Fries"]] * 4
+    + [["Cheese Burger", "Coca Cola"]] * 3
+    + [["Cheese Burger", "Regular Fries", "Coca Cola"]] * 2
+    + [["Chocolate Ice Cream"]] * 5
+)
+
+
+def test_suggests_most_frequent_available_addon():
+    model = Recommender(min_count=3)
+    model.menu_changed(MENU)
+    for items in HISTORY:
+        model.order_placed(items)
+
+    assert model.suggest(["Cheese Burger"]) == [("Regular Fries", 2.99)]
+    assert model.suggest(["Cheese Burger"], k=3) == [("Regular Fries", 2.99), ("Coca Cola", 1.99)]
+    # Items already in the cart are not suggested
+    assert model.suggest(["Cheese Burger", "Regular Fries"]) == [("Coca Cola", 1.99)]
+    # Never ordered with anything else, or below min_count
+    assert model.suggest(["Chocolate Ice Cream"]) == []
+    assert model.suggest(["Coca Cola"]) == [("Cheese Burger", 8.99)]
+    assert model.suggest(["Not On The Menu"]) == []
+
+    # Sold out: the next best add-on is suggested instead
+    model.menu_changed([row[:4] + (0,) if row[1] == "Regular Fries" else row for row in MENU])
+    assert model.suggest(["Cheese Burger"]) == [("Coca Cola", 1.99)]
+
+    # New menu items grow the matrix
+    model.menu_changed(MENU + [(9, "Onion Rings", 3.49, "Sides", 1)])
+    for _ in range(3):
+        model.order_placed(["Chocolate Ice Cream", "Onion Rings"])
+    assert model.suggest(["Chocolate Ice Cream"]) == [("Onion Rings", 3.49)]
+    assert model.related("Cheese Burger", 2) == [
+        {"item_name": "Regular Fries", "orders_together": 6},
+        {"item_name": "Coca Cola", "orders_together": 5},
+    ]
+
+
+def seed_history(db, orders, start=START):
+    db.execute(insert(Order), [
+        {"order_id": order_id, "order_status": "Delivered", "order_date": start + timedelta(minutes=order_id),
+         "total_amount": 10.0} for order_id in range(1, len(orders) + 1)
+    ])
+    db.execute(insert(OrderItem), [
+        {"order_id": order_id, "item_name": name, "quantity": 1, "price": 1.0}
+        for order_id, items in enumerate(orders, start=1) for name in items
+    ])
+    db.commit()
+
+
+def test_rebuild_matches_incremental_updates(db):
+    seed_history(db, HISTORY)
+    rebuilt = Recommender(min_count=3)
+    assert rebuilt.load(db, START) == len(HISTORY)
+
+    incremental = Recommender(min_count=3)
+    incremental.menu_changed(db.execute(recommender_module._MENU).all())
+    for items in HISTORY:
+        incremental.order_placed(items)
+
+    for name in ("Cheese Burger", "Regular Fries", "Coca Cola", "Chocolate Ice Cream"):
+        assert rebuilt.related(name, 10) == incremental.related(name, 10)
+        assert rebuilt.suggest([name], k=3) == incremental.suggest([name], k=3)
+    # Orders before the cutoff are not counted
+    assert Recommender().load(db, START + timedelta(minutes=8)) == len(HISTORY) - 7
+
+
+def test_vectorized_rebuild_matches_pure_python(db, monkeypatch):
+    pytest.importorskip("numpy")
+    seed_history(db, HISTORY * 50)
+    monkeypatch.setattr(recommender_module, "_BLOCK_ORDERS", 64)
+    vectorized = Recommender()
+    vectorized.load(db, START)
+    monkeypatch.setattr(recommender_module, "np", None)
+    sequential = Recommender()
+    sequential.load(db, START)
+
+    for name in ("Cheese Burger", "Regular Fries", "Coca Cola"):
+        assert vectorized.related(name, 10) == sequential.related(name, 10)
+
+
+def test_add_to_order_suggests_an_addon(db):
+    seed_history(db, HISTORY)
+    tenant = Tenant("recommend-test", default_tenant.engine, default_tenant.session_factory,
+                    order_service.inprogress_orders, default_tenant.menu, default_tenant.kitchen,
+                    default_tenant.eta, Recommender(min_count=3))
+    tenant.recommender.load(db, START)
+    with use_tenant(tenant):
+        reply = order_service.add_to_order("recommend", ["Cheese Burger"], [1], db)
+        assert reply == ("Added to your order: Cheese Burger: 1. Customers often add Regular Fries ($2.99) "
+                         "with that. Would you like to add more items or complete your order?")
+
+        order_service.add_to_order("recommend", ["Regular Fries"], [1], db)
+        assert "placed successfully" in order_service.complete_order("recommend", db)
+    assert tenant.recommender.related("Cheese Burger", 1) == [{"item_name": "Regular Fries", "orders_together": 7}]
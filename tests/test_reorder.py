@@ -0,0 +1,95 @@
+"""
+Reorder: rebuilding the cart from the customer's latest order, through both webhook endpoints
+"""
+import os
+import tempfile
+
+import pytest
+
+import database
+import order_queue
+import order_service
+from models import MenuItem
+from order_queue import HiLoIdAllocator, WriteBehindOrderQueue
+
+CUSTOMER = "user:regular"
+
+
+def place(db, session_id, items, customer_key=CUSTOMER):
+    order_service.add_to_order(session_id, list(items), list(items.values()), db)
+    return order_service.complete_order(session_id, db, customer_key)
+
+
+def set_menu(db, name, **values):
+    db.query(MenuItem).filter(MenuItem.item_name == name).update(values)
+    db.commit()
+
+
+def cart(session_id):
+    return {name: (line["quantity"], line["price"])
+            for name, line in order_service.inprogress_orders[session_id].items()}
+
+
+def test_latest_order_is_added_at_current_prices(db):
+    place(db, "visit-1", {"Veggie Pizza": 1})
+    place(db, "visit-2", {"Cheese Burger": 2, "Coca Cola": 1})
+    set_menu(db, "Cheese Burger", price=9.49)
+
+    reply = order_service.reorder_last_order("visit-3", CUSTOMER, db)
+    assert reply == ("I've added your last order to your cart: Cheese Burger: 2, Coca Cola: 1. "
+                     "Would you like to add more items or complete your order?")
+    assert cart("visit-3") == {"Cheese Burger": (2, 9.49), "Coca Cola": (1, 1.99)}
+
+
+def test_unavailable_items_are_skipped(db):
+    place(db, "visit-1", {"Cheese Burger": 1, "Coca Cola": 2})
+    set_menu(db, "Coca Cola", is_available=0)
+    reply = order_service.reorder_last_order("visit-2", CUSTOMER, db)
+    assert reply.endswith("Not available right now: Coca Cola. Would you like to add more items or complete your order?")
+    assert cart("visit-2") == {"Cheese Burger": (1, 8.99)}
+
+    set_menu(db, "Cheese Burger", is_available=0)
+    reply = order_service.reorder_last_order("visit-3", CUSTOMER, db)
+    assert reply.startswith("Sorry, none of the items from your last order are available right now")
+    assert "visit-3" not in order_service.inprogress_orders
+
+
+def test_items_are_merged_into_the_open_cart(db):
+    place(db, "visit-1", {"Cheese Burger": 2})
+    order_service.add_to_order("visit-2", ["Cheese Burger", "Veggie Pizza"], [1, 1], db)
+    order_service.reorder_last_order("visit-2", CUSTOMER, db)
+    assert cart("visit-2") == {"Cheese Burger": (3, 8.99), "Veggie Pizza": (1, 9.99)}
+
+
+def test_no_previous_order(db):
+    assert order_service.reorder_last_order("new", "user:stranger", db) == (
+        "I couldn't find a previous order to repeat. What would you like to order?")
+
+
+def test_order_waiting_in_the_write_behind_log_is_found(db, monkeypatch):
+    allocator = HiLoIdAllocator(database.SessionLocal, block_size=10)
+    queue = WriteBehindOrderQueue(database.SessionLocal, os.path.join(tempfile.mkdtemp(), "order_log.jsonl"),
+                                  allocator, flush_interval=60, pid=1)
+    queue.start()
+    monkeypatch.setattr(order_queue, "active_queue", queue)
+    try:
+        place(db, "visit-1", {"Cheese Burger": 1})
+        place(db, "visit-2", {"Veggie Pizza": 2})
+        assert queue.pending_count() == 2
+        order_service.reorder_last_order("visit-3", CUSTOMER, db)
+        assert cart("visit-3") == {"Veggie Pizza": (2, 9.99)}
+    finally:
+        queue.stop()
+
+
+@pytest.mark.parametrize("endpoint", ["/", "/webhook"])
+def test_reorder_intent_on_both_endpoints(client, db, endpoint):
+    place(db, "visit-1", {"Cheese Burger": 2})
+
+    def turn(session, intent):
+        return {"queryResult": {"intent": {"displayName": intent}, "parameters": {}, "queryText": "same again"},
+                "session": f"projects/p/agent/sessions/{session}",
+                "originalDetectIntentRequest": {"payload": {"userId": "regular"}}}
+
+    reply = client.post(endpoint, json=turn("visit-2", "order.reorder")).json()["fulfillmentText"]
+    assert reply.startswith("I've added your last order to your cart: Cheese Burger: 2.")
@@ -0,0 +1,120 @@
+"""
+Read replicas: round-robin, skipping unhealthy replicas, and read-your-writes routing to the primary
+"""
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+import database
+import order_service
+from database import RecentWrites, ReplicaPool, make_engine
+from init_db import build_sample_menu
+from models import MenuItem
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(database, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def replica_engines():
+    """Two SQLite "replicas" with the schema and sample menu, but none of the primary's orders"""
+    directory = tempfile.mkdtemp()
+    engines = [make_engine("sqlite:///" + os.path.join(directory, f"replica{i}.db")) for i in range(2)]
+    for index, replica in enumerate(engines):
+        database.init_db(replica)
+        with database.Session(bind=replica) as db:
+            db.add_all(build_sample_menu())
+            db.add(MenuItem(item_name=f"Replica {index}", price=1.0, category="Marker", is_available=1))
+            db.commit()
+    yield engines
+    for replica in engines:
+        replica.dispose()
+
+
+def replica_name(db):
+    """Which replica a session's plain SELECTs read from (None for the primary)"""
+    return db.execute(select(MenuItem.item_name).where(MenuItem.category == "Marker")).scalar()
+
+
+def test_picks_replicas_round_robin(replica_engines):
+    pool = ReplicaPool(replica_engines)
+    assert [pool.pick() for _ in range(4)] == replica_engines * 2
+    assert ReplicaPool([]).pick() is None
+
+
+def test_unhealthy_replica_is_skipped_until_the_retry_interval(replica_engines, clock):
+    pool = ReplicaPool(replica_engines, retry_interval=30)
+    pool.mark_unhealthy(0)
+    assert [pool.pick() for _ in range(3)] == [replica_engines[1]] * 3
+
+    pool.mark_unhealthy(1)
+    assert pool.pick() is None
+    clock.now += 31
+    assert {pool.pick() for _ in range(2)} == set(replica_engines)
+
+
+def test_failed_connection_marks_the_replica_unhealthy(replica_engines, clock):
+    broken = make_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "missing", "replica.db"))
+    pool = ReplicaPool([broken, replica_engines[0]], retry_interval=30)
+    with pytest.raises(OperationalError):
+        with broken.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    assert [pool.pick() for _ in range(2)] == [replica_engines[0]] * 2
+
+
+def test_sessions_read_from_one_replica_until_they_write(db, replica_engines, monkeypatch):
+    monkeypatch.setattr(database, "replicas", ReplicaPool(replica_engines))
+    first, second = database.SessionLocal(), database.SessionLocal()
+    try:
+        assert replica_name(first) == replica_name(first) == "Replica 0"
+        assert replica_name(second) == "Replica 1"
+
+        # A flush pins the session to the primary for the rest of the unit of work
+        first.add(MenuItem(item_name="Primary Only Soup", price=3.0, category="Soup", is_available=1))
+        first.flush()
+        assert first.execute(select(MenuItem.price).where(MenuItem.item_name == "Primary Only Soup")).scalar() == 3.0
+        first.commit()
+        first.close()
+        assert first.execute(select(MenuItem.price).where(MenuItem.item_name == "Primary Only Soup")).first() is None
+
+        database.use_primary(second)
+        assert second.execute(select(MenuItem.price).where(MenuItem.item_name == "Primary Only Soup")).scalar() == 3.0
+    finally:
+        first.close()
+        second.close()
+
+
+def test_tracking_reads_the_primary_within_the_read_your_writes_window(db, replica_engines, clock, monkeypatch):
+    monkeypatch.setattr(database, "replicas", ReplicaPool(replica_engines))
+    monkeypatch.setattr(order_service, "recent_writes", RecentWrites(window=5.0))
+
+    with database.SessionLocal() as session:
+        order_service.add_to_order("ryw", ["Cheese Burger"], [1], session)
+        placed = order_service.complete_order("ryw", session)
+    order_id = int(placed.split("Order ID: ")[1].split(".")[0])
+
+    # The replicas have not caught up, but the order was just written
+    clock.now += 4
+    with database.SessionLocal() as session:
+        assert "Status: Placed" in order_service.track_order(order_id, session)
+
+    # Outside the window tracking reads a replica again
+    clock.now += 2
+    with database.SessionLocal() as session:
+        assert order_service.track_order(order_id, session) == f"Sorry, I couldn't find any order with ID: {order_id}"
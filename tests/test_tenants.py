@@ -0,0 +1,82 @@
+"""
+Tenants get their own database, menu and carts, chosen by the Dialogflow project ID
+"""
+import os
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+from models import MenuItem, Order
+from tenants import DEFAULT_TENANT, TenantRegistry, schema_url, tenant_registry
+
+
+def turn(project, session, intent, **parameters):
+    return {
+        "queryResult": {"intent": {"displayName": intent}, "parameters": parameters, "queryText": ""},
+        "session": f"projects/{project}/agent/sessions/{session}",
+    }
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "airport.db")
+    monkeypatch.setitem(tenant_registry.database_urls, "airport", url)
+    monkeypatch.setitem(tenant_registry.agents, "airport-agent-7f3a", "airport")
+    with TestClient(main.app) as test_client:
+        airport = tenant_registry.get("airport")
+        with airport.session() as db:
+            db.add(MenuItem(item_name="Airport Wrap", price=7.5, category="Wraps", is_available=1))
+            db.commit()
+        airport.menu.invalidate()
+        yield test_client
+    tenant_registry._tenants.pop("airport").engine.dispose()
+
+
+def test_resolve_by_project_id():
+    registry = TenantRegistry(tenant_registry.default, {"downtown": "sqlite://"}, {"df-downtown-1": "downtown"})
+    assert registry.resolve("projects/df-downtown-1/agent/sessions/abc").name == "downtown"
+    assert registry.resolve("projects/downtown/locations/eu/agent/sessions/abc").name == "downtown"
+    assert registry.resolve("projects/unknown/agent/sessions/abc").name == DEFAULT_TENANT
+    assert registry.resolve("plain-session-id").name == DEFAULT_TENANT
+
+
+def test_schema_url_points_at_another_database():
+    assert schema_url("mysql+pymysql://u:p@db:3306/food", "food_airport") == "mysql+pymysql://u:p@db:3306/food_airport"
+    assert schema_url("sqlite:///data/primary.db", "airport") == "sqlite:///data/airport.db"
+
+
+def test_each_tenant_has_its_own_menu_carts_and_orders(client):
+    reply = client.post("/", json=turn("airport-agent-7f3a", "s1", "new.order", **{"food-item": ["Airport Wrap"]}))
+    assert "Airport Wrap" in reply.json()["fulfillmentText"]
+    reply = client.post("/", json=turn("main-agent", "s1", "new.order", **{"food-item": ["Airport Wrap"]}))
+    assert "not available" in reply.json()["fulfillmentText"] or "couldn't find" in reply.json()["fulfillmentText"]
+
+    airport = tenant_registry.get("airport")
+    assert list(airport.carts["s1"]) == ["Airport Wrap"]
+    default_carts = tenant_registry.default.carts
+    assert "Airport Wrap" not in (default_carts["s1"] if "s1" in default_carts else {})
+
+    reply = client.post("/", json=turn("airport-agent-7f3a", "s1", "order.complete - context: ongoing-order"))
+    assert "placed successfully" in reply.json()["fulfillmentText"]
+    with airport.session() as db:
+        assert db.query(Order).count() == 1
+    with database.SessionLocal() as db:
+        assert db.query(Order).count() == 0
+
+    assert client.get("/orders/1", params={"tenant": "airport"}).json()["details"].startswith("Order ID: 1")
+    assert "couldn't find" in client.get("/orders/1").json()["details"]
+    assert [item["item_name"] for item in client.get("/menu", params={"tenant": "airport"}).json()["items"]] == ["Airport Wrap"]
+    assert client.get("/menu", params={"tenant": "nowhere"}).status_code == 404
+
+
+def test_batch_routes_each_turn_to_its_tenant(client):
+    lines = client.post("/webhook/batch", json=[
+        turn("airport-agent-7f3a", "b1", "new.order", **{"food-item": ["Airport Wrap"]}),
+        turn("main-agent", "b1", "new.order", **{"food-item": ["Coca Cola"]}),
+    ]).text.splitlines()
+    assert "Airport Wrap" in lines[0] and "Coca Cola" in lines[1]
+    assert list(tenant_registry.get("airport").carts["b1"]) == ["Airport Wrap"]
+    assert list(tenant_registry.default.carts["b1"]) == ["Coca Cola"]
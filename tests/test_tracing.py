@@ -0,0 +1,115 @@
+"""
+Tracing: span nesting across the threadpool, the trace ring buffer, OTLP/JSON export and /debug/traces
+"""
+import asyncio
+import json
+import os
+import re
+import tempfile
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+import database
+from config import settings
+from tracing import Tracer
+
+
+def test_spans_nest_across_threadpool_calls():
+    tracer = Tracer()
+
+    def lookup():
+        # Runs in a worker thread with the request's context copied in
+        with tracer.span("order.lookup", order_id=7):
+            with database.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            with tracer.span("order.timeline"):
+                pass
+
+    async def handle():
+        with tracer.trace("POST /webhook", intent="track.order"):
+            with tracer.span("webhook.parse"):
+                pass
+            await run_in_threadpool(lookup)
+
+    asyncio.run(handle())
+    [trace] = tracer.slowest()
+    assert [(span["name"], span["depth"]) for span in trace["spans"]] == [
+        ("POST /webhook", 0), ("webhook.parse", 1), ("order.lookup", 1), ("db.query", 2), ("order.timeline", 2),
+    ]
+    assert trace["attributes"] == {"intent": "track.order"}
+    assert trace["spans"][3]["attributes"]["statement"] == "SELECT 1"
+
+    # Outside a trace spans are no-ops
+    with tracer.span("orphan") as orphan:
+        assert orphan is None
+    assert len(tracer) == 1
+
+
+def test_ring_buffer_keeps_the_newest_traces():
+    tracer = Tracer(buffer_size=3)
+    for i in range(5):
+        with tracer.trace(f"request-{i}"):
+            pass
+    assert len(tracer) == 3
+    assert sorted(trace["name"] for trace in tracer.slowest()) == ["request-2", "request-3", "request-4"]
+
+    # Shrinking the buffer keeps the newest
+    tracer.configure(enabled=True, buffer_size=2)
+    assert sorted(trace["name"] for trace in tracer.slowest()) == ["request-3", "request-4"]
+    assert [trace["name"] for trace in tracer.slowest(name="request-4")] == ["request-4"]
+
+
+def test_traces_are_exported_as_otlp_json_lines():
+    path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+    tracer = Tracer()
+    tracer.configure(enabled=True, buffer_size=10, export_path=path)
+    try:
+        with tracer.trace("POST /", tenant="default", items=2, ok=True):
+            with tracer.span("menu.match", score=0.5):
+                pass
+        try:
+            with tracer.trace("POST /webhook"):
+                raise ValueError("bad body")
+        except ValueError:
+            pass
+    finally:
+        tracer.exporter.close()
+
+    with open(path, encoding="utf-8") as f:
+        first, second = [json.loads(line) for line in f]
+    [resource_spans] = first["resourceSpans"]
+    assert resource_spans["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": "food-ordering-chatbot"}}]
+    root, child = resource_spans["scopeSpans"][0]["spans"]
+
+    assert re.fullmatch(r"[0-9a-f]{32}", root["traceId"]) and child["traceId"] == root["traceId"]
+    assert re.fullmatch(r"[0-9a-f]{16}", root["spanId"])
+    assert "parentSpanId" not in root and child["parentSpanId"] == root["spanId"]
+    assert (root["kind"], child["kind"]) == (2, 1)
+    assert int(root["startTimeUnixNano"]) <= int(child["startTimeUnixNano"]) <= int(root["endTimeUnixNano"])
+    assert root["attributes"] == [
+        {"key": "tenant", "value": {"stringValue": "default"}},
+        {"key": "items", "value": {"intValue": "2"}},
+        {"key": "ok", "value": {"boolValue": True}},
+    ]
+    assert child["attributes"] == [{"key": "score", "value": {"doubleValue": 0.5}}]
+    assert root["status"] == {"code": 1}
+
+    [failed] = second["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert failed["status"] == {"code": 2, "message": "ValueError: bad body"}
+
+
+def test_debug_traces_requires_the_staff_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "")
+    assert client.get("/debug/traces", headers={"Authorization": "Bearer anything"}).status_code == 403
+
+    monkeypatch.setattr(settings, "STAFF_API_TOKEN", "s3cret")
+    assert client.get("/debug/traces").status_code == 401
+    assert client.get("/debug/traces", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+    client.post("/", json={"queryResult": {"intent": {"displayName": "store.hours"}, "parameters": {},
+                                           "queryText": "hours"}, "session": "projects/p/agent/sessions/t1"})
+    response = client.get("/debug/traces", params={"name": "POST /"}, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response.json()["traces"][0]["name"] == "POST /"
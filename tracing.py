@@ -0,0 +1,265 @@
+"""
+Lightweight in-process request tracing
+A trace is a tree of timed spans for one webhook turn (parse, dispatch,
+menu matching, each DB statement, render). The current span lives in a
+context variable, so spans opened anywhere below a traced handler attach
+to it and spans opened outside a trace cost one lookup. Finished traces
+go to a fixed-size ring buffer for /debug/traces and, optionally, to a
+file as OTLP/JSON lines that an OpenTelemetry collector can ingest later.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class Span:
+    """One timed phase of a trace"""
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """Spans of one request; spans[0] is the root"""
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Span breakdown with offsets from the start of the trace"""
+        depth = {None: -1}
+        spans = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+            spans.append({
+                "name": span.name,
+                "depth": depth[span.span_id],
+                "offset_ms": round((span.start_ns - self.root.start_ns) / 1_000_000, 3),
+                "duration_ms": round(span.duration_ms, 3),
+                "attributes": span.attributes,
+                "error": span.error,
+            })
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": datetime.utcfromtimestamp(self.root.start_ns / 1e9).isoformat() + "Z",
+            "duration_ms": round(self.root.duration_ms, 3),
+            "attributes": self.root.attributes,
+            "spans": spans,
+        }
+
+
+class OtlpJsonFileExporter:
+    """Appends each finished trace to a file as one OTLP/JSON ExportTraceServiceRequest per line"""
+
+    def __init__(self, path: str, service_name: str = "food-ordering-chatbot"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, trace: Trace):
+        line = json.dumps(self.to_otlp(trace), separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self._file.flush()
+
+    def to_otlp(self, trace: Trace) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "tracing"},
+                "spans": [_otlp_span(trace, span) for span in trace.spans],
+            }],
+        }]}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(trace: Trace, span: Span) -> Dict[str, Any]:
+    otlp = {
+        "traceId": trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 2 if span.parent_id is None else 1,  # SERVER for the root, INTERNAL below it
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns if span.end_ns is not None else span.start_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id is not None:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Creates traces and spans and keeps the most recent traces"""
+
+    def __init__(self, buffer_size: int = 500, enabled: bool = True):
+        self.enabled = enabled
+        self._traces: "deque[Trace]" = deque(maxlen=max(1, buffer_size))
+        self.exporter: Optional[OtlpJsonFileExporter] = None
+
+    def configure(self, enabled: bool, buffer_size: int, export_path: str = ""):
+        self.enabled = enabled
+        self._traces = deque(self._traces, maxlen=max(1, buffer_size))
+        if self.exporter is not None:
+            self.exporter.close()
+        self.exporter = OtlpJsonFileExporter(export_path) if enabled and export_path else None
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Start a new trace (the root span) for one request"""
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace()
+        root = Span(trace, name, None, attributes)
+        trace.spans.append(root)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self._finish(trace)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """Time a phase inside the current trace (a no-op outside one)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        child = Span(parent.trace, name, parent.span_id, attributes)
+        parent.trace.spans.append(child)
+        token = _current_span.set(child)
+        try:
+            yield child
+        except BaseException as e:
+            child.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            child.end_ns = time.time_ns()
+            _current_span.reset(token)
+
+    def start_span(self, name: str, **attributes) -> Optional[Span]:
+        """Open a span without making it current (for callbacks such as DB events)"""
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        child = Span(parent.trace, name, parent.span_id, attributes)
+        parent.trace.spans.append(child)
+        return child
+
+    @staticmethod
+    def end_span(span: Optional[Span], error: Optional[str] = None):
+        if span is not None:
+            span.end_ns = time.time_ns()
+            span.error = error
+
+    def _finish(self, trace: Trace):
+        self._traces.append(trace)
+        if self.exporter is not None:
+            try:
+                self.exporter.export(trace)
+            except Exception as e:
+                print(f"Error exporting trace: {str(e)}")
+
+    def slowest(self, limit: int = 20, min_ms: float = 0.0, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Slowest buffered traces first"""
+        traces = [trace for trace in list(self._traces)
+                  if trace.root.duration_ms >= min_ms and (name is None or trace.root.name == name)]
+        traces.sort(key=lambda trace: trace.root.duration_ms, reverse=True)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._traces)
+
+
+# Process-wide tracer
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Shortcut for tracer.span()"""
+    return tracer.span(name, **attributes)
+
+
+# Every SQL statement becomes a db.query span of the current trace
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_span = tracer.start_span("db.query", statement=statement[:200], database=conn.engine.url.get_backend_name())
+    if db_span is not None:
+        conn.info.setdefault("trace_spans", []).append(db_span)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        db_span = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            db_span.set(rows=cursor.rowcount)
+        tracer.end_span(db_span)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    conn = context.connection
+    spans = conn.info.get("trace_spans") if conn is not None else None
+    if spans:
+        tracer.end_span(spans.pop(), error=f"{type(context.original_exception).__name__}: {context.original_exception}")